@@ -0,0 +1,13 @@
+from django.urls import path
+from . import async_views
+
+
+# Routes served by native async views under ASGI; everything else falls
+# through to app/urls.py (see gpcare/async_urls.py).
+urlpatterns = [
+    path('doctors/', async_views.DoctorListView.as_view(), name='doctor-list'),
+    path('appointment/', async_views.AppointmentView.as_view(), name='appointment-list'),
+    path('doctor/<int:pk>/appointment/', async_views.DoctorAppointments.as_view(), name='doctor-appointments'),
+    path('my-prescriptions/', async_views.PatientPrescription.as_view(), name='my-prescriptions'),
+    path('export/<str:table>.<str:fmt>', async_views.ExportView.as_view(), name='export'),
+]
@@ -0,0 +1,121 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from . import views
+from .authentication import ClaimsJWTAuthentication
+from .cache import RESPONSE_PREFIX, CachedResponseMixin, anamespace_versions, not_modified, set_validators, validators
+
+# Native async versions of the hot list endpoints, served under ASGI (see
+# app/middleware.py). Each one borrows its DRF view's queryset, serializer
+# and pagination so the output is identical, but reads through the async
+# ORM instead of a sync_to_async hop per request. Writes and other methods
+# are handed to the sync view.
+
+
+class AsyncListView(View):
+    view_class = None
+    authenticator = ClaimsJWTAuthentication()
+    renderer = JSONRenderer()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.sync_view = staticmethod(sync_to_async(cls.view_class.as_view()))
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET':
+            return await self.sync_view(request, *args, **kwargs)
+        try:
+            return await self.get(request, *args, **kwargs)
+        except APIException as exc:
+            return self.render(exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}, exc.status_code)
+
+    def render(self, data, status=200):
+        response = HttpResponse(self.renderer.render(data), content_type='application/json', status=status)
+        if status == 401:
+            response['WWW-Authenticate'] = self.authenticator.authenticate_header(request=None)
+        return response
+
+    async def authenticate(self, request):
+        user_auth = await self.authenticator.aauthenticate(request)
+        user = user_auth[0] if user_auth else AnonymousUser()
+        if IsAuthenticated in self.view_class.permission_classes and not user.is_authenticated:
+            raise NotAuthenticated()
+        return user
+
+    async def initial(self, request, args, kwargs):
+        drf_request = Request(request)
+        drf_request.user = await self.authenticate(request)
+        view = self.view_class(request=drf_request, args=args, kwargs=kwargs, format_kwarg=None)
+        # The permission classes only look at token claims, so no queries.
+        view.check_permissions(drf_request)
+        return view
+
+    async def get(self, request, *args, **kwargs):
+        view = await self.initial(request, args, kwargs)
+        if isinstance(view, CachedResponseMixin):
+            return await self.get_cached(request, view)
+        return self.render(await self.list(view))
+
+    async def list(self, view):
+        queryset = view.filter_queryset(view.get_queryset())
+        paginator = view.paginator
+        rows = [row async for row in paginator.page_queryset(queryset, view.request, view=view)]
+        if isinstance(view, views.OccurrenceListMixin):
+            series = [series async for series in view.get_series_queryset()]
+            rows = view.merge_occurrences(rows, series)
+        page = paginator.paginate_rows(rows)
+        data = view.get_serializer(page, many=True).data
+        return paginator.get_paginated_data(data)
+
+    async def get_cached(self, request, view):
+        # CachedResponseMixin.get() with the async cache API; entries are
+        # shared with the sync view.
+        versions = await anamespace_versions(view.get_cache_namespaces())
+        etag, last_modified = validators(request, self.renderer.format, versions)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        data = await cache.aget(RESPONSE_PREFIX + etag)
+        if data is None:
+            data = await self.list(view)
+            await cache.aset(RESPONSE_PREFIX + etag, data, view.cache_timeout)
+        return set_validators(self.render(data), etag, last_modified)
+
+
+class DoctorListView(AsyncListView):
+    view_class = views.DoctorListView
+
+
+class AppointmentView(AsyncListView):
+    view_class = views.AppointmentView
+
+
+class DoctorAppointments(AsyncListView):
+    view_class = views.DoctorAppointments
+
+
+class PatientPrescription(AsyncListView):
+    view_class = views.PatientPrescription
+
+
+class ExportView(AsyncListView):
+    # Streams through the async ORM; a sync iterator would be buffered in
+    # full by StreamingHttpResponse under ASGI.
+    view_class = views.ExportView
+
+    async def get(self, request, *args, **kwargs):
+        view = await self.initial(request, args, kwargs)
+        export = view.get_export()
+        return view.streaming_response(export, aiter(export))
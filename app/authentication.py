@@ -0,0 +1,109 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Doctor
+
+UserModel = get_user_model()
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    # Puts what the permission classes need into the token, so requests can
+    # be authenticated without loading the user.
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.username
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        token['doctor_id'] = Doctor.objects.filter(user=user).values_list('pk', flat=True).first()
+        return token
+
+
+class ClaimsUser(TokenUser):
+
+    @property
+    def id(self):
+        # simplejwt stores the claim as a string; views compare it to FK ids.
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @property
+    def doctor_id(self):
+        # Set for doctor accounts; None for patients and staff.
+        return self.token.get('doctor_id')
+
+
+class ActiveUserCache:
+    # Short-lived, per-process record of which users are still active, so
+    # deactivated accounts lose access within `ttl` seconds while most
+    # requests skip the query.
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def is_active(self, user_id):
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        active = UserModel.objects.filter(pk=user_id, is_active=True).exists()
+        with self._lock:
+            self._entries[user_id] = (active, now + self.ttl)
+        return active
+
+    async def ais_active(self, user_id):
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        active = await UserModel.objects.filter(pk=user_id, is_active=True).aexists()
+        with self._lock:
+            self._entries[user_id] = (active, now + self.ttl)
+        return active
+
+    def forget(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+active_users = ActiveUserCache()
+
+
+class ClaimsJWTAuthentication(JWTStatelessUserAuthentication):
+    # request.user is a ClaimsUser, not a User instance: views use
+    # request.user.id for foreign keys and load the User when they need it.
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        user = ClaimsUser(user.token)
+        if not active_users.is_active(user.id):
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return user
+
+    async def aauthenticate(self, request):
+        # Same as authenticate(), for async views: token checks are pure CPU
+        # and the is_active lookup uses the async ORM on a cache miss.
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        user = ClaimsUser(JWTStatelessUserAuthentication.get_user(self, validated_token).token)
+        if not await active_users.ais_active(user.id):
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return user, validated_token
@@ -0,0 +1,60 @@
+import datetime
+
+from .models import DoctorDay
+from .occupancy import busy_intervals, load, to_seconds
+
+
+def to_time(seconds):
+    return datetime.time(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def free_intervals(busy, day_start, day_end):
+    # Sweep over busy intervals sorted by start, emitting the gaps inside
+    # working hours. Overlapping or touching busy intervals merge naturally
+    # because `cursor` only moves forward.
+    free = []
+    cursor = day_start
+    for start, end in busy:
+        if start >= day_end:
+            break
+        if start > cursor:
+            free.append((cursor, start))
+        cursor = max(cursor, end)
+    if cursor < day_end:
+        free.append((cursor, day_end))
+    return free
+
+
+def slot_starts(free, length):
+    starts = []
+    for start, end in free:
+        while start + length <= end:
+            starts.append(start)
+            start += length
+    return starts
+
+
+def availability(doctor_ids, date_from, date_to, day_start, day_end, slot_minutes):
+    # One query over the doctors' occupancy bitmaps (see app/occupancy.py),
+    # which already include recurring series; days without a row are free.
+    # Busy time is read at the bitmap's five-minute resolution, so bookings
+    # off that grid are widened to it.
+    day_start, day_end = to_seconds(day_start), to_seconds(day_end)
+    length = slot_minutes * 60
+    rows = DoctorDay.objects.filter(
+        doctor_id__in=doctor_ids, date__range=(date_from, date_to)
+    ).values_list('doctor_id', 'date', 'occupancy')
+    busy_by_day = {(doctor_id, date): busy_intervals(load(bits)) for doctor_id, date, bits in rows.iterator()}
+
+    days = [date_from + datetime.timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+    results = []
+    for doctor_id in sorted(doctor_ids):
+        for date in days:
+            free = free_intervals(busy_by_day.get((doctor_id, date), ()), day_start, day_end)
+            results.append({
+                'doctor': doctor_id,
+                'date': date,
+                'free': [{'start': to_time(start), 'end': to_time(end)} for start, end in free],
+                'slots': [to_time(start) for start in slot_starts(free, length)],
+            })
+    return results
@@ -0,0 +1,12 @@
+def find_overlaps(intervals):
+    # Sort-and-sweep over (start, end, key) tuples for a single doctor-day.
+    # Anything that overlaps an earlier interval also overlaps the earlier
+    # interval that reaches furthest, so tracking that one is enough.
+    overlaps = []
+    reach_end = reach_key = None
+    for start, end, key in sorted(intervals, key=lambda interval: (interval[0], interval[1])):
+        if reach_end is not None and start < reach_end:
+            overlaps.append((reach_key, key))
+        if reach_end is None or end > reach_end:
+            reach_end, reach_key = end, key
+    return overlaps
@@ -0,0 +1,97 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+# Cached responses are keyed on the version of every namespace they depend
+# on. Invalidating a namespace (see app/signals.py) just gives it a new
+# version, so stale entries are never read again and age out on their own.
+# Versions are nanosecond timestamps, which doubles them as Last-Modified.
+
+VERSION_PREFIX = 'gpcare:version:'
+RESPONSE_PREFIX = 'gpcare:response:'
+
+
+def namespace_versions(namespaces):
+    keys = [VERSION_PREFIX + namespace for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+async def anamespace_versions(namespaces):
+    keys = [VERSION_PREFIX + namespace for namespace in namespaces]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in keys]
+
+
+def validators(request, renderer_format, versions):
+    # (ETag, Last-Modified) for a response built from these namespace versions.
+    fingerprint = f'{request.get_full_path()}|{renderer_format}|{versions}'
+    return '"%s"' % hashlib.md5(fingerprint.encode()).hexdigest(), max(versions, default=0) // 10 ** 9
+
+
+def not_modified(request, etag, last_modified):
+    # A 304 if the client's copy is current; only with a shared cache (see
+    # GPCARE_CACHE_VALIDATORS in settings).
+    if not settings.GPCARE_CACHE_VALIDATORS:
+        return None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        response['ETag'] = etag
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    if settings.GPCARE_CACHE_VALIDATORS:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def invalidate(*namespaces):
+    now = time.time_ns()
+    cache.set_many({VERSION_PREFIX + namespace: now for namespace in namespaces}, timeout=None)
+
+
+class CachedResponseMixin:
+    # For read-only views whose output does not depend on the user. Answers
+    # If-None-Match / If-Modified-Since with a 304 before serialising
+    # anything, and otherwise serves the cached response data.
+    cache_timeout = 300
+    # The namespaces the response depends on, formatted with the URL kwargs,
+    # e.g. 'doctor:{pk}'. With none, entries only expire.
+    cache_namespaces = ()
+
+    def get_cache_namespaces(self):
+        return [namespace.format(**self.kwargs) for namespace in self.cache_namespaces]
+
+    def get(self, request, *args, **kwargs):
+        versions = namespace_versions(self.get_cache_namespaces())
+        etag, last_modified = validators(request, request.accepted_renderer.format, versions)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        key = RESPONSE_PREFIX + etag
+        data = cache.get(key)
+        if data is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cache.set(key, response.data, self.cache_timeout)
+        else:
+            response = Response(data)
+        return set_validators(response, etag, last_modified)
@@ -0,0 +1,75 @@
+import csv
+import io
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Appointment, Prescription
+
+# Full-table exports for reporting. Rows are read in primary key order with
+# .iterator()/.aiterator(), formatted a chunk at a time and handed on, so
+# memory use does not grow with the table.
+EXPORTS = {
+    'appointments': (Appointment, ['id', 'created', 'date', 'start_time', 'end_time', 'patient', 'doctor']),
+    'prescriptions': (Prescription, ['id', 'date', 'medical_facility', 'rx', 'patient', 'doctor']),
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Export:
+
+    def __init__(self, name, fmt, chunk_size=2000):
+        # Raises KeyError for unknown tables and formats.
+        self.model, self.fields = EXPORTS[name]
+        self.content_type = CONTENT_TYPES[fmt]
+        self.filename = f'{name}.{fmt}'
+        self.fmt = fmt
+        self.format_rows = getattr(self, f'format_{fmt}')
+        self.chunk_size = chunk_size
+
+    def get_queryset(self):
+        # values() rather than values_list(): on Django 5.0 the latter runs
+        # its query eagerly, which aiterator() can't do from async code.
+        return self.model.objects.order_by('pk').values(*self.fields)
+
+    def header(self):
+        if self.fmt == 'csv':
+            return self.write_csv([self.fields])
+        return ''
+
+    def write_csv(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue()
+
+    def format_csv(self, rows):
+        return self.write_csv(row.values() for row in rows)
+
+    def format_ndjson(self, rows):
+        encoder = DjangoJSONEncoder()
+        return ''.join(encoder.encode(row) + '\n' for row in rows)
+
+    def __iter__(self):
+        yield self.header()
+        rows = []
+        for row in self.get_queryset().iterator(chunk_size=self.chunk_size):
+            rows.append(row)
+            if len(rows) == self.chunk_size:
+                yield self.format_rows(rows)
+                rows = []
+        if rows:
+            yield self.format_rows(rows)
+
+    async def __aiter__(self):
+        yield self.header()
+        rows = []
+        async for row in self.get_queryset().aiterator(chunk_size=self.chunk_size):
+            rows.append(row)
+            if len(rows) == self.chunk_size:
+                yield self.format_rows(rows)
+                rows = []
+        if rows:
+            yield self.format_rows(rows)
@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    # Same algorithm name as Django's hasher, so existing hashes keep
+    # verifying; when GPCARE_PASSWORD_ITERATIONS changes, must_update()
+    # flags old hashes and they are rehashed on the next successful login.
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'GPCARE_PASSWORD_ITERATIONS', None) or PBKDF2PasswordHasher.iterations
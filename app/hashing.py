@@ -0,0 +1,103 @@
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+UserModel = get_user_model()
+
+# Password hashing is deliberately slow, so it runs on a bounded pool: at
+# most GPCARE_HASHING_WORKERS hashes run at once, GPCARE_HASHING_QUEUE more
+# may wait, and anything beyond that gets a 503 after GPCARE_HASHING_WAIT
+# seconds instead of piling onto the CPU. GPCARE_HASHING_POOL picks threads
+# (hashlib releases the GIL) or processes.
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many password operations in progress, please retry shortly.'
+    default_code = 'hashing_busy'
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _get_pool():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            workers = settings.GPCARE_HASHING_WORKERS
+            if settings.GPCARE_HASHING_POOL == 'process':
+                _executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            else:
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+            _slots = threading.BoundedSemaphore(workers + settings.GPCARE_HASHING_QUEUE)
+        return _executor, _slots
+
+
+def _submit(fn, *args):
+    executor, slots = _get_pool()
+    if not slots.acquire(timeout=settings.GPCARE_HASHING_WAIT):
+        raise HashingBusy()
+    future = executor.submit(fn, *args)
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def make_password(raw_password):
+    return _submit(hashers.make_password, raw_password).result()
+
+
+def process_pool(workers):
+    # A dedicated pool for batch jobs (see import_doctors), separate from the
+    # bounded pool that serves requests.
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+
+def make_passwords(raw_passwords):
+    # For imports: the batch holds at most GPCARE_HASHING_WORKERS slots at a
+    # time, so logins queued behind it wait for a few hashes, not the batch.
+    window = settings.GPCARE_HASHING_WORKERS
+    pending, hashed = deque(), []
+    for raw in raw_passwords:
+        if len(pending) >= window:
+            hashed.append(pending.popleft().result())
+        pending.append(_submit(hashers.make_password, raw))
+    hashed.extend(future.result() for future in pending)
+    return hashed
+
+
+def check_password(user, raw_password):
+    # Like User.check_password(), including the transparent rehash when the
+    # preferred hasher or its cost has changed.
+    is_correct, must_update = _submit(hashers.verify_password, raw_password, user.password).result()
+    if is_correct and must_update:
+        user.password = make_password(raw_password)
+        user.save(update_fields=['password'])
+    return is_correct
+
+
+def set_password(user, raw_password):
+    user.password = make_password(raw_password)
+
+
+def create_user(username, password, email='', **extra_fields):
+    # UserModel.objects.create_user() with the hash computed on the pool.
+    user = UserModel(
+        username=UserModel.normalize_username(username),
+        email=UserModel.objects.normalize_email(email),
+        **extra_fields,
+    )
+    set_password(user, password)
+    user.save()
+    return user
@@ -0,0 +1,145 @@
+import csv
+import json
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from rest_framework import serializers
+
+from . import hashing
+from .cache import invalidate
+from .models import Doctor, DoctorRating, DoctorSearchTerm
+
+UserModel = get_user_model()
+
+# Bulk onboarding of patients and doctors from CSV, JSONL or a JSON list.
+# Rows are validated one at a time but written a batch at a time: one query
+# finds the usernames that already exist, the batch's passwords are hashed
+# together on a pool, and users and their doctor rows go in with
+# bulk_create. bulk_create skips the signals in app/signals.py, so the
+# search terms and rating rows they would add are created here.
+
+
+def read_rows(stream, fmt):
+    # Yields (row number, dict or None) without reading the whole file.
+    if fmt == 'csv':
+        yield from enumerate(csv.DictReader(stream), start=1)
+        return
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class PatientImportSerializer(serializers.Serializer):
+    username = serializers.CharField(max_length=150)
+    password = serializers.CharField()
+    email = serializers.EmailField(required=False, allow_blank=True, default='')
+    first_name = serializers.CharField(max_length=150, required=False, allow_blank=True, default='')
+    last_name = serializers.CharField(max_length=150, required=False, allow_blank=True, default='')
+
+    def validate_username(self, value):
+        UserModel.username_validator(value)
+        return UserModel.normalize_username(value)
+
+
+class DoctorImportSerializer(PatientImportSerializer):
+    specialization = serializers.CharField(max_length=100)
+    hospital = serializers.CharField(max_length=100)
+    phone_number = serializers.CharField(max_length=15)
+
+
+class PatientImporter:
+    serializer_class = PatientImportSerializer
+
+    def __init__(self, hash_passwords=hashing.make_passwords, batch_size=500):
+        self.hash_passwords = hash_passwords
+        self.batch_size = batch_size
+        self.created = 0
+        self.skipped = []
+        self.errors = []
+
+    def run(self, rows, on_batch=None):
+        # on_batch(last row number) runs after each committed batch.
+        for batch in batched(rows, self.batch_size):
+            self.import_batch(batch)
+            if on_batch is not None:
+                on_batch(batch[-1][0])
+        self.finish()
+        return self
+
+    def import_batch(self, batch):
+        valid = []
+        for number, row in batch:
+            if row is None:
+                self.errors.append({'row': number, 'errors': {'non_field_errors': ['Expected an object.']}})
+                continue
+            serializer = self.serializer_class(data=row)
+            if serializer.is_valid():
+                valid.append(serializer.validated_data)
+            else:
+                self.errors.append({'row': number, 'errors': serializer.errors})
+        if not valid:
+            return
+
+        taken = set(UserModel.objects.filter(
+            username__in=[data['username'] for data in valid],
+        ).values_list('username', flat=True))
+        fresh = []
+        for data in valid:
+            if data['username'] in taken:
+                self.skipped.append(data['username'])
+            else:
+                taken.add(data['username'])
+                fresh.append(data)
+        if not fresh:
+            return
+
+        passwords = self.hash_passwords([data['password'] for data in fresh])
+        users = [
+            UserModel(
+                username=data['username'], password=password,
+                email=UserModel.objects.normalize_email(data['email']),
+                first_name=data['first_name'], last_name=data['last_name'],
+            )
+            for data, password in zip(fresh, passwords)
+        ]
+        with transaction.atomic():
+            UserModel.objects.bulk_create(users)
+            self.create_related(users, fresh)
+        self.created += len(users)
+
+    def create_related(self, users, rows):
+        pass
+
+    def finish(self):
+        pass
+
+    def summary(self):
+        return {'created': self.created, 'skipped': self.skipped, 'errors': self.errors}
+
+
+class DoctorImporter(PatientImporter):
+    serializer_class = DoctorImportSerializer
+
+    def create_related(self, users, rows):
+        doctors = Doctor.objects.bulk_create(
+            Doctor(user=user, specialization=row['specialization'], hospital=row['hospital'], phone_number=row['phone_number'])
+            for user, row in zip(users, rows)
+        )
+        DoctorSearchTerm.objects.bulk_create(term for doctor in doctors for term in DoctorSearchTerm.for_doctor(doctor))
+        DoctorRating.objects.bulk_create(DoctorRating(doctor=doctor) for doctor in doctors)
+
+    def finish(self):
+        if self.created:
+            invalidate('doctors')
@@ -0,0 +1,93 @@
+import datetime
+import logging
+import traceback
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+# A job queue in the application database. Jobs are inserted in the same
+# transaction as the change that causes them, so workers never see a job
+# for a write that rolled back and never miss one for a write that
+# committed. Workers (`manage.py run_jobs`) claim due jobs with a lease:
+#   - a task that raises is retried after GPCARE_JOB_BACKOFF seconds,
+#     doubling each attempt, and marked failed after max_attempts;
+#   - a job whose worker died is claimed again once its lease runs out, so
+#     tasks must tolerate running twice.
+
+logger = logging.getLogger('gpcare.jobs')
+
+# Task functions by name; each takes its job's payload as keyword arguments.
+TASKS = {}
+
+
+def task(func=None, *, max_attempts=5):
+    def register(func):
+        TASKS[func.__name__] = (func, max_attempts)
+        return func
+    return register(func) if func is not None else register
+
+
+def make_job(name, key=None, run_at=None, **payload):
+    return Job(name=name, payload=payload, key=key, run_at=run_at or timezone.now(), max_attempts=TASKS[name][1])
+
+
+def enqueue(name, key=None, run_at=None, **payload):
+    enqueue_many([make_job(name, key, run_at, **payload)])
+
+
+def enqueue_many(jobs):
+    # Jobs whose key is already taken are dropped.
+    Job.objects.bulk_create(jobs, ignore_conflicts=True)
+
+
+def claim(worker, limit):
+    now = timezone.now()
+    due = Q(status=Job.PENDING, run_at__lte=now) | Q(status=Job.RUNNING, locked_until__lt=now)
+    ids = Job.objects.filter(due).order_by('run_at', 'id').values('pk')[:limit]
+    # `due` is checked again by the update itself, so two workers racing
+    # for the same rows cannot both take one.
+    Job.objects.filter(due, pk__in=ids).update(
+        status=Job.RUNNING, locked_by=worker, attempts=F('attempts') + 1,
+        locked_until=now + datetime.timedelta(seconds=settings.GPCARE_JOB_LEASE),
+    )
+    return list(Job.objects.filter(status=Job.RUNNING, locked_by=worker).order_by('run_at', 'id'))
+
+
+def run(job):
+    func, _ = TASKS.get(job.name, (None, None))
+    mine = Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by)
+    try:
+        if func is None:
+            raise LookupError(f'Unknown task {job.name!r}.')
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error('Job %s (%s) failed for good:\n%s', job.pk, job.name, error)
+            mine.update(status=Job.FAILED, finished=timezone.now(), locked_until=None, last_error=error)
+        else:
+            delay = settings.GPCARE_JOB_BACKOFF * 2 ** (job.attempts - 1)
+            logger.warning('Job %s (%s) failed, retrying in %ss:\n%s', job.pk, job.name, delay, error)
+            mine.update(
+                status=Job.PENDING, run_at=timezone.now() + datetime.timedelta(seconds=delay),
+                locked_until=None, last_error=error,
+            )
+        return False
+    mine.update(status=Job.DONE, finished=timezone.now(), locked_until=None)
+    return True
+
+
+def run_due(worker, limit=20):
+    # Runs one batch of due jobs; returns how many there were.
+    jobs = claim(worker, limit)
+    for job in jobs:
+        run(job)
+    return len(jobs)
+
+
+def prune(days):
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    return Job.objects.filter(status=Job.DONE, finished__lt=cutoff).delete()[0]
@@ -0,0 +1,126 @@
+import datetime
+import json
+import re
+from base64 import urlsafe_b64encode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models
+from django.urls import URLResolver, get_resolver
+from django.utils import timezone
+from rest_framework.generics import GenericAPIView
+from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from app.authentication import ClaimsUser
+
+# A "SCAN t USING INDEX i" walks an index in order and stops at the page
+# LIMIT; a bare "SCAN t" (SQLite) or "Seq Scan on t" (PostgreSQL) reads the
+# whole table.
+FULL_SCAN = re.compile(r'\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)(?:$|\s)|Seq Scan on (\w+)')
+
+# Query strings audited on top of the bare URL, by URL name.
+QUERY_STRINGS = {
+    'doctor-list': ['specialization=GP', 'hospital=General', 'search=smi'],
+    'appointment-list': ['from=2030-01-07&to=2030-01-13', 'upcoming=1'],
+}
+
+# Views scope their querysets by who is asking.
+PERSONAS = {
+    'patient': {'user_id': 1},
+    'doctor': {'user_id': 1, 'doctor_id': 1},
+    'staff': {'user_id': 1, 'is_staff': True, 'is_superuser': True},
+}
+
+
+def sample_value(field):
+    if isinstance(field, models.DateTimeField):
+        return timezone.now().isoformat()
+    if isinstance(field, models.DateField):
+        return datetime.date.today().isoformat()
+    if isinstance(field, models.TimeField):
+        return '09:00:00'
+    if isinstance(field, (models.CharField, models.TextField)):
+        return 'm'
+    return 1
+
+
+def sample_cursor(model, ordering):
+    values = [sample_value(model._meta.get_field(field.lstrip('-'))) for field in ordering]
+    return urlsafe_b64encode(json.dumps({'v': values, 'r': 0}).encode('ascii')).decode('ascii')
+
+
+def iter_patterns(patterns, prefix=''):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_patterns(pattern.url_patterns, prefix + str(pattern.pattern))
+        else:
+            yield prefix + str(pattern.pattern), pattern
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs EXPLAIN on the query every list and detail view sends (first '
+        'and next page for lists) and fails if any of them scans a whole table.'
+    )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        # The paginator builds absolute links, so use a host that validates.
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        self.factory = APIRequestFactory(HTTP_HOST=host)
+        if connection.vendor == 'postgresql':
+            # On small tables the planner prefers sequential scans even when
+            # an index fits; only report scans no index can replace.
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+        failures = []
+        for route, pattern in iter_patterns(get_resolver().url_patterns):
+            view_class = getattr(pattern.callback, 'cls', None)
+            if view_class is None or not issubclass(view_class, GenericAPIView):
+                continue
+            kwargs = {name: 1 for name in pattern.pattern.converters}
+            seen = set()
+            for persona, claims in PERSONAS.items():
+                self.user = ClaimsUser(claims)
+                for label, queryset in self.querysets(view_class, pattern.name, kwargs):
+                    sql = str(queryset.query)
+                    if sql not in seen:
+                        seen.add(sql)
+                        self.explain(failures, route, f'{label} as {persona}', queryset)
+
+        if failures:
+            raise CommandError('Queries without a usable index:\n' + '\n'.join(failures))
+
+    def explain(self, failures, route, label, queryset):
+        plan = queryset.explain()
+        scanned = [table or seq for table, seq in FULL_SCAN.findall(plan)]
+        if scanned:
+            failures.append(f'{route} {label}: full scan of {", ".join(scanned)}')
+            self.stdout.write(self.style.ERROR(f'SCAN {route} {label}'))
+        elif self.verbosity:
+            self.stdout.write(f'ok   {route} {label}')
+        if self.verbosity > 1:
+            self.stdout.write('     ' + plan.replace('\n', '\n     '))
+
+    def view(self, view_class, query_string, kwargs):
+        request = Request(self.factory.get('/?' + query_string))
+        request.user = self.user
+        return view_class(request=request, args=(), kwargs=kwargs, format_kwarg=None)
+
+    def querysets(self, view_class, name, kwargs):
+        if issubclass(view_class, ListModelMixin):
+            for query_string in ['', *QUERY_STRINGS.get(name, ())]:
+                view = self.view(view_class, query_string, kwargs)
+                queryset = view.filter_queryset(view.get_queryset())
+                paginator = view.paginator
+                yield f'?{query_string}', paginator.page_queryset(queryset, view.request, view)
+                cursor = sample_cursor(queryset.model, paginator.get_ordering(view))
+                view = self.view(view_class, '&'.join(filter(None, [query_string, f'cursor={cursor}'])), kwargs)
+                yield f'?{query_string} (next page)', paginator.page_queryset(queryset, view.request, view)
+        elif issubclass(view_class, RetrieveModelMixin):
+            view = self.view(view_class, '', kwargs)
+            lookup = view.lookup_url_kwarg or view.lookup_field
+            yield 'detail', view.get_queryset().filter(**{view.lookup_field: kwargs.get(lookup, 1)})
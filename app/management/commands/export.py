@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.export import CONTENT_TYPES, EXPORTS, Export
+
+
+class Command(BaseCommand):
+    help = 'Streams a full table export as CSV or NDJSON to stdout or a file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=sorted(EXPORTS))
+        parser.add_argument('--format', dest='fmt', choices=sorted(CONTENT_TYPES), default='csv')
+        parser.add_argument('--output', '-o', help='File to write instead of stdout.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, table, fmt, output, chunk_size, **options):
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be positive.')
+        export = Export(table, fmt, chunk_size)
+        if output is None:
+            for chunk in export:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(output, 'w', newline='', encoding='utf-8') as out:
+            for chunk in export:
+                out.write(chunk)
@@ -0,0 +1,78 @@
+import json
+import os
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+
+from app import hashing
+from app.imports import DoctorImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates doctor accounts from a CSV or JSONL file (username, password, email, first_name, '
+        'last_name, specialization, hospital, phone_number). Existing usernames are skipped. '
+        'Progress is checkpointed after every batch, so an interrupted run resumes where it stopped.'
+    )
+    importer_class = DoctorImporter
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='fmt', choices=['csv', 'jsonl'], help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Hashing processes; 0 uses the request hashing pool instead.',
+        )
+        parser.add_argument('--checkpoint', help='Defaults to PATH.checkpoint.')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint.')
+
+    def handle(self, *args, path, fmt, batch_size, workers, checkpoint, restart, **options):
+        fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in ('csv', 'jsonl'):
+            raise CommandError('Use --format csv or --format jsonl.')
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+        checkpoint = checkpoint or f'{path}.checkpoint'
+        done = 0 if restart else self.read_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(f'Resuming after row {done}.')
+
+        pool = hashing.process_pool(workers) if workers else None
+        try:
+            if pool is not None:
+                def hash_passwords(raw_passwords):
+                    chunksize = max(1, len(raw_passwords) // (workers * 4))
+                    return list(pool.map(make_password, raw_passwords, chunksize=chunksize))
+            else:
+                hash_passwords = hashing.make_passwords
+            importer = self.importer_class(hash_passwords=hash_passwords, batch_size=batch_size)
+            with open(path, newline='', encoding='utf-8') as stream:
+                rows = ((number, row) for number, row in read_rows(stream, fmt) if number > done)
+                importer.run(rows, on_batch=lambda number: self.write_checkpoint(checkpoint, number))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        for error in importer.errors:
+            self.stderr.write(f'row {error["row"]}: {json.dumps(error["errors"])}')
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {importer.created}, skipped {len(importer.skipped)} existing, {len(importer.errors)} invalid.'
+        ))
+
+    def read_checkpoint(self, checkpoint):
+        try:
+            with open(checkpoint) as f:
+                return json.load(f)['row']
+        except FileNotFoundError:
+            return 0
+        except (ValueError, KeyError, TypeError):
+            raise CommandError(f'Unreadable checkpoint {checkpoint}; pass --restart to start over.')
+
+    def write_checkpoint(self, checkpoint, row):
+        # Write-then-rename, so a crash never leaves a torn checkpoint.
+        with open(f'{checkpoint}.tmp', 'w') as f:
+            json.dump({'row': row}, f)
+        os.replace(f'{checkpoint}.tmp', checkpoint)
@@ -0,0 +1,11 @@
+from app.imports import PatientImporter
+
+from .import_doctors import Command as ImportDoctorsCommand
+
+
+class Command(ImportDoctorsCommand):
+    help = (
+        'Creates patient accounts from a CSV or JSONL file (username, password, email, first_name, '
+        'last_name). Existing usernames are skipped. Progress is checkpointed after every batch.'
+    )
+    importer_class = PatientImporter
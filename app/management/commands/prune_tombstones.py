@@ -0,0 +1,19 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes sync tombstones older than GPCARE_SYNC_RETENTION_DAYS. Clients with older sync tokens '
+        'are sent a full reset instead.'
+    )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=settings.GPCARE_SYNC_RETENTION_DAYS)
+        deleted, _ = Tombstone.objects.filter(deleted__lt=cutoff).delete()
+        self.stdout.write(f'Deleted {deleted} tombstones.')
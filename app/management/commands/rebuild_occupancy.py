@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.models import Appointment, AppointmentSeries, Doctor, DoctorDay
+from app.recurrence import series_dates
+
+# Days per DoctorDay.rebuild() call, well under SQLite's bound parameter limit.
+CHUNK = 500
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the doctor-day occupancy bitmaps from the appointment and recurring series tables, '
+        'e.g. after rows were written with bulk_create or raw SQL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', type=int, action='append', help='Only these doctors (repeatable).')
+
+    def handle(self, *args, doctor, **options):
+        doctor_ids = doctor or list(Doctor.objects.order_by('pk').values_list('pk', flat=True))
+        days = 0
+        for doctor_id in doctor_ids:
+            dates = set(DoctorDay.objects.filter(doctor_id=doctor_id).values_list('date', flat=True))
+            dates.update(Appointment.objects.filter(doctor_id=doctor_id).values_list('date', flat=True).distinct())
+            for series in AppointmentSeries.objects.filter(doctor_id=doctor_id).prefetch_related('exceptions'):
+                dates.update(series_dates(series))
+            dates = sorted(dates)
+            for start in range(0, len(dates), CHUNK):
+                with transaction.atomic():
+                    DoctorDay.rebuild(doctor_id, dates[start:start + CHUNK], create=True)
+            days += len(dates)
+        self.stdout.write(f'Rebuilt {days} doctor-days for {len(doctor_ids)} doctors.')
@@ -0,0 +1,59 @@
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from app import jobs
+from app.notifications import scan_reminders
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs queued background jobs (notifications) and the reminder scan. Start one per worker process; '
+        'SIGTERM or SIGINT finishes the current batch and exits.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Scan once, run jobs until none are due, then exit.')
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when no job is due.')
+        parser.add_argument(
+            '--scan-interval', type=float, default=60.0,
+            help='Seconds between reminder scans; 0 turns scanning off.',
+        )
+        parser.add_argument('--prune-days', type=int, default=7, help='Finished jobs older than this are deleted.')
+        parser.add_argument('--worker', help='Defaults to host:pid.')
+
+    def handle(self, *args, once, batch_size, sleep, scan_interval, prune_days, worker, **options):
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+        worker = worker or f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = False
+        if not once:
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        done = 0
+        next_scan = 0.0
+        while not self.stopping:
+            # Long-running: drop connections past CONN_MAX_AGE or broken.
+            close_old_connections()
+            if scan_interval and time.monotonic() >= next_scan:
+                queued = scan_reminders()
+                pruned = jobs.prune(prune_days)
+                if queued or pruned:
+                    self.stdout.write(f'Reminders checked for {queued} upcoming appointments, {pruned} finished jobs pruned.')
+                next_scan = time.monotonic() + scan_interval
+            ran = jobs.run_due(worker, batch_size)
+            done += ran
+            if not ran:
+                if once:
+                    break
+                time.sleep(sleep)
+        self.stdout.write(f'Ran {done} jobs.')
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,149 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Per-route request metrics, kept in process memory and exposed in the
+# Prometheus text format on /metrics/. Each worker process reports its own
+# numbers; the scraper adds them up.
+#
+# MetricsMiddleware puts a RequestMetrics in a context variable for the
+# length of each request. The database execute wrapper (installed on every
+# connection, see app/signals.py) and TimedSerializerMixin add to it from
+# whichever thread the work runs in, since sync_to_async carries the
+# context along.
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+HISTOGRAMS = {
+    'request_duration_seconds': ('Wall time per request.', DURATION_BUCKETS),
+    'db_queries': ('Database queries per request.', COUNT_BUCKETS),
+    'db_duration_seconds': ('Time spent in database queries per request.', DURATION_BUCKETS),
+    'serializer_duration_seconds': ('Time spent serialising objects per request.', DURATION_BUCKETS),
+    'response_size_bytes': ('Response body size (not recorded for streaming responses).', SIZE_BUCKETS),
+}
+
+_current = ContextVar('gpcare_request_metrics', default=None)
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+class Registry:
+
+    def __init__(self, prefix='gpcare_'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._requests = Counter()
+            self._histograms = {name: {} for name in HISTOGRAMS}
+
+    def record(self, route, method, status, observations):
+        labels = (route, method)
+        with self._lock:
+            self._requests[(route, method, status)] += 1
+            for name, value in observations.items():
+                histograms = self._histograms[name]
+                if labels not in histograms:
+                    histograms[labels] = Histogram(HISTOGRAMS[name][1])
+                histograms[labels].observe(value)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            name = f'{self.prefix}requests_total'
+            lines += [f'# HELP {name} Requests served.', f'# TYPE {name} counter']
+            for (route, method, status), count in sorted(self._requests.items()):
+                lines.append(f'{name}{{route="{route}",method="{method}",status="{status}"}} {count}')
+            for metric, (help_text, _) in HISTOGRAMS.items():
+                name = self.prefix + metric
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for (route, method), histogram in sorted(self._histograms[metric].items()):
+                    labels = f'route="{route}",method="{method}"'
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum:g}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def start_request():
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.db_queries += 1
+
+
+@contextmanager
+def serializer_timer():
+    metrics = _current.get()
+    if metrics is None or metrics.serializer_depth:
+        # Nested serializers are already inside the outer one's timing.
+        yield
+        return
+    metrics.serializer_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += time.perf_counter() - start
+        metrics.serializer_depth -= 1
+
+
+class TimedSerializerMixin:
+    # Counts to_representation() towards the request's serializer time.
+
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
@@ -0,0 +1,121 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metrics, querywatch
+
+
+class AsyncRoutingMiddleware:
+    # Under ASGI the middleware chain runs async, so route the request to the
+    # URLconf with native async views; under WSGI nothing changes.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if settings.GPCARE_ASYNC_URLCONF:
+            request.urlconf = settings.GPCARE_ASYNC_URLCONF
+        return await self.get_response(request)
+
+
+class MetricsMiddleware:
+    # Records wall time, database queries and time, serializer time and
+    # response size per route name (see app/metrics.py) and reports them in
+    # a Server-Timing header. Goes first in MIDDLEWARE to time everything.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        request_metrics, token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self.record(request, response, request_metrics)
+
+    async def __acall__(self, request):
+        request_metrics, token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self.record(request, response, request_metrics)
+
+    def record(self, request, response, request_metrics):
+        elapsed = time.perf_counter() - request_metrics.start
+        match = request.resolver_match
+        route = (match.view_name or match.route) if match else 'unmatched'
+        observations = {
+            'request_duration_seconds': elapsed,
+            'db_queries': request_metrics.db_queries,
+            'db_duration_seconds': request_metrics.db_time,
+            'serializer_duration_seconds': request_metrics.serializer_time,
+        }
+        if not response.streaming:
+            observations['response_size_bytes'] = len(response.content)
+        metrics.registry.record(route, request.method, response.status_code, observations)
+        if settings.GPCARE_SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'app;dur={elapsed * 1000:.1f}, '
+                f'db;dur={request_metrics.db_time * 1000:.1f};desc="{request_metrics.db_queries} queries", '
+                f'ser;dur={request_metrics.serializer_time * 1000:.1f}'
+            )
+        return response
+
+
+class QueryWatchMiddleware:
+    # Reports repeated query shapes and slow queries per request (see
+    # app/querywatch.py). Only installed when GPCARE_QUERYWATCH is 'log' or
+    # 'raise'; the latter turns a report into a server error.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.GPCARE_QUERYWATCH not in ('log', 'raise'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with querywatch.watch() as query_watch:
+            response = self.get_response(request)
+        self.report(request, query_watch)
+        return response
+
+    async def __acall__(self, request):
+        with querywatch.watch() as query_watch:
+            response = await self.get_response(request)
+        self.report(request, query_watch)
+        return response
+
+    def report(self, request, query_watch):
+        if not query_watch.problems():
+            return
+        message = f'{request.method} {request.path}\n{query_watch.report()}'
+        if settings.GPCARE_QUERYWATCH == 'raise':
+            raise querywatch.NPlusOneDetected(message)
+        querywatch.logger.warning(message)
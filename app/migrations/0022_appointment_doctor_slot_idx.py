@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0021_alter_appointment_end_time_prescription'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'date', 'start_time', 'end_time'], name='appointment_doctor_slot_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0022_appointment_doctor_slot_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.doctor')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='doctorday',
+            constraint=models.UniqueConstraint(fields=('doctor', 'date'), name='doctor_day_unique'),
+        ),
+    ]
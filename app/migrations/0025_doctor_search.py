@@ -0,0 +1,54 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:15
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def index_existing_doctors(apps, schema_editor):
+    Doctor = apps.get_model('app', 'Doctor')
+    DoctorSearchTerm = apps.get_model('app', 'DoctorSearchTerm')
+    terms = []
+    for doctor in Doctor.objects.select_related('user').iterator():
+        user = doctor.user
+        words = re.findall(r'\w+', f'{user.username} {user.first_name} {user.last_name}'.casefold())
+        terms.extend(DoctorSearchTerm(doctor=doctor, term=word[:150]) for word in set(words))
+    DoctorSearchTerm.objects.bulk_create(terms, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0024_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=150)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['specialization', 'created', 'id'], name='doctor_specialization_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['hospital', 'created', 'id'], name='doctor_hospital_idx'),
+        ),
+        migrations.AddField(
+            model_name='doctorsearchterm',
+            name='doctor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='app.doctor'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorsearchterm',
+            index=models.Index(fields=['term', 'doctor'], name='doctor_search_term_idx'),
+        ),
+        migrations.RunPython(index_existing_doctors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:18
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_doctor_ratings(apps, schema_editor):
+    # Existing reviews have no rating, so every doctor starts at zero.
+    Doctor = apps.get_model('app', 'Doctor')
+    DoctorRating = apps.get_model('app', 'DoctorRating')
+    DoctorRating.objects.bulk_create(
+        (DoctorRating(doctor_id=pk) for pk in Doctor.objects.values_list('pk', flat=True)),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0025_doctor_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorRating',
+            fields=[
+                ('doctor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating', serialize=False, to='app.doctor')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('stars_1', models.PositiveIntegerField(default=0)),
+                ('stars_2', models.PositiveIntegerField(default=0)),
+                ('stars_3', models.PositiveIntegerField(default=0)),
+                ('stars_4', models.PositiveIntegerField(default=0)),
+                ('stars_5', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='rating',
+            field=models.PositiveSmallIntegerField(null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)]),
+        ),
+        migrations.RunPython(create_doctor_ratings, migrations.RunPython.noop),
+    ]
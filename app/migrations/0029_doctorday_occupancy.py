@@ -0,0 +1,51 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:21
+
+import datetime
+from collections import defaultdict
+
+from django.db import migrations, models
+
+from app.occupancy import dump, mask
+
+
+def fill_occupancy(apps, schema_editor):
+    # Same result as the rebuild_occupancy command, with historical models.
+    Appointment = apps.get_model('app', 'Appointment')
+    AppointmentSeries = apps.get_model('app', 'AppointmentSeries')
+    DoctorDay = apps.get_model('app', 'DoctorDay')
+    bits = defaultdict(int)
+    rows = Appointment.objects.values_list('doctor_id', 'date', 'start_time', 'end_time')
+    for doctor_id, date, start_time, end_time in rows.iterator():
+        bits[doctor_id, date] |= mask(start_time, end_time)
+    for series in AppointmentSeries.objects.prefetch_related('exceptions'):
+        skipped = {exception.date for exception in series.exceptions.all()}
+        date = series.start_date
+        while date <= series.until:
+            if date not in skipped:
+                bits[series.doctor_id, date] |= mask(series.start_time, series.end_time)
+            date += datetime.timedelta(weeks=series.interval)
+
+    days = list(DoctorDay.objects.all())
+    for day in days:
+        day.occupancy = dump(bits.pop((day.doctor_id, day.date), 0))
+    DoctorDay.objects.bulk_update(days, ['occupancy'], batch_size=1000)
+    DoctorDay.objects.bulk_create(
+        (DoctorDay(doctor_id=doctor_id, date=date, occupancy=dump(value)) for (doctor_id, date), value in bits.items()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0028_appointment_series'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorday',
+            name='occupancy',
+            field=models.BinaryField(default=b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00', max_length=36),
+        ),
+        migrations.RunPython(fill_occupancy, migrations.RunPython.noop),
+    ]
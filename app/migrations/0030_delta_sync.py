@@ -0,0 +1,65 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:26
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def stamp_existing_rows(apps, schema_editor):
+    # Existing rows have not changed since they were written.
+    apps.get_model('app', 'Appointment').objects.update(updated=F('created'))
+    apps.get_model('app', 'Prescription').objects.update(updated=F('date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0029_doctorday_occupancy'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('appointment', 'appointment'), ('prescription', 'prescription')], max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('deleted', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='prescription',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(stamp_existing_rows, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'updated', 'id'], name='appointment_patient_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['patient', 'updated', 'id'], name='prescription_patient_sync_idx'),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='patient',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['patient', 'kind', 'deleted', 'id'], name='tombstone_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['deleted'], name='tombstone_deleted_idx'),
+        ),
+    ]
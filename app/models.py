@@ -1,6 +1,13 @@
-from django.db import models
+import re
+
+from django.db import models, transaction
+from django.db.models import Count, F, Q
 from django.contrib.auth import get_user_model
-from .validators import validate_time_overlap
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils import timezone
+from . import occupancy
+from .recurrence import series_dates
+from .validators import validate_series_overlap, validate_time_overlap
 
 UserModel = get_user_model()
 
@@ -11,35 +18,392 @@ class Doctor(models.Model):
     specialization = models.CharField(max_length=100)
     hospital = models.CharField(max_length=100)
     phone_number = models.CharField(max_length=15)
+    created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created', 'id'], name='doctor_created_idx'),
+            # Directory filters, ordered the way the list is paginated.
+            models.Index(fields=['specialization', 'created', 'id'], name='doctor_specialization_idx'),
+            models.Index(fields=['hospital', 'created', 'id'], name='doctor_hospital_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.specialization}"
 
 
+class DoctorSearchTerm(models.Model):
+    # Lower-cased words of the doctor's username and name, so a name prefix
+    # search is an index range lookup instead of a LIKE scan over auth_user.
+    # Kept in sync by app/signals.py.
+    doctor = models.ForeignKey('Doctor', on_delete=models.CASCADE, related_name='search_terms')
+    term = models.CharField(max_length=150)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'doctor'], name='doctor_search_term_idx'),
+        ]
+
+    @staticmethod
+    def tokenize(*values):
+        return set(re.findall(r'\w+', ' '.join(values).casefold()))
+
+    @classmethod
+    def for_doctor(cls, doctor):
+        user = doctor.user
+        return [cls(doctor=doctor, term=term[:150]) for term in cls.tokenize(user.username, user.first_name, user.last_name)]
+
+    @classmethod
+    def index_doctor(cls, doctor):
+        cls.objects.filter(doctor=doctor).delete()
+        cls.objects.bulk_create(cls.for_doctor(doctor))
+
+    @classmethod
+    def doctors_matching(cls, prefix):
+        # A range rather than startswith: LIKE is case-insensitive on SQLite
+        # and cannot use a plain index.
+        prefix = prefix.casefold()
+        return cls.objects.filter(term__gte=prefix, term__lt=prefix + chr(0x10ffff)).values('doctor_id')
+
+
 class Review(models.Model):
     created = models.DateTimeField(auto_now_add=True)  # Automatically set the field to now when the object is first created.
     body = models.TextField(blank=False)  # The content of the comment, must not be empty.
+    rating = models.PositiveSmallIntegerField(null=True, validators=[MinValueValidator(1), MaxValueValidator(5)])  # 1-5 stars; null on reviews written before ratings existed.
     owner = models.ForeignKey('auth.User', on_delete=models.CASCADE)  # Link to the user who created the comment.
     doctor = models.ForeignKey('Doctor', on_delete=models.CASCADE)  # Link to the post the comment belongs to.
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created', 'id'], name='review_created_idx'),
+            models.Index(fields=['doctor', 'created', 'id'], name='review_doctor_created_idx'),
+        ]
+
+
+class DoctorRating(models.Model):
+    # Running totals of a doctor's review ratings, so the directory can show
+    # scores without reading the review table. Updated incrementally by the
+    # review signal handlers in app/signals.py.
+    STARS = range(1, 6)
+
+    doctor = models.OneToOneField('Doctor', on_delete=models.CASCADE, primary_key=True, related_name='rating')
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+
+    @property
+    def average(self):
+        return round(self.total / self.count, 2) if self.count else None
+
+    @property
+    def histogram(self):
+        return {stars: getattr(self, f'stars_{stars}') for stars in self.STARS}
+
+    @classmethod
+    def add(cls, doctor_id, rating, delta=1):
+        # delta is +1 when a rating appears and -1 when it goes away.
+        if rating is None:
+            return
+        updated = cls.objects.filter(doctor_id=doctor_id).update(**{
+            'count': F('count') + delta,
+            'total': F('total') + delta * rating,
+            f'stars_{rating}': F(f'stars_{rating}') + delta,
+        })
+        if not updated and delta > 0:
+            # Doctors created with bulk_create have no row yet. Removals skip
+            # this, since they also run while a doctor is being deleted.
+            cls.rebuild(doctor_id)
+
+    @classmethod
+    def rebuild(cls, doctor_id):
+        counts = Review.objects.filter(doctor_id=doctor_id, rating__isnull=False).aggregate(**{
+            f'stars_{stars}': Count('pk', filter=Q(rating=stars)) for stars in cls.STARS
+        })
+        cls.objects.update_or_create(doctor_id=doctor_id, defaults={
+            'count': sum(counts.values()),
+            'total': sum(stars * counts[f'stars_{stars}'] for stars in cls.STARS),
+            **counts,
+        })
+
 
 class Appointment(models.Model):
     created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)  # Delta sync position (see app/sync.py).
     date = models.DateField()
     start_time = models.TimeField()
     end_time = models.TimeField()
     patient = models.ForeignKey('auth.User', on_delete=models.CASCADE)
     doctor = models.ForeignKey('Doctor', on_delete=models.CASCADE)
 
-    def save(self, *args, **kwargs):
-        validate_time_overlap(self.date, self.start_time, self.end_time, self)
-        super(Appointment, self).save(*args, **kwargs)
+    class Meta:
+        indexes = [
+            # Overlap checks look up a single doctor's day by time range.
+            models.Index(fields=['doctor', 'date', 'start_time', 'end_time'], name='appointment_doctor_slot_idx'),
+            # Keyset pagination (see app/pagination.py): the appointment list
+            # in date order per patient and for staff, and per doctor.
+            models.Index(fields=['patient', 'date', 'start_time', 'id'], name='appointment_patient_date_idx'),
+            models.Index(fields=['date', 'start_time', 'id'], name='appointment_date_idx'),
+            models.Index(fields=['doctor', 'created', 'id'], name='appointment_doctor_created_idx'),
+            # Delta sync of a patient's appointments.
+            models.Index(fields=['patient', 'updated', 'id'], name='appointment_patient_sync_idx'),
+        ]
+
+    # Set on the unsaved occurrences that AppointmentSeries.occurrences() yields.
+    series_id = None
+
+    def validate_slot(self):
+        # Must run inside the transaction that writes the appointment.
+        DoctorDay.lock(self.doctor_id, self.date)
+        validate_time_overlap(self.doctor_id, self.date, self.start_time, self.end_time, self)
+
+    def save(self, *args, overlap_validated=False, **kwargs):
+        # Callers that already ran validate_slot() inside their own
+        # transaction (see AppointmentSerializer) pass overlap_validated=True.
+        with transaction.atomic():
+            if not overlap_validated:
+                self.validate_slot()
+            previous = None
+            if not self._state.adding:
+                previous = Appointment.objects.filter(pk=self.pk).values_list('doctor_id', 'date', 'patient_id').first()
+            super(Appointment, self).save(*args, **kwargs)
+            if previous is None:
+                DoctorDay.occupy(self.doctor_id, [self.date], self.start_time, self.end_time)
+                return
+            doctor_id, date, patient_id = previous
+            # The old slots may be shared with neighbours, so the days are
+            # recomputed rather than cleared bit by bit.
+            if (doctor_id, date) != (self.doctor_id, self.date):
+                DoctorDay.rebuild(doctor_id, [date])
+            DoctorDay.rebuild(self.doctor_id, [self.date])
+            if patient_id != self.patient_id:
+                Tombstone.objects.create(kind=Tombstone.APPOINTMENT, object_id=self.pk, patient_id=patient_id)
+
+
+class AppointmentSeries(models.Model):
+    # A standing weekly or biweekly booking. Occurrences are not stored: they
+    # are worked out from the rule wherever a list, availability or overlap
+    # check needs them (see app/recurrence.py). An exception cancels one
+    # occurrence.
+    WEEKLY = 1
+    BIWEEKLY = 2
+    INTERVAL_CHOICES = [(WEEKLY, 'weekly'), (BIWEEKLY, 'biweekly')]
+    MAX_OCCURRENCES = 104
+
+    created = models.DateTimeField(auto_now_add=True)
+    start_date = models.DateField()  # The first occurrence; the rest fall on the same weekday.
+    until = models.DateField()  # No occurrences after this date.
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    interval = models.PositiveSmallIntegerField(choices=INTERVAL_CHOICES, default=WEEKLY)  # Weeks between occurrences.
+    patient = models.ForeignKey('auth.User', on_delete=models.CASCADE)
+    doctor = models.ForeignKey('Doctor', on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            # Overlap checks look up a doctor's series that have not ended yet.
+            models.Index(fields=['doctor', 'until'], name='series_doctor_until_idx'),
+            # Keyset pagination of the series list, per patient and for staff.
+            models.Index(fields=['patient', 'start_date', 'id'], name='series_patient_start_idx'),
+            models.Index(fields=['start_date', 'id'], name='series_start_idx'),
+        ]
+
+    @property
+    def period_days(self):
+        return 7 * self.interval
+
+    def exception_dates(self):
+        if self.pk is None:
+            return set()
+        return {exception.date for exception in self.exceptions.all()}
+
+    def matches(self, date):
+        # Whether the rule puts an occurrence on date; exceptions are not checked.
+        return self.start_date <= date <= self.until and (date - self.start_date).days % self.period_days == 0
+
+    def occurrences(self, date_from=None, date_to=None, reverse=False):
+        # Unsaved Appointments standing in for each occurrence in the window.
+        # Their id is the negated series id: it sorts them before stored
+        # appointments at the same time for keyset pagination and can never
+        # clash with a stored one.
+        for date in series_dates(self, date_from, date_to, reverse):
+            occurrence = Appointment(
+                id=-self.pk, created=self.created, date=date, start_time=self.start_time, end_time=self.end_time,
+                patient_id=self.patient_id, doctor_id=self.doctor_id,
+            )
+            occurrence.series_id = self.pk
+            yield occurrence
+
+    def validate_slot(self):
+        # Must run inside the transaction that writes the series. Locks every
+        # day it occurs on, in date order, so single bookings on those days
+        # wait for it and vice versa.
+        for date in series_dates(self):
+            DoctorDay.lock(self.doctor_id, date)
+        validate_series_overlap(self)
+
+    def save(self, *args, overlap_validated=False, **kwargs):
+        with transaction.atomic():
+            if not overlap_validated:
+                self.validate_slot()
+            adding = self._state.adding
+            super().save(*args, **kwargs)
+            if adding:
+                DoctorDay.occupy(self.doctor_id, list(series_dates(self)), self.start_time, self.end_time)
+            else:
+                DoctorDay.rebuild(self.doctor_id, series_dates(self))
+
+
+class SeriesException(models.Model):
+    series = models.ForeignKey(AppointmentSeries, on_delete=models.CASCADE, related_name='exceptions')
+    date = models.DateField()  # The cancelled occurrence.
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['series', 'date'], name='series_exception_unique'),
+        ]
+
+
+class DoctorDay(models.Model):
+    # One row per doctor and day with bookings; used to serialise concurrent
+    # bookings for the same doctor-day without blocking anyone else, and to
+    # keep the day's occupancy bitmap (see app/occupancy.py).
+    doctor = models.ForeignKey('Doctor', on_delete=models.CASCADE)
+    date = models.DateField()
+    version = models.PositiveIntegerField(default=0)
+    occupancy = models.BinaryField(max_length=occupancy.SIZE, default=occupancy.EMPTY)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'date'], name='doctor_day_unique'),
+        ]
+
+    @classmethod
+    def lock(cls, doctor_id, date):
+        # Writing the row takes a row lock on PostgreSQL and the write lock on
+        # SQLite before the overlap check reads anything, so a second booking
+        # for the same doctor-day waits here instead of reading stale data.
+        day = cls.objects.filter(doctor_id=doctor_id, date=date)
+        if not day.update(version=F('version') + 1):
+            _, created = cls.objects.get_or_create(doctor_id=doctor_id, date=date)
+            day.update(version=F('version') + 1)
+            if created and Appointment.objects.filter(doctor_id=doctor_id, date=date).exists():
+                # Appointments written with bulk_create, before the day had a row.
+                cls.rebuild(doctor_id, [date])
+
+    @classmethod
+    def occupy(cls, doctor_id, dates, start_time, end_time):
+        # Marks a new booking; its days must be locked already.
+        bits = occupancy.mask(start_time, end_time)
+        days = list(cls.objects.filter(doctor_id=doctor_id, date__in=dates).only('occupancy'))
+        for day in days:
+            day.occupancy = occupancy.dump(occupancy.load(day.occupancy) | bits)
+        cls.objects.bulk_update(days, ['occupancy'])
+
+    @classmethod
+    def rebuild(cls, doctor_id, dates, create=False):
+        # Recomputes the days from the appointments and series, for when a
+        # booking goes away or moves. Missing rows are only created with
+        # create=True (the rebuild_occupancy command): a removal may run while
+        # the doctor and their days are being deleted.
+        # In autocommit the version bump, the reads and the write would be
+        # separate transactions, and a booking committed in between would
+        # lose its bits.
+        if not transaction.get_connection().in_atomic_block:
+            raise transaction.TransactionManagementError('DoctorDay.rebuild() must run inside transaction.atomic().')
+        dates = sorted(set(dates))
+        if not dates:
+            return
+        cls.objects.filter(doctor_id=doctor_id, date__in=dates).update(version=F('version') + 1)
+        bits = dict.fromkeys(dates, 0)
+        stored = Appointment.objects.filter(doctor_id=doctor_id, date__in=dates).values_list('date', 'start_time', 'end_time')
+        for date, start_time, end_time in stored.iterator():
+            bits[date] |= occupancy.mask(start_time, end_time)
+        series = AppointmentSeries.objects.filter(
+            doctor_id=doctor_id, start_date__lte=dates[-1], until__gte=dates[0],
+        ).prefetch_related('exceptions')
+        for item in series:
+            item_bits = occupancy.mask(item.start_time, item.end_time)
+            for date in series_dates(item, dates[0], dates[-1]):
+                if date in bits:
+                    bits[date] |= item_bits
+
+        days = list(cls.objects.filter(doctor_id=doctor_id, date__in=dates).only('date', 'occupancy'))
+        for day in days:
+            day.occupancy = occupancy.dump(bits.pop(day.date))
+        cls.objects.bulk_update(days, ['occupancy'])
+        if create:
+            cls.objects.bulk_create(
+                cls(doctor_id=doctor_id, date=date, occupancy=occupancy.dump(value)) for date, value in bits.items() if value
+            )
 
 
 class Prescription(models.Model):
     date = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)  # Delta sync position (see app/sync.py).
     medical_facility = models.CharField(max_length=100)
     rx = models.TextField()
     patient = models.ForeignKey(UserModel, on_delete=models.CASCADE)  # Assuming patient is a User model
     doctor = models.ForeignKey('Doctor', on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'id'], name='prescription_date_idx'),
+            models.Index(fields=['patient', 'date', 'id'], name='prescription_patient_date_idx'),
+            models.Index(fields=['patient', 'updated', 'id'], name='prescription_patient_sync_idx'),
+        ]
+
+
+class Tombstone(models.Model):
+    # A deleted appointment or prescription, or one that moved to another
+    # patient, kept for GPCARE_SYNC_RETENTION_DAYS so delta sync can tell the
+    # patient's clients to drop it.
+    APPOINTMENT = 'appointment'
+    PRESCRIPTION = 'prescription'
+    KIND_CHOICES = [(APPOINTMENT, 'appointment'), (PRESCRIPTION, 'prescription')]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    # No constraint: tombstones are written while a patient's rows are
+    # deleted along with the patient.
+    patient = models.ForeignKey('auth.User', on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    deleted = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'kind', 'deleted', 'id'], name='tombstone_patient_idx'),
+            models.Index(fields=['deleted'], name='tombstone_deleted_idx'),
+        ]
+
+
+class Job(models.Model):
+    # A unit of background work, written in the same transaction as the
+    # change that caused it and run by `manage.py run_jobs` (see app/jobs.py).
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'pending'), (RUNNING, 'running'), (DONE, 'done'), (FAILED, 'failed')]
+
+    name = models.CharField(max_length=100)  # A task registered with @jobs.task.
+    payload = models.JSONField(default=dict)
+    key = models.CharField(max_length=200, null=True, unique=True)  # At most one job per key, e.g. per reminder.
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    run_at = models.DateTimeField(default=timezone.now)  # Not before; pushed back between retries.
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True)  # A running job past this is taken to have lost its worker.
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim due jobs in run_at order.
+            models.Index(fields=['status', 'run_at', 'id'], name='job_due_idx'),
+            models.Index(fields=['status', 'locked_until'], name='job_lease_idx'),
+        ]
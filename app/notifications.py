@@ -0,0 +1,130 @@
+import datetime
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import send_mail
+from django.utils import timezone
+
+from .jobs import enqueue_many, make_job, task
+from .models import Appointment, AppointmentSeries, Doctor, Prescription
+
+# Patient notifications, sent by the job worker rather than during the
+# request. Jobs carry ids and re-read the rows when they run, so a job for
+# something changed or deleted since is a no-op; patients without an email
+# address are skipped.
+
+UserModel = get_user_model()
+
+
+def notify(user_id, subject, body):
+    email = UserModel.objects.filter(pk=user_id).values_list('email', flat=True).first()
+    if email:
+        send_mail(subject, body, None, [email])
+
+
+def doctor_name(doctor_id):
+    doctor = Doctor.objects.select_related('user').filter(pk=doctor_id).first()
+    return str(doctor) if doctor else 'your doctor'
+
+
+def when(date, start_time):
+    return f'{date} at {start_time:%H:%M}'
+
+
+@task
+def appointment_booked(appointment):
+    appointment = Appointment.objects.filter(pk=appointment).first()
+    if appointment:
+        notify(appointment.patient_id, 'Appointment confirmed', (
+            f'Your appointment on {when(appointment.date, appointment.start_time)} '
+            f'with {doctor_name(appointment.doctor_id)} is confirmed.'
+        ))
+
+
+@task
+def appointment_rescheduled(appointment):
+    appointment = Appointment.objects.filter(pk=appointment).first()
+    if appointment:
+        notify(appointment.patient_id, 'Appointment changed', (
+            f'Your appointment with {doctor_name(appointment.doctor_id)} is now on '
+            f'{when(appointment.date, appointment.start_time)}.'
+        ))
+
+
+@task
+def appointment_cancelled(patient, doctor, date, start_time):
+    date, start_time = datetime.date.fromisoformat(date), datetime.time.fromisoformat(start_time)
+    notify(patient, 'Appointment cancelled', (
+        f'Your appointment on {when(date, start_time)} with {doctor_name(doctor)} has been deleted.'
+    ))
+
+
+@task
+def series_booked(series):
+    series = AppointmentSeries.objects.filter(pk=series).first()
+    if series:
+        notify(series.patient_id, 'Recurring appointment confirmed', (
+            f'Your {series.get_interval_display()} appointment with {doctor_name(series.doctor_id)} from '
+            f'{when(series.start_date, series.start_time)} until {series.until} is confirmed.'
+        ))
+
+
+@task
+def prescription_issued(prescription):
+    prescription = Prescription.objects.filter(pk=prescription).first()
+    if prescription:
+        notify(prescription.patient_id, 'New prescription', (
+            f'{doctor_name(prescription.doctor_id)} has issued you a prescription at {prescription.medical_facility}.'
+        ))
+
+
+@task
+def appointment_reminder(appointment, date, start_time):
+    # Sent only if the appointment still starts when the reminder was planned.
+    appointment = Appointment.objects.filter(pk=appointment, date=date, start_time=start_time).first()
+    if appointment:
+        notify(appointment.patient_id, 'Appointment reminder', (
+            f'Reminder: you have an appointment on {when(appointment.date, appointment.start_time)} '
+            f'with {doctor_name(appointment.doctor_id)}.'
+        ))
+
+
+@task
+def series_reminder(series, date):
+    date = datetime.date.fromisoformat(date)
+    series = AppointmentSeries.objects.filter(pk=series).prefetch_related('exceptions').first()
+    if series and series.matches(date) and date not in series.exception_dates():
+        notify(series.patient_id, 'Appointment reminder', (
+            f'Reminder: you have an appointment on {when(date, series.start_time)} '
+            f'with {doctor_name(series.doctor_id)}.'
+        ))
+
+
+def scan_reminders(now=None):
+    # Enqueues a reminder for everything starting in the next
+    # GPCARE_REMINDER_HOURS. The job keys name the appointment and its start,
+    # so scans can overlap (and run in several workers) without sending a
+    # reminder twice, while a rescheduled appointment gets a new one.
+    now = timezone.localtime(now)
+    until = now + datetime.timedelta(hours=settings.GPCARE_REMINDER_HOURS)
+    # A date range read off appointment_date_idx, trimmed at both ends.
+    upcoming = Appointment.objects.filter(date__range=(now.date(), until.date())).exclude(
+        date=now.date(), start_time__lt=now.time(),
+    ).exclude(date=until.date(), start_time__gt=until.time()).values_list('pk', 'date', 'start_time')
+    jobs = [
+        make_job(
+            'appointment_reminder', key=f'reminder:appointment:{pk}:{date}:{start_time}',
+            appointment=pk, date=date.isoformat(), start_time=start_time.isoformat(),
+        )
+        for pk, date, start_time in upcoming.iterator()
+    ]
+    series = AppointmentSeries.objects.filter(start_date__lte=until.date(), until__gte=now.date()).prefetch_related('exceptions')
+    for occurrence in (occurrence for item in series for occurrence in item.occurrences(now.date(), until.date())):
+        start = timezone.make_aware(datetime.datetime.combine(occurrence.date, occurrence.start_time))
+        if now <= start <= until:
+            jobs.append(make_job(
+                'series_reminder', key=f'reminder:series:{occurrence.series_id}:{occurrence.date}',
+                series=occurrence.series_id, date=occurrence.date.isoformat(),
+            ))
+    enqueue_many(jobs)
+    return len(jobs)
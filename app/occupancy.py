@@ -0,0 +1,45 @@
+# Per-doctor-day occupancy bitmaps (DoctorDay.occupancy). The day is cut
+# into 288 five-minute slots and bit i is set when any appointment or series
+# occurrence touches slot i, wholly or in part. A booking whose slots are all
+# clear cannot overlap anything, so the common case is answered from one
+# row; a set bit is only a hint, since two intervals off the five-minute
+# grid can share a slot without overlapping.
+
+SLOT_SECONDS = 5 * 60
+SLOTS = 24 * 3600 // SLOT_SECONDS
+SIZE = SLOTS // 8
+EMPTY = bytes(SIZE)
+
+
+def to_seconds(value):
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def mask(start_time, end_time):
+    first = to_seconds(start_time) // SLOT_SECONDS
+    last = -(-to_seconds(end_time) // SLOT_SECONDS)
+    return ((1 << (last - first)) - 1) << first
+
+
+def load(value):
+    # bytes on SQLite, memoryview on PostgreSQL; None for a missing row.
+    return int.from_bytes(value or EMPTY, 'little')
+
+
+def dump(bits):
+    return bits.to_bytes(SIZE, 'little')
+
+
+def busy_intervals(bits):
+    # Runs of set bits as (start, end) seconds, in order.
+    intervals = []
+    slot = 0
+    while bits:
+        skipped = (bits & -bits).bit_length() - 1
+        bits >>= skipped
+        run = (~bits & (bits + 1)).bit_length() - 1
+        bits >>= run
+        start = (slot + skipped) * SLOT_SECONDS
+        intervals.append((start, start + run * SLOT_SECONDS))
+        slot += skipped + run
+    return intervals
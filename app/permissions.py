@@ -9,7 +9,7 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         return False
 
     def has_object_permission(self, request, view, obj):
-        return obj.patient == request.user
+        return obj.patient_id == request.user.id
 
 
 
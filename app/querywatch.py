@@ -0,0 +1,129 @@
+import logging
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.views import View
+from rest_framework import serializers
+
+# Development and CI aid: while a watch is active, every query is recorded
+# with where it came from, and the watch reports
+#   - the same query shape (SQL with parameters and IN lists collapsed) run
+#     repeat_threshold or more times, the usual N+1 signature, and
+#   - queries slower than slow_ms.
+# Turned on per request by QueryWatchMiddleware (GPCARE_QUERYWATCH=log or
+# raise), or around a block in tests with assert_no_n_plus_one().
+
+logger = logging.getLogger('gpcare.querywatch')
+
+APP_DIR = str(Path(__file__).resolve().parent)
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+SKIPPED_FILES = ('querywatch.py', 'metrics.py')
+
+_current = ContextVar('gpcare_query_watch', default=None)
+
+
+class NPlusOneDetected(AssertionError):
+    pass
+
+
+def query_shape(sql):
+    return IN_LIST.sub('IN (...)', sql)
+
+
+def find_origin():
+    # Innermost app frame, serializer field and view on the current stack.
+    location = field = view = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if location is None and code.co_filename.startswith(APP_DIR) and not code.co_filename.endswith(SKIPPED_FILES):
+            location = f'app/{Path(code.co_filename).name}:{frame.f_lineno} in {code.co_name}'
+        owner = frame.f_locals.get('self')
+        if field is None and code.co_name == 'to_representation' and isinstance(owner, serializers.Serializer):
+            current = frame.f_locals.get('field')
+            if current is not None:
+                field = f'{type(owner).__name__}.{current.field_name}'
+        if view is None and isinstance(owner, View):
+            view = type(owner).__name__
+        frame = frame.f_back
+    return view, field, location
+
+
+class QueryWatch:
+
+    def __init__(self, repeat_threshold=None, slow_ms=None):
+        self.repeat_threshold = repeat_threshold or settings.GPCARE_QUERYWATCH_REPEAT
+        self.slow_ms = settings.GPCARE_SLOW_QUERY_MS if slow_ms is None else slow_ms
+        self.queries = []
+
+    def record(self, sql, duration):
+        self.queries.append((query_shape(sql), duration, find_origin()))
+
+    def repeated(self):
+        groups = defaultdict(list)
+        for shape, _, origin in self.queries:
+            groups[shape].append(origin)
+        return [(shape, origins) for shape, origins in groups.items() if len(origins) >= self.repeat_threshold]
+
+    def slow(self):
+        return [(shape, duration, origin) for shape, duration, origin in self.queries if duration * 1000 >= self.slow_ms]
+
+    def problems(self):
+        return bool(self.repeated() or self.slow())
+
+    def report(self):
+        lines = []
+        for shape, origins in self.repeated():
+            lines.append(f'{len(origins)} x {shape}')
+            lines += [f'    from {describe(origin)}' for origin in sorted(set(origins), key=str)]
+        for shape, duration, origin in self.slow():
+            lines.append(f'slow ({duration * 1000:.0f} ms): {shape}')
+            lines.append(f'    from {describe(origin)}')
+        return '\n'.join(lines)
+
+
+def describe(origin):
+    view, field, location = origin
+    parts = [f'view {view}' if view else None, f'field {field}' if field else None, location]
+    return ', '.join(part for part in parts if part) or 'unknown'
+
+
+def record_query(execute, sql, params, many, context):
+    watch = _current.get()
+    if watch is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        watch.record(sql, time.perf_counter() - start)
+
+
+@contextmanager
+def watch(**kwargs):
+    query_watch = QueryWatch(**kwargs)
+    token = _current.set(query_watch)
+    try:
+        yield query_watch
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def assert_no_n_plus_one(**kwargs):
+    with watch(**kwargs) as query_watch:
+        yield query_watch
+    if query_watch.problems():
+        raise NPlusOneDetected('\n' + query_watch.report())
+
+
+class QueryWatchTestMixin:
+
+    def assertNoNPlusOne(self, **kwargs):
+        return assert_no_n_plus_one(**kwargs)
@@ -0,0 +1,74 @@
+import datetime
+import heapq
+from math import gcd
+
+# Date arithmetic for recurring appointment series. A series occurs every
+# `period` days from its start date up to its end date, minus exceptions,
+# so its occurrences are the day numbers congruent to the start modulo the
+# period. Two series share a day exactly when those congruences have a
+# common solution (Chinese remainder theorem), which is found directly
+# instead of by listing every occurrence.
+
+
+def first_on_or_after(start, period, lower):
+    # First day of start, start + period, ... that is not before lower.
+    if lower <= start:
+        return start
+    return start + -(-(lower - start) // period) * period
+
+
+def common_days(a_start, a_period, b_start, b_period, lower, upper):
+    # Day numbers in [lower, upper] on both progressions, in order.
+    g = gcd(a_period, b_period)
+    if (b_start - a_start) % g:
+        return
+    # a_start + a_period * t == b_start (mod b_period) gives one common
+    # day; the others repeat every lcm(a_period, b_period) days.
+    step = b_period // g
+    t = (b_start - a_start) // g * pow(a_period // g, -1, step) % step
+    lcm = a_period // g * b_period
+    day = lower + (a_start + a_period * t - lower) % lcm
+    while day <= upper:
+        yield day
+        day += lcm
+
+
+def series_dates(series, date_from=None, date_to=None, reverse=False, exceptions=None):
+    # Occurrence dates of one series within [date_from, date_to], skipping
+    # exceptions (the series' own unless given), generated one at a time in
+    # either direction.
+    period = series.period_days
+    lower = series.start_date if date_from is None else max(series.start_date, date_from)
+    upper = series.until if date_to is None else min(series.until, date_to)
+    if lower > upper:
+        return
+    first = first_on_or_after(series.start_date.toordinal(), period, lower.toordinal())
+    last = upper.toordinal() - (upper.toordinal() - series.start_date.toordinal()) % period
+    days = range(last, first - 1, -period) if reverse else range(first, last + 1, period)
+    if exceptions is None:
+        exceptions = series.exception_dates()
+    for day in days:
+        date = datetime.date.fromordinal(day)
+        if date not in exceptions:
+            yield date
+
+
+def first_shared_date(series, other):
+    # The first date both series occur on, or None.
+    lower = max(series.start_date, other.start_date).toordinal()
+    upper = min(series.until, other.until).toordinal()
+    skipped = series.exception_dates() | other.exception_dates()
+    for day in common_days(
+        series.start_date.toordinal(), series.period_days, other.start_date.toordinal(), other.period_days, lower, upper,
+    ):
+        date = datetime.date.fromordinal(day)
+        if date not in skipped:
+            return date
+    return None
+
+
+def merge_occurrences(series_list, date_from=None, date_to=None, reverse=False):
+    # Occurrences of several series as one stream in (date, start_time, id)
+    # order, expanded only as far as the caller reads.
+    key = lambda occurrence: (occurrence.date, occurrence.start_time, occurrence.id)
+    return heapq.merge(*(series.occurrences(date_from, date_to, reverse) for series in series_list), key=key, reverse=reverse)
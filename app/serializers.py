@@ -1,18 +1,28 @@
+import datetime
+from itertools import groupby
+from operator import itemgetter
+
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Doctor, Review, Appointment, Prescription
-from .validators import validate_time_overlap
+from . import hashing, jobs
+from .metrics import TimedSerializerMixin
+from .booking import find_overlaps
+from .models import Doctor, DoctorDay, DoctorRating, Review, Appointment, AppointmentSeries, Prescription, SeriesException, Tombstone
+from .validators import validate_time_range
 
 UserModel = get_user_model()
 
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
 
     def create(self, validated_data):
-        user = UserModel.objects.create_user(
+        user = hashing.create_user(
             username=validated_data['username'],
             password=validated_data['password'],
             email=validated_data.get('email', ''),
@@ -26,7 +36,7 @@ class UserSerializer(serializers.ModelSerializer):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         if password:
-            instance.set_password(password)
+            hashing.set_password(instance, password)
         instance.save()
         return instance
 
@@ -46,63 +56,323 @@ class PasswordChangeSerializer(serializers.Serializer):
 
 
 
-class DoctorSerializer(serializers.ModelSerializer):
+class DoctorRatingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    class Meta:
+        model = DoctorRating
+        fields = ['count', 'average', 'histogram']
+
+
+class DoctorSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username')
     email = serializers.EmailField(source='user.email')
     first_name = serializers.CharField(source='user.first_name')
     last_name = serializers.CharField(source='user.last_name')
     password = serializers.CharField(write_only=True)
+    rating = DoctorRatingSerializer(read_only=True)
 
     class Meta:
         model = Doctor
-        fields = ['username', 'email', 'first_name', 'last_name', 'password', 'specialization', 'hospital', 'phone_number']
+        fields = ['username', 'email', 'first_name', 'last_name', 'password', 'specialization', 'hospital', 'phone_number', 'rating']
 
     def create(self, validated_data):
         user_data = validated_data.pop('user')
         user_data['password'] = validated_data.pop('password')
-        user = UserModel.objects.create_user(**user_data)
+        user = hashing.create_user(**user_data)
         doctor = Doctor.objects.create(user=user, **validated_data)
         return doctor
 
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     owner = serializers.ReadOnlyField(source='owner.username')  # The username of the owner, read-only.
 
     class Meta:
         model = Review
         fields = '__all__'
+        extra_kwargs = {
+            'rating': {'required': True, 'allow_null': False},
+        }
 
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class AppointmentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     date = serializers.DateField(required=False)
     start_time = serializers.TimeField(required=False)
     end_time = serializers.TimeField(required=False)
     doctor = serializers.PrimaryKeyRelatedField(queryset=Doctor.objects.all(), required=False)
+    series = serializers.IntegerField(source='series_id', read_only=True)  # Set on occurrences of a recurring series.
 
     class Meta:
         model = Appointment
-        fields = ['created', 'date', 'start_time', 'end_time', 'doctor']
+        fields = ['created', 'date', 'start_time', 'end_time', 'doctor', 'series']
 
     def validate(self, data):
-        # Ensure to validate against instance values for partial updates
-        date = data.get('date', self.instance.date if self.instance else None)
+        # The fields are optional for partial updates only; a new appointment
+        # needs all of them.
+        if self.instance is None:
+            missing = {
+                name: self.fields[name].error_messages['required']
+                for name in ('doctor', 'date', 'start_time', 'end_time') if self.fields[name].source not in data
+            }
+            if missing:
+                raise serializers.ValidationError(missing)
+        # Ensure to validate against instance values for partial updates.
+        # The overlap check needs the database, so it runs in save_validated().
         start_time = data.get('start_time', self.instance.start_time if self.instance else None)
         end_time = data.get('end_time', self.instance.end_time if self.instance else None)
-        validate_time_overlap(date, start_time, end_time, self.instance)
+        validate_time_range(start_time, end_time)
         return data
 
+    def create(self, validated_data):
+        return self.save_validated(Appointment(**validated_data))
+
     def update(self, instance, validated_data):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
+        return self.save_validated(instance)
+
+    def save_validated(self, instance):
+        # Check and write in one transaction, then tell the model not to check again.
+        with transaction.atomic():
+            try:
+                instance.validate_slot()
+            except DjangoValidationError as exc:
+                raise serializers.ValidationError(serializers.as_serializer_error(exc))
+            instance.save(overlap_validated=True)
         return instance
 
 
 
-class PrescriptionSerializer(serializers.ModelSerializer):
-    doctor = serializers.ReadOnlyField(source='doctor.username')
+class AppointmentSyncSerializer(AppointmentSerializer):
+
+    class Meta(AppointmentSerializer.Meta):
+        fields = ['id', 'created', 'updated', 'date', 'start_time', 'end_time', 'doctor']
+
+
+class BulkAppointmentListSerializer(serializers.ListSerializer):
+    # Validates a whole batch against the stored schedule and against itself,
+    # then writes it with one bulk_create/bulk_update. Errors come back as a
+    # list aligned with the input, and nothing is written if any item fails.
+
+    def to_internal_value(self, data):
+        # Reference checks live here rather than in validate() so that their
+        # errors keep the same per-item list shape as field errors.
+        items = super().to_internal_value(data)
+        doctor_ids = {item['doctor_id'] for item in items}
+        patient_ids = {item['patient_id'] for item in items if item.get('patient_id')}
+        appointment_ids = [item['id'] for item in items if 'id' in item]
+        doctors = set(Doctor.objects.filter(pk__in=doctor_ids).values_list('pk', flat=True))
+        patients = set(UserModel.objects.filter(pk__in=patient_ids).values_list('pk', flat=True))
+        self.rescheduled = Appointment.objects.in_bulk(appointment_ids)
+
+        errors = []
+        for item in items:
+            error = {}
+            if item['doctor_id'] not in doctors:
+                error['doctor'] = [f'Invalid pk "{item["doctor_id"]}" - object does not exist.']
+            if 'id' in item:
+                if item['id'] not in self.rescheduled:
+                    error['id'] = [f'Invalid pk "{item["id"]}" - object does not exist.']
+                elif appointment_ids.count(item['id']) > 1:
+                    error['id'] = ['This appointment appears more than once in the batch.']
+            if 'patient_id' in item and item['patient_id'] not in patients:
+                error['patient'] = [f'Invalid pk "{item["patient_id"]}" - object does not exist.']
+            elif 'id' not in item and 'patient_id' not in item:
+                error['patient'] = ['This field is required when creating an appointment.']
+            errors.append(error)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
+
+    def conflicts(self, items):
+        days = {(item['doctor_id'], item['date']) for item in items}
+        intervals = {day: [] for day in days}
+        stored = Appointment.objects.filter(
+            doctor_id__in={doctor for doctor, _ in days}, date__in={date for _, date in days},
+        ).exclude(pk__in=self.rescheduled).values_list('pk', 'doctor_id', 'date', 'start_time', 'end_time')
+        for pk, doctor_id, date, start_time, end_time in stored.iterator():
+            if (doctor_id, date) in intervals:
+                intervals[(doctor_id, date)].append((start_time, end_time, ('stored', pk)))
+        series = AppointmentSeries.objects.filter(
+            doctor_id__in={doctor for doctor, _ in days},
+            start_date__lte=max(date for _, date in days), until__gte=min(date for _, date in days),
+        ).prefetch_related('exceptions') if days else []
+        for candidate in series:
+            exceptions = candidate.exception_dates()
+            for doctor_id, date in days:
+                if doctor_id == candidate.doctor_id and candidate.matches(date) and date not in exceptions:
+                    intervals[(doctor_id, date)].append((candidate.start_time, candidate.end_time, ('series', candidate.pk)))
+        for index, item in enumerate(items):
+            intervals[(item['doctor_id'], item['date'])].append((item['start_time'], item['end_time'], ('item', index)))
+
+        errors = [{} for _ in items]
+        for day_intervals in intervals.values():
+            for first, second in find_overlaps(day_intervals):
+                for (kind, key), (other_kind, other_key) in ((first, second), (second, first)):
+                    if kind != 'item':
+                        continue
+                    if other_kind == 'stored':
+                        message = f'This appointment overlaps existing appointment {other_key}.'
+                    elif other_kind == 'series':
+                        message = f'This appointment overlaps recurring series {other_key}.'
+                    else:
+                        message = f'This appointment overlaps item {other_key} of this batch.'
+                    errors[key].setdefault('non_field_errors', []).append(message)
+        return errors
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            # Lock in a fixed order so two batches sharing days cannot deadlock.
+            # Rescheduled appointments' old days are locked too, since their
+            # occupancy is recomputed below.
+            days = {(item['doctor_id'], item['date']) for item in validated_data}
+            days |= {(appointment.doctor_id, appointment.date) for appointment in self.rescheduled.values()}
+            for doctor_id, date in sorted(days):
+                DoctorDay.lock(doctor_id, date)
+            errors = self.conflicts(validated_data)
+            if any(errors):
+                raise serializers.ValidationError(errors)
+
+            appointments, created, updated, moved = [], [], [], []
+            now = timezone.now()
+            for item in validated_data:
+                if 'id' in item:
+                    appointment = self.rescheduled[item['id']]
+                    if item.get('patient_id', appointment.patient_id) != appointment.patient_id:
+                        moved.append(Tombstone(kind=Tombstone.APPOINTMENT, object_id=appointment.pk, patient_id=appointment.patient_id))
+                    for attr, value in item.items():
+                        setattr(appointment, attr, value)
+                    # bulk_update does not run auto_now.
+                    appointment.updated = now
+                    updated.append(appointment)
+                else:
+                    appointment = Appointment(**item)
+                    created.append(appointment)
+                appointments.append(appointment)
+            Appointment.objects.bulk_create(created)
+            Appointment.objects.bulk_update(updated, ['patient_id', 'doctor_id', 'date', 'start_time', 'end_time', 'updated'])
+            Tombstone.objects.bulk_create(moved)
+            # The notifications that Appointment's post_save would have queued.
+            jobs.enqueue_many(
+                [jobs.make_job('appointment_booked', appointment=appointment.pk) for appointment in created]
+                + [jobs.make_job('appointment_rescheduled', appointment=appointment.pk) for appointment in updated]
+            )
+            # bulk_create and bulk_update bypass Appointment.save().
+            for doctor_id, group in groupby(sorted(days), key=itemgetter(0)):
+                DoctorDay.rebuild(doctor_id, [date for _, date in group])
+        return appointments
+
+
+class BulkAppointmentSerializer(AppointmentSerializer):
+    # Items with an id reschedule that appointment; items without one create
+    # a new appointment for `patient`. Ids are resolved per batch, not per item.
+    id = serializers.IntegerField(min_value=1, required=False)
+    patient = serializers.IntegerField(source='patient_id', min_value=1, required=False)
+    doctor = serializers.IntegerField(source='doctor_id', min_value=1)
+    date = serializers.DateField()
+    start_time = serializers.TimeField()
+    end_time = serializers.TimeField()
+
+    class Meta:
+        model = Appointment
+        fields = ['id', 'created', 'patient', 'date', 'start_time', 'end_time', 'doctor']
+        list_serializer_class = BulkAppointmentListSerializer
+
+
+
+class PrescriptionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    doctor = serializers.ReadOnlyField(source='doctor.user.username')
 
     class Meta:
         model = Prescription
         fields = '__all__'
+
+
+
+class AppointmentSeriesSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    exceptions = serializers.SlugRelatedField(slug_field='date', many=True, read_only=True)
+
+    class Meta:
+        model = AppointmentSeries
+        fields = ['id', 'created', 'start_date', 'until', 'interval', 'start_time', 'end_time', 'doctor', 'exceptions']
+
+    def validate(self, data):
+        validate_time_range(data['start_time'], data['end_time'])
+        if data['until'] < data['start_date']:
+            raise serializers.ValidationError({'until': 'Must not be before start_date.'})
+        occurrences = (data['until'] - data['start_date']).days // (7 * data.get('interval', AppointmentSeries.WEEKLY)) + 1
+        if occurrences > AppointmentSeries.MAX_OCCURRENCES:
+            raise serializers.ValidationError({'until': f'At most {AppointmentSeries.MAX_OCCURRENCES} occurrences per series.'})
+        return data
+
+    def create(self, validated_data):
+        # Check and write in one transaction, as AppointmentSerializer does.
+        series = AppointmentSeries(**validated_data)
+        with transaction.atomic():
+            try:
+                series.validate_slot()
+            except DjangoValidationError as exc:
+                raise serializers.ValidationError(serializers.as_serializer_error(exc))
+            series.save(overlap_validated=True)
+        return series
+
+
+class SeriesExceptionSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = SeriesException
+        fields = ['date']
+
+    def validate_date(self, value):
+        series = self.context['series']
+        if not series.matches(value):
+            raise serializers.ValidationError('The series has no occurrence on this date.')
+        if series.exceptions.filter(date=value).exists():
+            raise serializers.ValidationError('This occurrence is already cancelled.')
+        return value
+
+
+class AppointmentQuerySerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    upcoming = serializers.BooleanField(default=False)
+
+    @classmethod
+    def from_query_params(cls, params):
+        # Query parameters are ?from=&to=&upcoming=1
+        names = {'from': 'date_from', 'to': 'date_to', 'upcoming': 'upcoming'}
+        return cls(data={field: params[name] for name, field in names.items() if name in params})
+
+    def validate(self, data):
+        if 'date_from' in data and 'date_to' in data and data['date_to'] < data['date_from']:
+            raise serializers.ValidationError({'to': 'Must not be before from.'})
+        return data
+
+
+class AvailabilityQuerySerializer(serializers.Serializer):
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    start = serializers.TimeField(default=datetime.time(9))
+    end = serializers.TimeField(default=datetime.time(17))
+    slot = serializers.IntegerField(default=30, min_value=5, max_value=720)
+    doctor = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=100)
+
+    max_days = 92
+
+    @classmethod
+    def from_query_params(cls, params):
+        # Query parameters are ?from=&to=&start=&end=&slot=&doctor=1&doctor=2
+        names = {'from': 'date_from', 'to': 'date_to', 'start': 'start', 'end': 'end', 'slot': 'slot'}
+        data = {field: params[name] for name, field in names.items() if name in params}
+        if 'doctor' in params:
+            data['doctor'] = params.getlist('doctor')
+        return cls(data=data)
+
+    def validate(self, data):
+        if data['date_to'] < data['date_from']:
+            raise serializers.ValidationError({'to': 'Must not be before from.'})
+        if (data['date_to'] - data['date_from']).days >= self.max_days:
+            raise serializers.ValidationError({'to': f'Ranges are limited to {self.max_days} days.'})
+        validate_time_range(data['start'], data['end'])
+        return data
@@ -0,0 +1,179 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import jobs, metrics, querywatch
+from .authentication import active_users
+from .cache import invalidate
+from .models import (
+    Appointment, AppointmentSeries, Doctor, DoctorDay, DoctorRating, DoctorSearchTerm, Prescription, Review, SeriesException,
+    Tombstone,
+)
+from .recurrence import series_dates
+
+UserModel = get_user_model()
+
+# User fields that show up in DoctorSerializer and ReviewSerializer.
+SERIALIZED_FIELDS = {'username', 'email', 'first_name', 'last_name'}
+
+
+def invalidate_doctor(doctor_id):
+    invalidate('doctors', f'doctor:{doctor_id}')
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    # Fires again when a closed connection reconnects.
+    for wrapper in (metrics.record_query, querywatch.record_query):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
+
+
+# Pragmas kept in the database file rather than the connection, and the
+# (database, pragma) pairs this process has already set.
+PERSISTENT_PRAGMAS = {'journal_mode'}
+_persistent_set = set()
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    database = connection.settings_dict['NAME']
+    with connection.cursor() as cursor:
+        for name, value in settings.GPCARE_SQLITE_PRAGMAS.items():
+            if name in PERSISTENT_PRAGMAS:
+                if (database, name) in _persistent_set:
+                    continue
+                _persistent_set.add((database, name))
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(post_save, sender=Doctor)
+def index_doctor_name(sender, instance, raw=False, **kwargs):
+    if not raw:
+        DoctorSearchTerm.index_doctor(instance)
+
+
+@receiver(post_save, sender=Doctor)
+def create_doctor_rating(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        DoctorRating.objects.get_or_create(doctor=instance)
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def invalidate_doctor_cache(sender, instance, **kwargs):
+    invalidate_doctor(instance.pk)
+
+
+@receiver(post_save, sender=UserModel)
+@receiver(post_delete, sender=UserModel)
+def forget_active_user(sender, instance, **kwargs):
+    active_users.forget(instance.pk)
+
+
+@receiver(post_save, sender=UserModel)
+def update_doctor_user(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Logins only touch last_login; skip the lookups unless a serialised field could have changed.
+    if raw or kwargs.get('created') or (update_fields is not None and not SERIALIZED_FIELDS & set(update_fields)):
+        return
+    doctor = Doctor.objects.filter(user=instance).first()
+    if doctor is not None:
+        doctor.user = instance
+        DoctorSearchTerm.index_doctor(doctor)
+        invalidate_doctor(doctor.pk)
+    reviewed = Review.objects.filter(owner=instance).values_list('doctor_id', flat=True).distinct()
+    invalidate(*(f'doctor:{doctor_id}:reviews' for doctor_id in reviewed))
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if instance.pk and not raw:
+        instance._previous_rating = Review.objects.filter(pk=instance.pk).values_list('doctor_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def update_doctor_rating(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    invalidate(f'doctor:{instance.doctor_id}:reviews')
+    if previous == (instance.doctor_id, instance.rating):
+        return
+    if previous:
+        DoctorRating.add(*previous, delta=-1)
+        invalidate(f'doctor:{previous[0]}:reviews')
+        invalidate_doctor(previous[0])
+    DoctorRating.add(instance.doctor_id, instance.rating)
+    invalidate_doctor(instance.doctor_id)
+
+
+@receiver(post_delete, sender=Review)
+def remove_doctor_rating(sender, instance, **kwargs):
+    DoctorRating.add(instance.doctor_id, instance.rating, delta=-1)
+    invalidate(f'doctor:{instance.doctor_id}:reviews')
+    invalidate_doctor(instance.doctor_id)
+
+
+# Bookings set their bits in Appointment.save() and AppointmentSeries.save();
+# anything that frees slots recomputes the days it touched. post_delete also
+# covers cascades and queryset deletes.
+@receiver(post_delete, sender=Appointment)
+def free_appointment_slots(sender, instance, **kwargs):
+    DoctorDay.rebuild(instance.doctor_id, [instance.date])
+
+
+@receiver(post_delete, sender=AppointmentSeries)
+def free_series_slots(sender, instance, **kwargs):
+    # Its exceptions are gone by now: every date the rule covers is recomputed.
+    DoctorDay.rebuild(instance.doctor_id, series_dates(instance, exceptions=()))
+
+
+@receiver(post_save, sender=SeriesException)
+def free_exception_slots(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    DoctorDay.rebuild(instance.series.doctor_id, [instance.date])
+
+
+# Deletions reach delta sync (app/sync.py) as tombstones.
+@receiver(post_delete, sender=Appointment)
+def bury_appointment(sender, instance, **kwargs):
+    Tombstone.objects.create(kind=Tombstone.APPOINTMENT, object_id=instance.pk, patient_id=instance.patient_id)
+
+
+@receiver(post_delete, sender=Prescription)
+def bury_prescription(sender, instance, **kwargs):
+    Tombstone.objects.create(kind=Tombstone.PRESCRIPTION, object_id=instance.pk, patient_id=instance.patient_id)
+
+
+# Patient notifications (app/notifications.py), queued in the writing
+# transaction and sent by the job worker.
+@receiver(post_save, sender=Appointment)
+def notify_appointment_saved(sender, instance, created=False, raw=False, **kwargs):
+    if not raw:
+        jobs.enqueue('appointment_booked' if created else 'appointment_rescheduled', appointment=instance.pk)
+
+
+@receiver(post_delete, sender=Appointment)
+def notify_appointment_deleted(sender, instance, **kwargs):
+    jobs.enqueue(
+        'appointment_cancelled', patient=instance.patient_id, doctor=instance.doctor_id,
+        date=instance.date.isoformat(), start_time=instance.start_time.isoformat(),
+    )
+
+
+@receiver(post_save, sender=AppointmentSeries)
+def notify_series_booked(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        jobs.enqueue('series_booked', series=instance.pk)
+
+
+@receiver(post_save, sender=Prescription)
+def notify_prescription_issued(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        jobs.enqueue('prescription_issued', prescription=instance.pk)
@@ -0,0 +1,120 @@
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import generics
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from .models import Tombstone
+from .pagination import KeysetPagination
+
+# Delta sync for clients that keep a local copy: GET ?since=<token> returns
+# the rows created or changed after the token, the ids deleted after it and
+# a token for the next call. No token, or one older than the tombstones
+# kept, gets reset=true and every current row.
+#
+# A token holds two keyset positions, (updated, id) over the rows and
+# (deleted, id) over the tombstones, so a poll with nothing new is two
+# empty index range scans. Rows are stamped before their transaction
+# commits and can land behind a position already handed out, so a
+# caught-up token is held GPCARE_SYNC_WINDOW seconds back and rows changed
+# in that window come again on the next poll.
+
+CHANGES = ('updated', 'id')
+DELETIONS = ('deleted', 'id')
+
+
+def encode_position(position):
+    return None if position is None else [position[0].isoformat(), position[1]]
+
+
+def decode_position(value):
+    if value is None:
+        return None
+    moment, pk = value
+    moment = datetime.datetime.fromisoformat(moment)
+    if timezone.is_naive(moment) or not isinstance(pk, int):
+        raise ValueError(value)
+    return moment, pk
+
+
+def encode_token(changes, deletions):
+    token = {'c': encode_position(changes), 'd': encode_position(deletions)}
+    return urlsafe_b64encode(json.dumps(token).encode('ascii')).decode('ascii')
+
+
+def decode_token(encoded):
+    # Raises ValueError for anything that is not a token.
+    try:
+        token = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+        return decode_position(token['c']), decode_position(token['d'])
+    except (TypeError, KeyError, AttributeError, UnicodeEncodeError) as exc:
+        raise ValueError(encoded) from exc
+
+
+class DeltaSyncView(generics.GenericAPIView):
+    # Subclasses scope get_queryset() to the requesting patient and name the
+    # tombstone kind of their model.
+    tombstone_kind = None
+    token_query_param = 'since'
+    invalid_token_message = 'Invalid sync token'
+
+    def get_tombstones(self):
+        return Tombstone.objects.filter(patient_id=self.request.user.id, kind=self.tombstone_kind)
+
+    def get_token(self):
+        encoded = self.request.query_params.get(self.token_query_param)
+        if encoded is None:
+            return None, None
+        try:
+            return decode_token(encoded)
+        except ValueError:
+            raise NotFound(self.invalid_token_message)
+
+    def after(self, queryset, ordering, position):
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(KeysetPagination().keyset_filter(ordering, position))
+        return queryset
+
+    def get(self, request, *args, **kwargs):
+        size = self.paginator.get_page_size(request)
+        now = timezone.now()
+        horizon = (now - datetime.timedelta(seconds=settings.GPCARE_SYNC_WINDOW), 0)
+        changes, deletions = self.get_token()
+
+        reset = deletions is None or deletions[0] < now - datetime.timedelta(days=settings.GPCARE_SYNC_RETENTION_DAYS)
+        if reset:
+            # The rows are sent in full, so only later deletions matter.
+            changes, deletions, deleted = None, horizon, []
+        else:
+            # A row that came back to the patient is live, whatever its
+            # tombstone says.
+            tombstones = self.after(self.get_tombstones(), DELETIONS, deletions).exclude(
+                object_id__in=self.get_queryset().values('pk'),
+            )
+            deleted = list(tombstones.values_list('deleted', 'id', 'object_id')[:size + 1])
+        rows = list(self.after(self.get_queryset(), CHANGES, changes)[:size + 1])
+
+        more = len(rows) > size or len(deleted) > size
+        rows, deleted = rows[:size], deleted[:size]
+        if rows:
+            changes = rows[-1].updated, rows[-1].pk
+        if deleted:
+            deletions = deleted[-1][:2]
+        if not more:
+            # Every tombstone up to now was sent, so the position moves to
+            # the horizon even if there were none; otherwise a patient who
+            # never deletes anything would age into a reset.
+            changes = changes and min(changes, horizon)
+            deletions = horizon
+        return Response({
+            'results': self.get_serializer(rows, many=True).data,
+            'deleted': [object_id for _, _, object_id in deleted],
+            'sync_token': encode_token(changes, deletions),
+            'more': more,
+            'reset': reset,
+        })
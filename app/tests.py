@@ -1,3 +1,1451 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from base64 import urlsafe_b64encode
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.transaction import TransactionManagementError
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from . import hashing, jobs, metrics, occupancy, querywatch
+from .authentication import active_users
+from .availability import free_intervals, to_time
+from .serializers import DoctorSerializer
+from .views import ExportView
+from .models import (
+    Doctor, DoctorRating, DoctorSearchTerm, Appointment, AppointmentSeries, DoctorDay, Review, Prescription, SeriesException,
+    Job, Tombstone,
+)
+from .notifications import scan_reminders
+from .recurrence import common_days
+from .sync import decode_token, encode_token
+
+UserModel = get_user_model()
 
 # Create your tests here.
+
+DAY = datetime.date(2030, 1, 7)
+
+
+def make_doctor(username, **extra):
+    user = UserModel.objects.create_user(username=username, **extra)
+    return Doctor.objects.create(user=user, specialization='GP', hospital='General', phone_number='000')
+
+
+def make_appointment(doctor, patient, start, end, date=DAY):
+    appointment = Appointment(doctor=doctor, patient=patient, date=date, start_time=start, end_time=end)
+    appointment.save()
+    return appointment
+
+
+def make_series(doctor, patient, start, end, start_date=DAY, weeks=8, interval=AppointmentSeries.WEEKLY):
+    series = AppointmentSeries(
+        doctor=doctor, patient=patient, start_date=start_date, until=start_date + datetime.timedelta(weeks=weeks - 1),
+        start_time=start, end_time=end, interval=interval,
+    )
+    series.save()
+    return series
+
+
+class AppointmentOverlapTests(TestCase):
+    def setUp(self):
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        self.doctor = make_doctor('doctor')
+        self.other_doctor = make_doctor('other')
+        make_appointment(self.doctor, self.patient, datetime.time(9), datetime.time(10))
+
+    def test_overlap_with_same_doctor_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            make_appointment(self.doctor, self.patient, datetime.time(9, 30), datetime.time(10, 30))
+
+    def test_other_doctors_schedule_is_ignored(self):
+        make_appointment(self.other_doctor, self.patient, datetime.time(9), datetime.time(10))
+
+    def test_adjacent_slot_is_allowed(self):
+        make_appointment(self.doctor, self.patient, datetime.time(10), datetime.time(11))
+
+    def test_rescheduling_ignores_itself(self):
+        appointment = Appointment.objects.get()
+        appointment.end_time = datetime.time(10, 15)
+        appointment.save()
+
+    def test_booking_takes_the_doctor_day_lock(self):
+        make_appointment(self.doctor, self.patient, datetime.time(11), datetime.time(12))
+        day = DoctorDay.objects.get(doctor=self.doctor, date=DAY)
+        self.assertEqual(day.version, 2)
+
+
+def overlap_queries(captured):
+    # Stored appointments only; the recurring series check is a separate query.
+    return [q for q in captured.captured_queries if '"start_time" <' in q['sql'] and 'FROM "app_appointment"' in q['sql']]
+
+
+class AppointmentWriteTests(APITestCase):
+    def setUp(self):
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        self.doctor = make_doctor('doctor')
+        self.client.force_authenticate(self.patient)
+
+    def book(self, start, end):
+        return self.client.post('/appointment/', {
+            'doctor': self.doctor.pk, 'date': DAY, 'start_time': start, 'end_time': end,
+        })
+
+    def test_create_on_free_slots_skips_the_overlap_query(self):
+        self.book('09:00', '10:00')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.book('10:00', '11:00')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(overlap_queries(captured)), 0)
+
+    def test_shared_slot_falls_back_to_one_overlap_query(self):
+        self.book('09:00', '09:02')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.book('09:03', '09:30')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(overlap_queries(captured)), 1)
+
+    def test_update_runs_one_overlap_query(self):
+        appointment = make_appointment(self.doctor, self.patient, datetime.time(9), datetime.time(10))
+        self.client.force_authenticate(UserModel.objects.create_superuser(username='admin', password='pass12345'))
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.patch(f'/appointment/{appointment.pk}', {'end_time': '10:30'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(overlap_queries(captured)), 1)
+
+    def test_overlap_is_reported_as_400(self):
+        self.book('09:00', '10:00')
+        response = self.book('09:30', '10:30')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.data)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_end_before_start_is_rejected(self):
+        response = self.book('10:00', '09:00')
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_requires_every_field(self):
+        response = self.client.post('/appointment/', {})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'doctor', 'date', 'start_time', 'end_time'})
+
+    def test_create_without_doctor_is_rejected(self):
+        response = self.client.post('/appointment/', {'date': DAY, 'start_time': '09:00', 'end_time': '10:00'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.data), ['doctor'])
+        self.assertFalse(DoctorDay.objects.exists())
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        doctor = make_doctor('doctor')
+        self.appointments = [
+            make_appointment(doctor, self.patient, datetime.time(8 + hour), datetime.time(8 + hour, 30))
+            for hour in range(5)
+        ]
+        self.client.force_authenticate(self.patient)
+
+    def start_times(self, response):
+        return [row['start_time'] for row in response.data['results']]
+
+    def test_walks_forward_and_back(self):
+        first = self.client.get('/appointment/', {'page_size': 2})
+        self.assertEqual(self.start_times(first), ['08:00:00', '09:00:00'])
+        self.assertIsNone(first.data['previous'])
+
+        second = self.client.get(first.data['next'])
+        self.assertEqual(self.start_times(second), ['10:00:00', '11:00:00'])
+
+        third = self.client.get(second.data['next'])
+        self.assertEqual(self.start_times(third), ['12:00:00'])
+        self.assertIsNone(third.data['next'])
+
+        back = self.client.get(third.data['previous'])
+        self.assertEqual(self.start_times(back), ['10:00:00', '11:00:00'])
+
+    def test_page_size_is_capped(self):
+        response = self.client.get('/appointment/', {'page_size': 10000})
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/appointment/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_with_invalid_values(self):
+        def cursor(values):
+            return urlsafe_b64encode(json.dumps({'v': values, 'r': 0}).encode('ascii')).decode('ascii')
+
+        for path, values in [
+            ('/appointment/', ['2030-01-01', '09:00', 'x']),
+            ('/appointment/', ['2030-13-01', '09:00', 1]),
+            ('/doctors/', ['garbage', 1]),
+            ('/doctors/', [None, 1]),
+            ('/my-prescriptions/', ['garbage', 1]),
+        ]:
+            with self.subTest(path=path, values=values):
+                response = self.client.get(path, {'cursor': cursor(values)})
+                self.assertEqual(response.status_code, 404)
+
+
+class QueryCountTests(APITestCase):
+    # Each endpoint must cost the same number of queries for one row and for many.
+
+    def setUp(self):
+        cache.clear()
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        self.doctor = make_doctor('doctor')
+        self.client.force_authenticate(self.patient)
+        self.rows = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.rows += 1
+            doctor = make_doctor(f'doctor-{self.rows}')
+            Review.objects.create(owner=self.patient, doctor=self.doctor, body='Good')
+            make_appointment(self.doctor, self.patient, datetime.time(0, self.rows), datetime.time(0, self.rows, 30))
+            Prescription.objects.create(patient=self.patient, doctor=doctor, medical_facility='General', rx='Rest')
+
+    def assertConstantQueries(self, url):
+        self.add_rows(1)
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.add_rows(4)
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(few), len(many), [q['sql'] for q in many.captured_queries])
+        return len(many)
+
+    def test_doctor_list(self):
+        self.assertEqual(self.assertConstantQueries('/doctors/'), 1)
+
+    def test_doctor_detail(self):
+        self.assertEqual(self.assertConstantQueries(f'/doctor/{self.doctor.pk}/'), 1)
+
+    def test_review_list(self):
+        self.assertEqual(self.assertConstantQueries('/post/review/'), 1)
+
+    def test_doctor_reviews(self):
+        self.assertEqual(self.assertConstantQueries(f'/doctor/{self.doctor.pk}/reviews/'), 1)
+
+    # Appointment lists also read the recurring series they merge in.
+    def test_appointment_list(self):
+        self.assertEqual(self.assertConstantQueries('/appointment/'), 2)
+
+    def test_doctor_appointments(self):
+        self.assertEqual(self.assertConstantQueries(f'/doctor/{self.doctor.pk}/appointment/'), 2)
+
+    def test_prescription_list(self):
+        self.assertEqual(self.assertConstantQueries('/prescription/'), 1)
+
+    def test_my_prescriptions(self):
+        self.assertEqual(self.assertConstantQueries('/my-prescriptions/'), 1)
+
+
+class DoctorDirectoryTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.house = make_doctor('ghouse', first_name='Gregory', last_name='House')
+        self.house.specialization = 'Diagnostics'
+        self.house.hospital = 'Princeton-Plainsboro'
+        self.house.save()
+        self.wilson = make_doctor('jwilson', first_name='James', last_name='Wilson')
+
+    def usernames(self, **params):
+        response = self.client.get('/doctors/', params)
+        return sorted(row['username'] for row in response.data['results'])
+
+    def test_filters(self):
+        self.assertEqual(self.usernames(specialization='Diagnostics'), ['ghouse'])
+        self.assertEqual(self.usernames(hospital='General'), ['jwilson'])
+        self.assertEqual(self.usernames(hospital='General', specialization='Diagnostics'), [])
+
+    def test_name_prefix_search(self):
+        self.assertEqual(self.usernames(search='gre'), ['ghouse'])
+        self.assertEqual(self.usernames(search='WIL'), ['jwilson'])
+        self.assertEqual(self.usernames(search='james wil'), ['jwilson'])
+        self.assertEqual(self.usernames(search='james house'), [])
+
+    def test_renaming_the_user_reindexes(self):
+        user = self.wilson.user
+        user.last_name = 'Cuddy'
+        user.save()
+        self.assertEqual(self.usernames(search='cud'), ['jwilson'])
+        self.assertEqual(self.usernames(search='wilson'), [])
+
+    def test_search_uses_the_term_index(self):
+        plan = DoctorSearchTerm.doctors_matching('gre').explain()
+        self.assertIn('doctor_search_term_idx', plan)
+
+
+class AvailabilityTests(APITestCase):
+    def setUp(self):
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        self.doctor = make_doctor('doctor')
+        make_appointment(self.doctor, self.patient, datetime.time(9), datetime.time(10))
+        make_appointment(self.doctor, self.patient, datetime.time(10), datetime.time(10, 45))
+        make_appointment(self.doctor, self.patient, datetime.time(13), datetime.time(14))
+
+    def test_free_intervals_merge_busy_time(self):
+        busy = [(0, 10), (5, 20), (20, 30), (40, 50), (90, 120)]
+        self.assertEqual(free_intervals(busy, 0, 100), [(30, 40), (50, 90)])
+
+    def test_doctor_day(self):
+        response = self.client.get(f'/doctor/{self.doctor.pk}/availability/', {
+            'from': DAY, 'to': DAY + datetime.timedelta(days=1), 'start': '09:00', 'end': '15:00', 'slot': 60,
+        })
+        self.assertEqual(response.status_code, 200)
+        first, second = response.data
+        self.assertEqual(first['free'], [
+            {'start': datetime.time(10, 45), 'end': datetime.time(13)},
+            {'start': datetime.time(14), 'end': datetime.time(15)},
+        ])
+        self.assertEqual(first['slots'], [datetime.time(10, 45), datetime.time(11, 45), datetime.time(14)])
+        self.assertEqual(len(second['slots']), 6)
+
+    def test_many_doctors_in_one_query(self):
+        other = make_doctor('other')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/availability/', {
+                'doctor': [self.doctor.pk, other.pk], 'from': DAY, 'to': DAY + datetime.timedelta(days=29),
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 60)
+        self.assertEqual(len(captured), 2)
+
+    def test_unknown_doctor(self):
+        response = self.client.get('/doctor/999/availability/', {'from': DAY, 'to': DAY})
+        self.assertEqual(response.status_code, 404)
+
+    def test_range_is_limited(self):
+        response = self.client.get(f'/doctor/{self.doctor.pk}/availability/', {
+            'from': DAY, 'to': DAY + datetime.timedelta(days=365),
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class OccupancyTests(APITestCase):
+    def setUp(self):
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        self.doctor = make_doctor('doctor')
+
+    def busy(self, date=DAY):
+        bits = DoctorDay.objects.filter(doctor=self.doctor, date=date).values_list('occupancy', flat=True).first()
+        return [(to_time(start), to_time(end)) for start, end in occupancy.busy_intervals(occupancy.load(bits))]
+
+    def test_busy_intervals_round_outwards(self):
+        bits = occupancy.mask(datetime.time(9), datetime.time(9, 30)) | occupancy.mask(datetime.time(10, 1), datetime.time(10, 7))
+        self.assertEqual(occupancy.busy_intervals(bits), [(32400, 34200), (36000, 36600)])
+        self.assertEqual(occupancy.busy_intervals(occupancy.mask(datetime.time(23, 55), datetime.time(23, 59, 59))), [(86100, 86400)])
+
+    def test_bookings_keep_the_bitmap_current(self):
+        first = make_appointment(self.doctor, self.patient, datetime.time(9), datetime.time(10))
+        make_appointment(self.doctor, self.patient, datetime.time(10), datetime.time(10, 30))
+        self.assertEqual(self.busy(), [(datetime.time(9), datetime.time(10, 30))])
+
+        first.start_time, first.end_time = datetime.time(11), datetime.time(11, 15)
+        first.save()
+        self.assertEqual(self.busy(), [(datetime.time(10), datetime.time(10, 30)), (datetime.time(11), datetime.time(11, 15))])
+        first.date = DAY + datetime.timedelta(days=1)
+        first.save()
+        self.assertEqual(self.busy(), [(datetime.time(10), datetime.time(10, 30))])
+        self.assertEqual(self.busy(first.date), [(datetime.time(11), datetime.time(11, 15))])
+
+        Appointment.objects.filter(patient=self.patient).delete()
+        self.assertEqual(self.busy(), [])
+        self.assertEqual(self.busy(first.date), [])
+
+    def test_series_and_exceptions_update_every_occurrence_day(self):
+        series = make_series(self.doctor, self.patient, datetime.time(9), datetime.time(10), weeks=3)
+        for week in range(3):
+            self.assertEqual(self.busy(DAY + datetime.timedelta(weeks=week)), [(datetime.time(9), datetime.time(10))])
+        SeriesException.objects.create(series=series, date=DAY + datetime.timedelta(weeks=1))
+        self.assertEqual(self.busy(DAY + datetime.timedelta(weeks=1)), [])
+        series.delete()
+        self.assertEqual(self.busy(DAY), [])
+        self.assertEqual(self.busy(DAY + datetime.timedelta(weeks=2)), [])
+
+    def test_bulk_reschedule_recomputes_both_days(self):
+        appointment = make_appointment(self.doctor, self.patient, datetime.time(9), datetime.time(10))
+        self.client.force_authenticate(UserModel.objects.create_superuser(username='admin', password='pass12345'))
+        response = self.client.post('/appointment/bulk/', [
+            {'id': appointment.pk, 'doctor': self.doctor.pk, 'date': str(DAY + datetime.timedelta(days=1)),
+             'start_time': '09:00', 'end_time': '10:00'},
+            {'patient': self.patient.pk, 'doctor': self.doctor.pk, 'date': str(DAY), 'start_time': '12:00', 'end_time': '12:30'},
+        ], format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.busy(), [(datetime.time(12), datetime.time(12, 30))])
+        self.assertEqual(self.busy(DAY + datetime.timedelta(days=1)), [(datetime.time(9), datetime.time(10))])
+
+    def test_rows_written_behind_the_models_back(self):
+        Appointment.objects.bulk_create([
+            Appointment(doctor=self.doctor, patient=self.patient, date=DAY, start_time=datetime.time(9), end_time=datetime.time(10)),
+        ])
+        # A day's first booking builds its row from the table.
+        with self.assertRaises(ValidationError):
+            make_appointment(self.doctor, self.patient, datetime.time(9, 30), datetime.time(10, 30))
+        Appointment.objects.bulk_create([
+            Appointment(doctor=self.doctor, patient=self.patient, date=DAY, start_time=datetime.time(14), end_time=datetime.time(15)),
+        ])
+        DoctorDay.objects.update(occupancy=occupancy.EMPTY)
+        out = io.StringIO()
+        call_command('rebuild_occupancy', stdout=out)
+        self.assertEqual(self.busy(), [(datetime.time(9), datetime.time(10)), (datetime.time(14), datetime.time(15))])
+        self.assertIn('Rebuilt 1 doctor-days', out.getvalue())
+
+
+class OccupancyTransactionTests(APITransactionTestCase):
+    # Runs in autocommit, with a second thread booking on its own connection.
+
+    def setUp(self):
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        self.doctor = make_doctor('doctor')
+        self.series = make_series(self.doctor, self.patient, datetime.time(9), datetime.time(10), weeks=2)
+
+    def test_rebuild_needs_a_transaction(self):
+        with self.assertRaises(TransactionManagementError):
+            SeriesException.objects.create(series=self.series, date=DAY)
+
+    def test_booking_during_an_exception_keeps_its_bits(self):
+        dump, booked = occupancy.dump, []
+
+        def book():
+            # A second client; the in-memory test database reports "locked"
+            # instead of waiting, so it retries.
+            from django.db import connection
+            try:
+                for _ in range(500):
+                    try:
+                        booked.append(make_appointment(self.doctor, self.patient, datetime.time(11), datetime.time(12)))
+                        return
+                    except OperationalError:
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        def interleave(value):
+            # Once the rebuild has read the day, book on it from elsewhere.
+            if threading.current_thread() is threading.main_thread() and not hasattr(interleave, 'thread'):
+                interleave.thread = threading.Thread(target=book)
+                interleave.thread.start()
+                interleave.thread.join(0.5)
+            return dump(value)
+
+        self.client.force_authenticate(self.patient)
+        with patch.object(occupancy, 'dump', interleave):
+            response = self.client.post(f'/appointment/series/{self.series.pk}/exceptions/', {'date': DAY})
+        interleave.thread.join()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(booked), 1)
+
+        bits = occupancy.load(DoctorDay.objects.get(doctor=self.doctor, date=DAY).occupancy)
+        self.assertEqual(occupancy.busy_intervals(bits), [(39600, 43200)])
+        with self.assertRaises(ValidationError):
+            make_appointment(self.doctor, self.patient, datetime.time(11, 15), datetime.time(11, 45))
+
+
+class AppointmentListTests(APITestCase):
+    def setUp(self):
+        active_users.clear()
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        other = UserModel.objects.create_user(username='other', password='pass12345')
+        self.doctor = make_doctor('doctor')
+        self.doctor.user.set_password('pass12345')
+        self.doctor.user.save()
+        self.other_doctor = make_doctor('other-doctor')
+        make_appointment(self.doctor, self.patient, datetime.time(9), datetime.time(10))
+        make_appointment(self.doctor, self.patient, datetime.time(9), datetime.time(10), date=DAY + datetime.timedelta(days=7))
+        make_appointment(self.doctor, other, datetime.time(11), datetime.time(12))
+        make_appointment(self.other_doctor, self.patient, datetime.time(11), datetime.time(12))
+        make_appointment(self.other_doctor, other, datetime.time(9), datetime.time(10), date=datetime.date(2000, 1, 3))
+
+    def login(self, username):
+        response = self.client.post('/auth/login/token/', {'username': username, 'password': 'pass12345'})
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+
+    def rows(self, **params):
+        response = self.client.get('/appointment/', params)
+        self.assertEqual(response.status_code, 200)
+        return [(row['date'], row['start_time'], row['doctor']) for row in response.data['results']]
+
+    def test_patients_see_their_own(self):
+        self.login('patient')
+        self.assertEqual(self.rows(), [
+            (str(DAY), '09:00:00', self.doctor.pk),
+            (str(DAY), '11:00:00', self.other_doctor.pk),
+            (str(DAY + datetime.timedelta(days=7)), '09:00:00', self.doctor.pk),
+        ])
+
+    def test_doctors_see_their_schedule(self):
+        self.login('doctor')
+        self.assertEqual(self.rows(), [
+            (str(DAY), '09:00:00', self.doctor.pk),
+            (str(DAY), '11:00:00', self.doctor.pk),
+            (str(DAY + datetime.timedelta(days=7)), '09:00:00', self.doctor.pk),
+        ])
+
+    def test_staff_see_everything(self):
+        self.client.force_authenticate(UserModel.objects.create_superuser(username='admin', password='pass12345'))
+        self.assertEqual(len(self.rows()), 5)
+
+    def test_date_range_and_upcoming(self):
+        self.login('patient')
+        self.assertEqual(len(self.rows(**{'from': DAY, 'to': DAY})), 2)
+        self.assertEqual(len(self.rows(**{'from': DAY + datetime.timedelta(days=1)})), 1)
+        self.login('other')
+        self.assertEqual(len(self.rows()), 2)
+        self.assertEqual(self.rows(upcoming=1), [(str(DAY), '11:00:00', self.doctor.pk)])
+
+    def test_invalid_range(self):
+        self.login('patient')
+        response = self.client.get('/appointment/', {'from': DAY, 'to': DAY - datetime.timedelta(days=1)})
+        self.assertEqual(response.status_code, 400)
+
+
+class AppointmentSeriesTests(APITestCase):
+    def setUp(self):
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        self.doctor = make_doctor('doctor')
+        self.client.force_authenticate(self.patient)
+
+    def book_series(self, start_date, start, end, weeks=8, interval=1):
+        return self.client.post('/appointment/series/', {
+            'doctor': self.doctor.pk, 'start_date': start_date, 'interval': interval,
+            'until': start_date + datetime.timedelta(weeks=weeks - 1), 'start_time': start, 'end_time': end,
+        })
+
+    def book(self, date, start, end):
+        return self.client.post('/appointment/', {'doctor': self.doctor.pk, 'date': date, 'start_time': start, 'end_time': end})
+
+    def test_common_days_match_listing_every_occurrence(self):
+        for a_start, a_period, b_start, b_period in [(0, 7, 14, 14), (3, 14, 10, 14), (0, 14, 7, 21), (5, 7, 1, 28)]:
+            expected = [day for day in range(20, 400) if day >= a_start and day >= b_start
+                        and (day - a_start) % a_period == 0 and (day - b_start) % b_period == 0]
+            self.assertEqual(list(common_days(a_start, a_period, b_start, b_period, 20, 399)), expected)
+
+    def test_single_bookings_respect_series_and_exceptions(self):
+        response = self.book_series(DAY, '09:00', '09:30', interval=AppointmentSeries.BIWEEKLY)
+        self.assertEqual(response.status_code, 201, response.data)
+        series = AppointmentSeries.objects.get()
+        self.assertEqual(self.book(DAY + datetime.timedelta(weeks=2), '09:15', '09:45').status_code, 400)
+        # Off weeks of a biweekly series are free.
+        self.assertEqual(self.book(DAY + datetime.timedelta(weeks=1), '09:15', '09:45').status_code, 201)
+
+        response = self.client.post(f'/appointment/series/{series.pk}/exceptions/', {'date': DAY + datetime.timedelta(weeks=4)})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.book(DAY + datetime.timedelta(weeks=4), '09:00', '09:30').status_code, 201)
+        response = self.client.post(f'/appointment/series/{series.pk}/exceptions/', {'date': DAY + datetime.timedelta(days=1)})
+        self.assertEqual(response.status_code, 400)
+
+    def test_series_overlap_is_checked_without_expanding(self):
+        make_appointment(self.doctor, self.patient, datetime.time(11), datetime.time(12), date=DAY + datetime.timedelta(weeks=3))
+        self.assertEqual(self.book_series(DAY, '09:00', '10:00', weeks=52).status_code, 201)
+        # Every other week of a weekly series still meets a biweekly one.
+        self.assertEqual(self.book_series(DAY + datetime.timedelta(weeks=1), '09:30', '10:30', interval=2).status_code, 400)
+        # Two biweekly series on alternate weeks share no day.
+        self.assertEqual(self.book_series(DAY, '13:00', '14:00', interval=2).status_code, 201)
+        self.assertEqual(self.book_series(DAY + datetime.timedelta(weeks=1), '13:00', '14:00', interval=2).status_code, 201)
+        self.assertEqual(self.book_series(DAY + datetime.timedelta(weeks=3), '13:30', '14:30', interval=2).status_code, 400)
+        # A stored appointment on an occurrence date blocks the series.
+        self.assertEqual(self.book_series(DAY, '11:30', '12:30').status_code, 400)
+        self.assertEqual(AppointmentSeries.objects.count(), 3)
+
+    def test_bulk_booking_sees_series(self):
+        make_series(self.doctor, self.patient, datetime.time(9), datetime.time(10))
+        self.client.force_authenticate(UserModel.objects.create_superuser(username='admin', password='pass12345'))
+        response = self.client.post('/appointment/bulk/', [
+            {'patient': self.patient.pk, 'doctor': self.doctor.pk, 'date': DAY + datetime.timedelta(weeks=1),
+             'start_time': '09:30', 'end_time': '10:30'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('recurring series', response.data[0]['non_field_errors'][0])
+
+    def test_lists_merge_stored_and_virtual_occurrences(self):
+        series = make_series(self.doctor, self.patient, datetime.time(9), datetime.time(10), weeks=4)
+        SeriesException.objects.create(series=series, date=DAY + datetime.timedelta(weeks=1))
+        for week in range(4):
+            make_appointment(self.doctor, self.patient, datetime.time(11), datetime.time(12), date=DAY + datetime.timedelta(weeks=week))
+        expected = [
+            (DAY, '09:00:00', series.pk), (DAY, '11:00:00', None), (DAY + datetime.timedelta(weeks=1), '11:00:00', None),
+            (DAY + datetime.timedelta(weeks=2), '09:00:00', series.pk), (DAY + datetime.timedelta(weeks=2), '11:00:00', None),
+            (DAY + datetime.timedelta(weeks=3), '09:00:00', series.pk), (DAY + datetime.timedelta(weeks=3), '11:00:00', None),
+        ]
+        for url in ('/appointment/', f'/doctor/{self.doctor.pk}/appointment/'):
+            seen, next_url = [], f'{url}?page_size=2'
+            while next_url:
+                response = self.client.get(next_url)
+                self.assertEqual(response.status_code, 200)
+                seen += [(datetime.date.fromisoformat(row['date']), row['start_time'], row['series']) for row in response.data['results']]
+                next_url = response.data['next']
+            self.assertEqual(seen, expected)
+
+            previous = self.client.get(response.data['previous'])
+            self.assertEqual([row['date'] for row in previous.data['results']], [str(date) for date, _, _ in expected[4:6]])
+            self.assertEqual([row['series'] for row in previous.data['results']], [None, series.pk])
+
+        response = self.client.get('/appointment/', {'from': DAY + datetime.timedelta(weeks=2), 'to': DAY + datetime.timedelta(weeks=2)})
+        self.assertEqual([row['series'] for row in response.data['results']], [series.pk, None])
+
+    def test_availability_counts_occurrences(self):
+        make_series(self.doctor, self.patient, datetime.time(9), datetime.time(10), interval=AppointmentSeries.BIWEEKLY)
+        response = self.client.get(f'/doctor/{self.doctor.pk}/availability/', {
+            'from': DAY, 'to': DAY + datetime.timedelta(weeks=1), 'start': '09:00', 'end': '11:00', 'slot': 60,
+        })
+        self.assertEqual(response.data[0]['slots'], [datetime.time(10)])
+        self.assertEqual(response.data[7]['slots'], [datetime.time(9), datetime.time(10)])
+
+    def test_series_are_scoped_to_the_patient(self):
+        series = make_series(self.doctor, self.patient, datetime.time(9), datetime.time(10))
+        self.client.force_authenticate(UserModel.objects.create_user(username='other', password='pass12345'))
+        self.assertEqual(self.client.get('/appointment/series/').data['results'], [])
+        self.assertEqual(self.client.get(f'/appointment/series/{series.pk}/').status_code, 404)
+        self.assertEqual(self.client.post(f'/appointment/series/{series.pk}/exceptions/', {'date': DAY}).status_code, 404)
+
+
+@override_settings(GPCARE_SYNC_WINDOW=0)
+class DeltaSyncTests(APITestCase):
+    def setUp(self):
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        self.other = UserModel.objects.create_user(username='other', password='pass12345')
+        self.doctor = make_doctor('doctor')
+        self.client.force_authenticate(self.patient)
+
+    def prescribe(self, patient=None):
+        return Prescription.objects.create(patient=patient or self.patient, doctor=self.doctor, medical_facility='General', rx='Rest')
+
+    def sync(self, url='/my-prescriptions/sync/', token=None, **params):
+        response = self.client.get(url, {**params, **({'since': token} if token else {})})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_first_sync_sends_everything(self):
+        first, second = self.prescribe(), self.prescribe()
+        self.prescribe(self.other)
+        data = self.sync()
+        self.assertTrue(data['reset'])
+        self.assertEqual([row['id'] for row in data['results']], [first.pk, second.pk])
+        self.assertEqual(data['deleted'], [])
+        self.assertFalse(data['more'])
+
+    def test_changes_and_deletions_since_the_token(self):
+        kept, changed, deleted = self.prescribe(), self.prescribe(), self.prescribe()
+        token = self.sync()['sync_token']
+        with CaptureQueriesContext(connection) as captured:
+            data = self.sync(token=token)
+        self.assertEqual((data['results'], data['deleted'], data['reset']), ([], [], False))
+        self.assertEqual(len(captured), 2)
+
+        changed.rx = 'Rest and fluids'
+        changed.save()
+        deleted_id = deleted.pk
+        deleted.delete()
+        added = self.prescribe()
+        data = self.sync(token=data['sync_token'])
+        self.assertEqual([row['id'] for row in data['results']], [changed.pk, added.pk])
+        self.assertEqual(data['deleted'], [deleted_id])
+        self.assertNotIn(kept.pk, [row['id'] for row in data['results']])
+        data = self.sync(token=data['sync_token'])
+        self.assertEqual((data['results'], data['deleted']), ([], []))
+
+    def test_pages_until_caught_up(self):
+        ids = [self.prescribe().pk for _ in range(5)]
+        token, seen = None, []
+        while True:
+            data = self.sync(token=token, page_size=2)
+            seen += [row['id'] for row in data['results']]
+            token = data['sync_token']
+            if not data['more']:
+                break
+        self.assertEqual(seen, ids)
+
+    @override_settings(GPCARE_SYNC_WINDOW=60)
+    def test_recent_changes_are_sent_again(self):
+        prescription = self.prescribe()
+        data = self.sync()
+        data = self.sync(token=data['sync_token'])
+        self.assertEqual([row['id'] for row in data['results']], [prescription.pk])
+
+    def test_old_and_invalid_tokens(self):
+        self.prescribe()
+        stale = timezone.now() - datetime.timedelta(days=31)
+        data = self.sync(token=encode_token((stale, 0), (stale, 0)))
+        self.assertTrue(data['reset'])
+        self.assertEqual(len(data['results']), 1)
+        response = self.client.get('/my-prescriptions/sync/', {'since': 'not-a-token'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_regular_polls_never_reset(self):
+        self.prescribe()
+        token = self.sync()['sync_token']
+        for days in (10, 20, 31, 45):
+            with patch('django.utils.timezone.now', return_value=timezone.now() + datetime.timedelta(days=days)):
+                data = self.sync(token=token)
+            self.assertFalse(data['reset'], days)
+            self.assertEqual(data['results'], [])
+            token = data['sync_token']
+
+    def test_appointments_moved_between_patients(self):
+        appointment = make_appointment(self.doctor, self.patient, datetime.time(9), datetime.time(10))
+        token = self.sync('/appointment/sync/')['sync_token']
+        self.client.force_authenticate(self.other)
+        other_token = self.sync('/appointment/sync/')['sync_token']
+
+        self.client.force_authenticate(UserModel.objects.create_superuser(username='admin', password='pass12345'))
+        response = self.client.post('/appointment/bulk/', [
+            {'id': appointment.pk, 'patient': self.other.pk, 'doctor': self.doctor.pk, 'date': str(DAY),
+             'start_time': '09:00', 'end_time': '10:00'},
+        ], format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        self.client.force_authenticate(self.patient)
+        data = self.sync('/appointment/sync/', token)
+        self.assertEqual((data['results'], data['deleted']), ([], [appointment.pk]))
+        self.client.force_authenticate(self.other)
+        data = self.sync('/appointment/sync/', other_token)
+        self.assertEqual(([row['id'] for row in data['results']], data['deleted']), ([appointment.pk], []))
+
+    def test_deleted_appointments_leave_tombstones(self):
+        appointment = make_appointment(self.doctor, self.patient, datetime.time(9), datetime.time(10))
+        token = self.sync('/appointment/sync/')['sync_token']
+        self.assertEqual(decode_token(token)[0][1], appointment.pk)
+        self.patient.delete()
+        self.assertTrue(Tombstone.objects.filter(kind=Tombstone.APPOINTMENT, object_id=appointment.pk).exists())
+        out = io.StringIO()
+        with override_settings(GPCARE_SYNC_RETENTION_DAYS=0):
+            call_command('prune_tombstones', stdout=out)
+        self.assertFalse(Tombstone.objects.exists())
+
+
+class JobQueueTests(APITestCase):
+    def setUp(self):
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345', email='patient@example.com')
+        self.doctor = make_doctor('doctor')
+        self.client.force_authenticate(self.patient)
+
+    def work(self):
+        out = io.StringIO()
+        call_command('run_jobs', '--once', '--scan-interval', '0', '--worker', 'test', stdout=out)
+        return out.getvalue()
+
+    def test_booking_is_confirmed_by_the_worker(self):
+        response = self.client.post('/appointment/', {'doctor': self.doctor.pk, 'date': DAY, 'start_time': '09:00', 'end_time': '10:00'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(mail.outbox, [])
+        self.assertIn('Ran 1 jobs.', self.work())
+        self.assertEqual([message.subject for message in mail.outbox], ['Appointment confirmed'])
+        self.assertIn(f'{DAY} at 09:00', mail.outbox[0].body)
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_rejected_writes_queue_nothing(self):
+        make_appointment(self.doctor, self.patient, datetime.time(9), datetime.time(10))
+        Job.objects.all().delete()
+        response = self.client.post('/appointment/', {'doctor': self.doctor.pk, 'date': DAY, 'start_time': '09:30', 'end_time': '10:30'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Job.objects.exists())
+
+    def test_changes_deletions_and_prescriptions_notify(self):
+        appointment = make_appointment(self.doctor, self.patient, datetime.time(9), datetime.time(10))
+        appointment.start_time = datetime.time(11)
+        appointment.end_time = datetime.time(12)
+        appointment.save()
+        Prescription.objects.create(patient=self.patient, doctor=self.doctor, medical_facility='General', rx='Rest')
+        self.work()
+        self.assertEqual([message.subject for message in mail.outbox], ['Appointment confirmed', 'Appointment changed', 'New prescription'])
+        # Jobs re-read their rows, so both messages give the current time.
+        self.assertIn('11:00', mail.outbox[0].body)
+
+        mail.outbox.clear()
+        appointment.save()
+        self.client.force_authenticate(UserModel.objects.create_superuser(username='admin', password='pass12345'))
+        self.assertEqual(self.client.delete(f'/appointment/{appointment.pk}').status_code, 200)
+        self.work()
+        # The change queued before the deletion has nothing left to report.
+        self.assertEqual([message.subject for message in mail.outbox], ['Appointment cancelled'])
+        self.assertIn(f'{DAY} at 11:00', mail.outbox[0].body)
+
+    def test_bulk_bookings_are_confirmed(self):
+        self.client.force_authenticate(UserModel.objects.create_superuser(username='admin', password='pass12345'))
+        response = self.client.post('/appointment/bulk/', [
+            {'patient': self.patient.pk, 'doctor': self.doctor.pk, 'date': str(DAY), 'start_time': f'{hour}:00', 'end_time': f'{hour}:30'}
+            for hour in (9, 10)
+        ], format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(list(Job.objects.values_list('name', flat=True)), ['appointment_booked'] * 2)
+
+    @override_settings(GPCARE_JOB_BACKOFF=10)
+    def test_failures_retry_with_backoff(self):
+        calls = []
+
+        @jobs.task(max_attempts=2)
+        def flaky():
+            calls.append(1)
+            raise RuntimeError('mail server down')
+
+        try:
+            jobs.enqueue('flaky')
+            with self.assertLogs('gpcare.jobs', 'WARNING'):
+                self.assertEqual(jobs.run_due('test'), 1)
+            job = Job.objects.get()
+            self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+            self.assertIn('mail server down', job.last_error)
+            self.assertAlmostEqual((job.run_at - timezone.now()).total_seconds(), 10, delta=2)
+            # Not due yet.
+            self.assertEqual(jobs.run_due('test'), 0)
+            Job.objects.update(run_at=timezone.now())
+            with self.assertLogs('gpcare.jobs', 'ERROR'):
+                jobs.run_due('test')
+            self.assertEqual(Job.objects.get().status, Job.FAILED)
+            self.assertEqual(len(calls), 2)
+        finally:
+            del jobs.TASKS['flaky']
+
+    def test_expired_leases_are_claimed_again(self):
+        Prescription.objects.create(patient=self.patient, doctor=self.doctor, medical_facility='General', rx='Rest')
+        Job.objects.update(status=Job.RUNNING, locked_by='dead', locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(jobs.run_due('test'), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        Job.objects.update(status=Job.RUNNING, locked_by='busy', locked_until=timezone.now() + datetime.timedelta(minutes=5))
+        self.assertEqual(jobs.run_due('test'), 0)
+
+    def test_reminder_scan_queues_each_appointment_once(self):
+        now = timezone.make_aware(datetime.datetime.combine(DAY, datetime.time(12)))
+        appointment = make_appointment(self.doctor, self.patient, datetime.time(14), datetime.time(14, 30))
+        make_appointment(self.doctor, self.patient, datetime.time(11), datetime.time(11, 30))
+        make_appointment(self.doctor, self.patient, datetime.time(12, 30), datetime.time(13), date=DAY + datetime.timedelta(days=1))
+        make_series(self.doctor, self.patient, datetime.time(23), datetime.time(23, 30), start_date=DAY - datetime.timedelta(weeks=1), weeks=3)
+        Job.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as captured:
+            scan_reminders(now)
+        self.assertIn('"app_appointment"."date" BETWEEN', captured.captured_queries[0]['sql'])
+        scan_reminders(now + datetime.timedelta(minutes=5))
+        reminders = Job.objects.order_by('name')
+        self.assertEqual([job.name for job in reminders], ['appointment_reminder', 'series_reminder'])
+        self.assertEqual(reminders[0].payload['appointment'], appointment.pk)
+        self.assertEqual(reminders[1].payload['date'], str(DAY))
+
+        # A reminder for a time the appointment no longer has is dropped.
+        appointment.start_time, appointment.end_time = datetime.time(16), datetime.time(16, 30)
+        appointment.save()
+        self.work()
+        self.assertEqual([message.subject for message in mail.outbox].count('Appointment reminder'), 1)
+
+
+class BulkAppointmentTests(APITestCase):
+    def setUp(self):
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        self.doctor = make_doctor('doctor')
+        self.existing = make_appointment(self.doctor, self.patient, datetime.time(9), datetime.time(10))
+        self.client.force_authenticate(UserModel.objects.create_superuser(username='admin', password='pass12345'))
+
+    def item(self, start, end, **extra):
+        return {'patient': self.patient.pk, 'doctor': self.doctor.pk, 'date': DAY,
+                'start_time': start, 'end_time': end, **extra}
+
+    def post(self, items):
+        return self.client.post('/appointment/bulk/', items, format='json')
+
+    def test_creates_and_reschedules_in_one_batch(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.post([
+                self.item('10:00', '11:00'),
+                self.item('11:00', '12:00'),
+                {'id': self.existing.pk, 'doctor': self.doctor.pk, 'date': DAY, 'start_time': '12:00', 'end_time': '13:00'},
+                self.item('09:00', '10:00'),
+            ])
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Appointment.objects.count(), 4)
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.start_time, datetime.time(12))
+        self.assertEqual(len(overlap_queries(captured)), 0)
+        inserts = [q for q in captured.captured_queries if q['sql'].startswith('INSERT INTO "app_appointment"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_reports_conflicts_per_item(self):
+        response = self.post([
+            self.item('10:00', '11:00'),
+            self.item('09:30', '10:15'),
+            self.item('13:00', '14:00'),
+            self.item('15:00', '14:00'),
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(response.data[2], {})
+        self.assertIn('non_field_errors', response.data[3])
+
+        response = self.post([self.item('10:00', '11:00'), self.item('09:30', '10:15'), self.item('13:00', '14:00')])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('item 1', response.data[0]['non_field_errors'][0])
+        self.assertEqual(len(response.data[1]['non_field_errors']), 2)
+        self.assertEqual(response.data[2], {})
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_unknown_references(self):
+        response = self.post([self.item('10:00', '11:00', doctor=999), {'id': 999, 'doctor': self.doctor.pk,
+                              'date': DAY, 'start_time': '12:00', 'end_time': '13:00'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('doctor', response.data[0])
+        self.assertIn('id', response.data[1])
+
+    def test_admin_only(self):
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.post([self.item('10:00', '11:00')]).status_code, 403)
+
+
+class DoctorRatingTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        self.doctor = make_doctor('doctor')
+        self.other = make_doctor('other')
+        self.client.force_authenticate(self.patient)
+
+    def review(self, rating, doctor=None):
+        response = self.client.post('/post/review/', {'body': 'Fine', 'rating': rating, 'doctor': (doctor or self.doctor).pk})
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def rating(self, doctor=None):
+        return DoctorRating.objects.get(doctor=doctor or self.doctor)
+
+    def test_aggregates_follow_review_changes(self):
+        first = self.review(5)
+        self.review(2)
+        rating = self.rating()
+        self.assertEqual((rating.count, rating.total, rating.average), (2, 7, 3.5))
+        self.assertEqual(rating.histogram, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1})
+
+        self.client.patch(f'/review/{first}/', {'rating': 4})
+        self.assertEqual(self.rating().histogram, {1: 0, 2: 1, 3: 0, 4: 1, 5: 0})
+
+        self.client.patch(f'/review/{first}/', {'doctor': self.other.pk})
+        self.assertEqual((self.rating().count, self.rating(self.other).count), (1, 1))
+
+        self.client.delete(f'/review/{first}/')
+        self.assertEqual(self.rating(self.other).count, 0)
+        self.assertIsNone(self.rating(self.other).average)
+
+    def test_rating_is_required_and_bounded(self):
+        for rating in ('', 0, 6):
+            response = self.client.post('/post/review/', {'body': 'Fine', 'rating': rating, 'doctor': self.doctor.pk})
+            self.assertEqual(response.status_code, 400)
+
+    def test_directory_shows_ratings_without_reading_reviews(self):
+        self.review(4)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(f'/doctor/{self.doctor.pk}/')
+        self.assertEqual(response.data['rating'], {'count': 1, 'average': 4.0, 'histogram': {'1': 0, '2': 0, '3': 0, '4': 1, '5': 0}})
+        self.assertFalse(any('app_review' in q['sql'] for q in captured.captured_queries))
+
+    def test_deleting_a_reviewed_doctor(self):
+        self.review(3)
+        self.doctor.delete()
+        self.assertFalse(DoctorRating.objects.filter(doctor_id=self.doctor.pk).exists())
+
+
+@override_settings(GPCARE_CACHE_VALIDATORS=True)
+class DoctorCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        self.doctor = make_doctor('doctor', first_name='Gregory')
+        self.urls = ['/doctors/', f'/doctor/{self.doctor.pk}/', f'/doctor/{self.doctor.pk}/reviews/']
+
+    def test_repeat_reads_skip_the_database(self):
+        for url in self.urls:
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(first.data, second.data)
+            self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_conditional_get_returns_304(self):
+        for url in self.urls:
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+    def test_changes_invalidate(self):
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        self.doctor.user.first_name = 'Greg'
+        self.doctor.user.save()
+        self.assertEqual(self.client.get('/doctors/').data['results'][0]['first_name'], 'Greg')
+        self.assertEqual(self.client.get(self.urls[1]).data['first_name'], 'Greg')
+        self.assertEqual(self.client.get(self.urls[2])['ETag'], etags[self.urls[2]])
+
+        Review.objects.create(owner=self.patient, doctor=self.doctor, body='Good', rating=5)
+        self.assertEqual(self.client.get(self.urls[1]).data['rating']['count'], 1)
+        self.assertEqual(len(self.client.get(self.urls[2]).data['results']), 1)
+
+        self.patient.username = 'renamed'
+        self.patient.save()
+        self.assertEqual(self.client.get(self.urls[2]).data['results'][0]['owner'], 'renamed')
+
+    def test_other_doctors_stay_cached(self):
+        self.client.get(self.urls[1])
+        make_doctor('other')
+        with self.assertNumQueries(0):
+            self.client.get(self.urls[1])
+
+    @override_settings(GPCARE_CACHE_VALIDATORS=False)
+    def test_no_validators_without_a_shared_cache(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertNotIn('ETag', response)
+            self.assertNotIn('Last-Modified', response)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='*').status_code, 200)
+
+
+class ClaimsAuthenticationTests(APITestCase):
+    def setUp(self):
+        active_users.clear()
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        self.admin = UserModel.objects.create_superuser(username='admin', password='pass12345')
+
+    def login(self, username):
+        response = self.client.post('/auth/login/token/', {'username': username, 'password': 'pass12345'})
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+
+    def test_authenticated_reads_skip_the_user_lookup(self):
+        self.login('patient')
+        self.client.get('/my-prescriptions/')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/my-prescriptions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(captured), 1)
+        self.assertIn('FROM "app_prescription"', captured[0]['sql'])
+
+    def test_claims_drive_permissions(self):
+        self.login('patient')
+        self.assertEqual(self.client.post('/appointment/bulk/', [], format='json').status_code, 403)
+        self.login('admin')
+        self.assertEqual(self.client.post('/appointment/bulk/', [], format='json').status_code, 201)
+
+    def test_deactivated_users_are_rejected(self):
+        self.login('patient')
+        self.assertEqual(self.client.get('/my-prescriptions/').status_code, 200)
+        self.patient.is_active = False
+        self.patient.save()
+        self.assertEqual(self.client.get('/my-prescriptions/').status_code, 401)
+
+    def test_writes_use_the_token_user_id(self):
+        self.login('patient')
+        doctor = make_doctor('doctor')
+        response = self.client.post('/appointment/', {
+            'doctor': doctor.pk, 'date': DAY, 'start_time': '09:00', 'end_time': '10:00',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Appointment.objects.get().patient, self.patient)
+        self.assertEqual(self.client.get('/profile/').data['username'], 'patient')
+
+
+class PasswordHashingTests(APITestCase):
+    def setUp(self):
+        active_users.clear()
+
+    def test_register_and_login(self):
+        response = self.client.post('/auth/register/', {'username': 'new', 'password': 'pass12345', 'email': 'New@EXAMPLE.com'})
+        self.assertEqual(response.status_code, 201)
+        user = UserModel.objects.get(username='new')
+        self.assertTrue(user.check_password('pass12345'))
+        self.assertEqual(user.email, 'New@example.com')
+        self.assertEqual(self.client.post('/auth/login/token/', {'username': 'new', 'password': 'nope'}).status_code, 401)
+        self.assertEqual(self.client.post('/auth/login/token/', {'username': 'ghost', 'password': 'nope'}).status_code, 401)
+
+    @override_settings(GPCARE_PASSWORD_ITERATIONS=1000)
+    def test_login_rehashes_when_the_cost_changes(self):
+        user = UserModel.objects.create_user(username='patient', password='pass12345')
+        self.assertIn('$1000$', user.password)
+        with override_settings(GPCARE_PASSWORD_ITERATIONS=2000):
+            response = self.client.post('/auth/login/token/', {'username': 'patient', 'password': 'pass12345'})
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertIn('$2000$', user.password)
+
+    def test_password_change(self):
+        user = UserModel.objects.create_user(username='patient', password='pass12345')
+        self.client.force_authenticate(user)
+        response = self.client.put('/profile/password/', {'old_password': 'wrong', 'new_password': 'newpass123'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.put('/profile/password/', {'old_password': 'pass12345', 'new_password': 'newpass123'})
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('newpass123'))
+
+    @override_settings(GPCARE_HASHING_WORKERS=2)
+    def test_batch_holds_a_window_of_slots(self):
+        submit, futures, held = hashing._submit, [], []
+
+        def tracked(*args):
+            held.append(sum(not future.done() for future in futures))
+            futures.append(submit(*args))
+            return futures[-1]
+
+        with patch.object(hashing, '_submit', tracked):
+            passwords = hashing.make_passwords([f'pass{i}' for i in range(6)])
+        self.assertEqual(len(passwords), 6)
+        self.assertTrue(check_password('pass5', passwords[5]))
+        self.assertLessEqual(max(held), 1)
+
+
+class AsyncViewTests(APITestCase):
+    def setUp(self):
+        active_users.clear()
+        cache.clear()
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        self.doctor = make_doctor('doctor')
+        for hour in range(3):
+            make_appointment(self.doctor, self.patient, datetime.time(9 + hour), datetime.time(9 + hour, 30))
+        Prescription.objects.create(patient=self.patient, doctor=self.doctor, medical_facility='General', rx='Rest')
+        token = self.client.post('/auth/login/token/', {'username': 'patient', 'password': 'pass12345'}).data['access']
+        self.headers = {'Authorization': f'Bearer {token}'}
+
+    async def test_matches_the_sync_views(self):
+        for url in ['/doctors/', '/appointment/?page_size=2', f'/doctor/{self.doctor.pk}/appointment/', '/my-prescriptions/']:
+            response = await self.async_client.get(url, headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.resolver_match.func.view_class.__module__, 'app.async_views')
+            sync_response = await sync_to_async(self.client.get)(url, headers=self.headers)
+            self.assertEqual(response.json(), sync_response.json())
+
+    @override_settings(GPCARE_CACHE_VALIDATORS=True)
+    async def test_shares_the_directory_cache(self):
+        etag = (await sync_to_async(self.client.get)('/doctors/'))['ETag']
+        response = await self.async_client.get('/doctors/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get('/doctors/')
+        self.assertEqual(response['ETag'], etag)
+
+    async def test_follows_cursor_links(self):
+        first = (await self.async_client.get('/appointment/?page_size=2', headers=self.headers)).json()
+        second = (await self.async_client.get(first['next'], headers=self.headers)).json()
+        self.assertEqual([row['start_time'] for row in second['results']], ['11:00:00'])
+
+    async def test_requires_authentication(self):
+        response = await self.async_client.get('/appointment/')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+        response = await self.async_client.get('/appointment/', headers={'Authorization': 'Bearer nonsense'})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_writes_go_to_the_sync_view(self):
+        response = await self.async_client.post('/appointment/', {
+            'doctor': self.doctor.pk, 'date': DAY, 'start_time': '13:00', 'end_time': '14:00',
+        }, headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(await Appointment.objects.acount(), 4)
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        self.doctor = make_doctor('doctor')
+        for hour in range(5):
+            make_appointment(self.doctor, self.patient, datetime.time(9 + hour), datetime.time(9 + hour, 30))
+        Prescription.objects.create(patient=self.patient, doctor=self.doctor, medical_facility='General', rx='Rest, "fluids"')
+        self.admin = UserModel.objects.create_superuser(username='admin', password='pass12345')
+
+    def test_streams_csv(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/export/prescriptions.csv')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], ['id', 'date', 'medical_facility', 'rx', 'patient', 'doctor'])
+        self.assertEqual(rows[1][3:], ['Rest, "fluids"', str(self.patient.pk), str(self.doctor.pk)])
+
+    def test_streams_ndjson_in_chunks(self):
+        self.client.force_authenticate(self.admin)
+        with patch.object(ExportView, 'chunk_size', 2):
+            response = self.client.get('/export/appointments.ndjson')
+            chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 4)
+        rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual([row['start_time'] for row in rows], ['09:00:00', '10:00:00', '11:00:00', '12:00:00', '13:00:00'])
+
+    def test_admin_only(self):
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.get('/export/appointments.csv').status_code, 403)
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get('/export/users.csv').status_code, 404)
+        self.assertEqual(self.client.get('/export/appointments.xml').status_code, 404)
+
+    async def test_async_view_streams_natively(self):
+        token = (await sync_to_async(self.client.post)(
+            '/auth/login/token/', {'username': 'admin', 'password': 'pass12345'},
+        )).data['access']
+        response = await self.async_client.get('/export/appointments.csv', headers={'Authorization': f'Bearer {token}'})
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(len(body.splitlines()), 6)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export', 'appointments', '--format', 'ndjson', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 5)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class DoctorImportTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        make_doctor('taken')
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def write_csv(self, rows):
+        path = os.path.join(self.dir, 'doctors.csv')
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['username', 'password', 'first_name', 'last_name', 'specialization', 'hospital', 'phone_number'])
+            writer.writerows(rows)
+        return path
+
+    def doctor_row(self, username, **extra):
+        return [username, 'secret', extra.get('first_name', 'Ann'), 'Lee', 'GP', 'General', '0123']
+
+    def test_imports_in_batches_and_skips_existing(self):
+        path = self.write_csv([
+            self.doctor_row('new-1'), self.doctor_row('taken'), self.doctor_row('new-2', first_name='Zed'),
+            self.doctor_row('new-1'), ['bad name!', 'secret', '', '', 'GP', 'General', '0123'],
+        ])
+        out, err = io.StringIO(), io.StringIO()
+        with CaptureQueriesContext(connection) as captured:
+            call_command('import_doctors', path, '--batch-size', '2', '--workers', '0', stdout=out, stderr=err)
+        self.assertIn('Created 2, skipped 2 existing, 1 invalid.', out.getvalue())
+        self.assertIn('row 5', err.getvalue())
+        # One lookup per batch; the last batch has no valid rows.
+        self.assertEqual(sum('"username" IN' in q['sql'] for q in captured.captured_queries), 2)
+
+        doctor = Doctor.objects.get(user__username='new-2')
+        self.assertTrue(doctor.user.check_password('secret'))
+        self.assertEqual(doctor.rating.count, 0)
+        self.assertEqual(self.client.get('/doctors/', {'search': 'ze'}).data['results'][0]['username'], 'new-2')
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+    def test_resumes_from_checkpoint(self):
+        path = self.write_csv([self.doctor_row(f'doctor-{i}') for i in range(4)])
+        with open(path + '.checkpoint', 'w') as f:
+            json.dump({'row': 2}, f)
+        call_command('import_doctors', path, '--workers', '0', stdout=io.StringIO())
+        self.assertEqual(
+            sorted(UserModel.objects.filter(username__startswith='doctor-').values_list('username', flat=True)),
+            ['doctor-2', 'doctor-3'],
+        )
+
+    def test_hashes_on_a_process_pool(self):
+        path = os.path.join(self.dir, 'patients.jsonl')
+        with open(path, 'w') as f:
+            f.write(json.dumps({'username': 'patient', 'password': 'secret'}) + '\n\nnot json\n')
+        err = io.StringIO()
+        call_command('import_patients', path, '--workers', '2', stdout=io.StringIO(), stderr=err)
+        self.assertTrue(UserModel.objects.get(username='patient').check_password('secret'))
+        self.assertIn('row 3', err.getvalue())
+
+    def test_bulk_endpoint(self):
+        rows = [
+            {'username': 'new', 'password': 'secret', 'specialization': 'GP', 'hospital': 'General', 'phone_number': '1'},
+            {'username': 'taken', 'password': 'secret', 'specialization': 'GP', 'hospital': 'General', 'phone_number': '1'},
+            {'username': 'incomplete', 'password': 'secret'},
+        ]
+        self.client.force_authenticate(UserModel.objects.create_user(username='patient', password='pass12345'))
+        self.assertEqual(self.client.post('/auth/register/doctor/bulk/', rows, format='json').status_code, 403)
+        self.client.force_authenticate(UserModel.objects.create_superuser(username='admin', password='pass12345'))
+        response = self.client.post('/auth/register/doctor/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['skipped'], ['taken'])
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+        self.assertIn('hospital', response.data['errors'][0]['errors'])
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        active_users.clear()
+        metrics.registry.clear()
+        self.patient = UserModel.objects.create_user(username='patient', password='pass12345')
+        doctor = make_doctor('doctor')
+        make_appointment(doctor, self.patient, datetime.time(9), datetime.time(10))
+        self.admin = UserModel.objects.create_superuser(username='admin', password='pass12345')
+
+    def scrape(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_records_per_route(self):
+        self.client.force_authenticate(self.patient)
+        response = self.client.get('/appointment/')
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="2 queries", ser;dur=[\d.]+$')
+        self.client.get('/doctor/999/')
+
+        text = self.scrape()
+        self.assertIn('gpcare_requests_total{route="appointment-list",method="GET",status="200"} 1', text)
+        self.assertIn('gpcare_requests_total{route="doctor-detail",method="GET",status="404"} 1', text)
+        self.assertIn('gpcare_db_queries_bucket{route="appointment-list",method="GET",le="2"} 1', text)
+        self.assertIn('gpcare_db_queries_bucket{route="appointment-list",method="GET",le="1"} 0', text)
+        serializer_time = re.search(r'gpcare_serializer_duration_seconds_sum\{route="appointment-list",method="GET"\} (\S+)', text)
+        self.assertGreater(float(serializer_time[1]), 0)
+        self.assertIn(f'gpcare_response_size_bytes_sum{{route="appointment-list",method="GET"}} {len(response.content)}', text)
+
+    def test_admin_only(self):
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+    async def test_counts_queries_in_async_views(self):
+        token = (await sync_to_async(self.client.post)(
+            '/auth/login/token/', {'username': 'patient', 'password': 'pass12345'},
+        )).data['access']
+        response = await self.async_client.get('/appointment/', headers={'Authorization': f'Bearer {token}'})
+        self.assertIn('desc="3 queries"', response['Server-Timing'])
+        text = await sync_to_async(self.scrape)()
+        self.assertIn('gpcare_db_queries_sum{route="appointment-list",method="GET"} 3', text)
+
+
+class NPlusOneTests(querywatch.QueryWatchTestMixin, APITestCase):
+    # Every GET endpoint, with several rows behind it, must not repeat a query shape.
+
+    def setUp(self):
+        cache.clear()
+        active_users.clear()
+        self.admin = UserModel.objects.create_superuser(username='admin', password='pass12345')
+        self.doctor = make_doctor('doctor')
+        for n in range(1, 5):
+            doctor = make_doctor(f'doctor-{n}')
+            Review.objects.create(owner=self.admin, doctor=self.doctor, body='Good', rating=n)
+            make_appointment(self.doctor, self.admin, datetime.time(n), datetime.time(n, 30))
+            Prescription.objects.create(patient=self.admin, doctor=doctor, medical_facility='General', rx='Rest')
+            series = make_series(doctor, self.admin, datetime.time(n), datetime.time(n, 30))
+            SeriesException.objects.create(series=series, date=series.start_date)
+        self.review = Review.objects.first()
+        self.appointment = Appointment.objects.first()
+        self.series = AppointmentSeries.objects.first()
+        self.client.force_authenticate(self.admin)
+
+    def get_urls(self):
+        day = {'from': DAY, 'to': DAY + datetime.timedelta(days=6)}
+        return {
+            'profile': ('/profile/', {}),
+            'doctor-list': ('/doctors/', {}),
+            'doctor-detail': (f'/doctor/{self.doctor.pk}/', {}),
+            'review-list-create': ('/post/review/', {}),
+            'review-detail': (f'/review/{self.review.pk}/', {}),
+            'doctor-reviews': (f'/doctor/{self.doctor.pk}/reviews/', {}),
+            'appointment-list': ('/appointment/', {}),
+            'appointment-detail': (f'/appointment/{self.appointment.pk}', {}),
+            'appointment-series-list': ('/appointment/series/', {}),
+            'appointment-series-detail': (f'/appointment/series/{self.series.pk}/', {}),
+            'doctor-appointments': (f'/doctor/{self.doctor.pk}/appointment/', {}),
+            'doctor-availability': (f'/doctor/{self.doctor.pk}/availability/', day),
+            'availability': ('/availability/', {**day, 'doctor': list(Doctor.objects.values_list('pk', flat=True))}),
+            'prescription-list': ('/prescription/', {}),
+            'my-prescriptions': ('/my-prescriptions/', {}),
+            'my-prescriptions-sync': ('/my-prescriptions/sync/', {}),
+            'appointment-sync': ('/appointment/sync/', {}),
+            'export': ('/export/appointments.csv', {}),
+            'metrics': ('/metrics/', {}),
+        }
+
+    def test_every_get_endpoint(self):
+        urls = self.get_urls()
+        for name, (url, params) in urls.items():
+            with self.subTest(name), self.assertNoNPlusOne():
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+
+    def test_covers_every_get_route(self):
+        from .urls import urlpatterns
+
+        routes = {pattern.name for pattern in urlpatterns if hasattr(pattern.callback.view_class, 'get')}
+        self.assertEqual(routes, set(self.get_urls()))
+
+    def test_reports_view_and_field(self):
+        with self.assertRaises(querywatch.NPlusOneDetected) as raised, self.assertNoNPlusOne():
+            DoctorSerializer(Doctor.objects.all(), many=True).data
+        self.assertIn('x SELECT "auth_user"', str(raised.exception))
+        self.assertIn('field DoctorSerializer.username', str(raised.exception))
+
+    def test_reports_slow_queries(self):
+        with self.assertRaises(querywatch.NPlusOneDetected) as raised, self.assertNoNPlusOne(slow_ms=0):
+            self.client.get('/appointment/')
+        self.assertIn('view AppointmentView', str(raised.exception))
+
+    @override_settings(GPCARE_QUERYWATCH='log', GPCARE_SLOW_QUERY_MS=0)
+    def test_middleware_logs(self):
+        with self.assertLogs('gpcare.querywatch', 'WARNING') as logs:
+            self.client.get('/doctors/')
+        self.assertIn('GET /doctors/', logs.output[0])
+        self.assertIn('view DoctorListView', logs.output[0])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BenchmarkSuiteTests(TestCase):
+    def test_every_route_succeeds(self):
+        from benchmarks import suite
+
+        cache.clear()
+        routes = suite.Routes(suite.Dataset(doctors=3, patients=3, appointments=10, reviews=5, prescriptions=5, series=3).seed())
+        self.assertEqual(suite.missing_routes(routes.all()), set())
+        report = suite.run_in_process(routes, 2)
+        for key, result in report.items():
+            self.assertEqual(result['errors'], 0, key)
+            self.assertIsNotNone(result['queries_per_request'], key)
+
+
+class IndexAuditTests(TestCase):
+    def test_no_view_scans_a_whole_table(self):
+        call_command('audit_indexes', verbosity=0)
+
+
+class SQLiteTuningTests(TestCase):
+    def test_connection_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 30000)
+
+    def test_journal_mode_is_set_once_per_database(self):
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_dict = {**connection.settings_dict, 'NAME': os.path.join(directory, 'db.sqlite3')}
+
+        def journal_mode(pragmas):
+            with override_settings(GPCARE_SQLITE_PRAGMAS=pragmas):
+                wrapper = DatabaseWrapper(settings_dict)
+                try:
+                    with wrapper.cursor() as cursor:
+                        cursor.execute('PRAGMA journal_mode')
+                        return cursor.fetchone()[0]
+                finally:
+                    wrapper.close()
+
+        self.assertEqual(journal_mode({'journal_mode': 'WAL'}), 'wal')
+        # Already set by this process, so not issued again.
+        self.assertEqual(journal_mode({'journal_mode': 'DELETE'}), 'wal')
@@ -10,11 +10,12 @@ from rest_framework_simplejwt.views import (
 urlpatterns = [
     path('auth/register/', views.CreateUserView.as_view(), name='register'),
     path('auth/register/doctor/', views.DoctorRegisterView.as_view(), name='doctor-register'),
+    path('auth/register/doctor/bulk/', views.DoctorBulkRegisterView.as_view(), name='doctor-bulk-register'),
     path('auth/login/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
 
 
     path('profile/', views.ProfileView.as_view(), name='profile'),
-    path('profile/password/', views.PasswordChangeView.as_view()),
+    path('profile/password/', views.PasswordChangeView.as_view(), name='password-change'),
 
 
 
@@ -24,14 +25,25 @@ urlpatterns = [
 
     path('post/review/', views.ReviewList.as_view(), name='review-list-create'),
     path('review/<int:pk>/', views.ReviewDetail.as_view(), name='review-detail'),
-    path('doctor/<int:pk>/reviews/', views.DoctorReviews.as_view()),
-
-    path('appointment/', views.AppointmentView.as_view()),
-    path('appointment/<int:pk>', views.AppointmentDetailView.as_view()),
-    path('doctor/<int:pk>/appointment/', views.DoctorAppointments.as_view()),
-
-    path('prescription/', views.PrescriptionList.as_view()),
-    path('my-prescriptions/', views.PatientPrescription.as_view()),
+    path('doctor/<int:pk>/reviews/', views.DoctorReviews.as_view(), name='doctor-reviews'),
+
+    path('appointment/', views.AppointmentView.as_view(), name='appointment-list'),
+    path('appointment/bulk/', views.AppointmentBulkView.as_view(), name='appointment-bulk'),
+    path('appointment/sync/', views.AppointmentSyncView.as_view(), name='appointment-sync'),
+    path('appointment/series/', views.AppointmentSeriesView.as_view(), name='appointment-series-list'),
+    path('appointment/series/<int:pk>/', views.AppointmentSeriesDetailView.as_view(), name='appointment-series-detail'),
+    path('appointment/series/<int:pk>/exceptions/', views.SeriesExceptionView.as_view(), name='appointment-series-exceptions'),
+    path('appointment/<int:pk>', views.AppointmentDetailView.as_view(), name='appointment-detail'),
+    path('doctor/<int:pk>/appointment/', views.DoctorAppointments.as_view(), name='doctor-appointments'),
+    path('doctor/<int:pk>/availability/', views.DoctorAvailability.as_view(), name='doctor-availability'),
+    path('availability/', views.AvailabilityView.as_view(), name='availability'),
+
+    path('prescription/', views.PrescriptionList.as_view(), name='prescription-list'),
+    path('my-prescriptions/', views.PatientPrescription.as_view(), name='my-prescriptions'),
+    path('my-prescriptions/sync/', views.PrescriptionSyncView.as_view(), name='my-prescriptions-sync'),
+
+    path('export/<str:table>.<str:fmt>', views.ExportView.as_view(), name='export'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
 
 
 
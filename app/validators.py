@@ -2,19 +2,83 @@ from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from django.db.models import Q
 
-def validate_time_overlap(date, start_time, end_time, instance=None):
+def validate_time_range(start_time, end_time):
     if start_time >= end_time:
         raise ValidationError(_('End time must be after start time.'))
 
-    from .models import Appointment 
+
+def validate_time_overlap(doctor, date, start_time, end_time, instance=None):
+    validate_time_range(start_time, end_time)
+
+    from .models import Appointment, DoctorDay
+    from .occupancy import load, mask
+    # Clear slots in the day's bitmap rule out any overlap. A set bit may be
+    # a neighbour sharing a slot, so hits fall through to the exact checks.
+    day = DoctorDay.objects.filter(doctor=doctor, date=date).values_list('occupancy', flat=True).first()
+    if day is not None and not load(day) & mask(start_time, end_time):
+        return
+
+    # Only the doctor's own day is scanned; served by appointment_doctor_slot_idx.
     overlapping_events = Appointment.objects.filter(
-        date=date
+        doctor=doctor, date=date
     ).filter(
         Q(start_time__lt=end_time, end_time__gt=start_time)
     )
 
-    if instance:
+    if instance and instance.pk:
         overlapping_events = overlapping_events.exclude(pk=instance.pk)
 
     if overlapping_events.exists():
         raise ValidationError(_('This event overlaps with an existing event on the same date.'))
+
+    from .models import AppointmentSeries
+    # Series running on that date at an overlapping time of day; whether the
+    # rule lands on the date is then checked without listing occurrences.
+    series = AppointmentSeries.objects.filter(
+        doctor=doctor, start_date__lte=date, until__gte=date, start_time__lt=end_time, end_time__gt=start_time,
+    ).exclude(exceptions__date=date)
+    if any(candidate.matches(date) for candidate in series):
+        raise ValidationError(_('This event overlaps with a recurring appointment on the same date.'))
+
+
+def validate_series_overlap(series):
+    validate_time_range(series.start_time, series.end_time)
+
+    from .models import Appointment, AppointmentSeries, DoctorDay
+    from .occupancy import load, mask
+    from .recurrence import first_shared_date, series_dates
+
+    # As for single bookings: if every occurrence day has the slots clear,
+    # nothing can overlap.
+    dates = list(series_dates(series))
+    days = list(DoctorDay.objects.filter(doctor=series.doctor_id, date__in=dates).values_list('occupancy', flat=True))
+    bits = mask(series.start_time, series.end_time)
+    if len(days) == len(dates) and not any(load(day) & bits for day in days):
+        return
+
+    same_time = Q(doctor=series.doctor_id, start_time__lt=series.end_time, end_time__gt=series.start_time)
+
+    # Stored appointments on the series' weekday; the week parity and
+    # exceptions are checked in Python.
+    exceptions = series.exception_dates()
+    stored = Appointment.objects.filter(
+        same_time, date__range=(series.start_date, series.until), date__iso_week_day=series.start_date.isoweekday(),
+    ).values_list('date', flat=True)
+    for date in stored.iterator():
+        if series.matches(date) and date not in exceptions:
+            raise ValidationError(
+                _('This series overlaps with an existing event on %(date)s.'), params={'date': date},
+            )
+
+    # Other series are compared rule against rule (see app/recurrence.py).
+    others = AppointmentSeries.objects.filter(
+        same_time, start_date__lte=series.until, until__gte=series.start_date,
+    ).prefetch_related('exceptions')
+    if series.pk:
+        others = others.exclude(pk=series.pk)
+    for other in others:
+        date = first_shared_date(series, other)
+        if date is not None:
+            raise ValidationError(
+                _('This series overlaps with another recurring appointment on %(date)s.'), params={'date': date},
+            )
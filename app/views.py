@@ -1,22 +1,43 @@
+import heapq
+from itertools import islice
+from operator import attrgetter
+
 from django.shortcuts import render
 from django.views.generic import ListView
 from django.contrib.auth import get_user_model
+from django.http import HttpResponse, StreamingHttpResponse
+from django.db import transaction
+from django.utils import timezone
 
 from rest_framework import serializers, generics, permissions, status, viewsets
 from rest_framework.generics import CreateAPIView, RetrieveUpdateAPIView, UpdateAPIView, ListAPIView
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from . import hashing, metrics
+from .availability import availability
+from .export import Export
+from .imports import DoctorImporter
+from .cache import CachedResponseMixin
 from .permissions import AdminOnlyPermission, IsOwnerOrReadOnly, IsAdminOrReadOnly
-from .models import Doctor, Review, Appointment, Prescription
+from .models import Doctor, DoctorDay, DoctorSearchTerm, Review, Appointment, AppointmentSeries, Prescription, Tombstone
+from .recurrence import merge_occurrences
+from .sync import DeltaSyncView
 from .serializers import (
     PasswordChangeSerializer,
     UserSerializer,
     DoctorSerializer,
     ReviewSerializer,
     AppointmentSerializer,
-    PrescriptionSerializer
+    AppointmentQuerySerializer,
+    AppointmentSyncSerializer,
+    AppointmentSeriesSerializer,
+    BulkAppointmentSerializer,
+    PrescriptionSerializer,
+    AvailabilityQuerySerializer,
+    SeriesExceptionSerializer,
 )
 
 UserModel = get_user_model()
@@ -37,25 +58,25 @@ class ProfileView(RetrieveUpdateAPIView):
    permission_classes = [IsAuthenticated]
 
    def get_object(self):
-        return self.request.user
+        return UserModel.objects.get(pk=self.request.user.id)
 
 class PasswordChangeView(UpdateAPIView):
     serializer_class = PasswordChangeSerializer
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        return UserModel.objects.get(pk=self.request.user.id)
 
     def update(self, request, *args, **kwargs):
         user = self.get_object()
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        if not user.check_password(serializer.validated_data['old_password']):
+        if not hashing.check_password(user, serializer.validated_data['old_password']):
             return Response({"old_password": ["Wrong password."]}, status=400)
 
 
-        user.set_password(serializer.validated_data['new_password'])
+        hashing.set_password(user, serializer.validated_data['new_password'])
         user.save()
 
         return Response({"detail": "Password has been changed."})
@@ -64,7 +85,7 @@ class PasswordChangeView(UpdateAPIView):
 
 
 class DoctorRegisterView(generics.CreateAPIView):
-    queryset = Doctor.objects.all()
+    queryset = Doctor.objects.select_related('user', 'rating')
     serializer_class = DoctorSerializer
     permission_classes = [IsAuthenticated, AdminOnlyPermission]
 
@@ -82,44 +103,248 @@ class DoctorRegisterView(generics.CreateAPIView):
 
 
 
-class DoctorListView(generics.ListAPIView):
-    queryset = Doctor.objects.all()
+class DoctorBulkRegisterView(APIView):
+    # Onboarding: a JSON list of up to max_batch_size doctors (DoctorSerializer
+    # fields). Existing usernames are skipped and invalid rows reported by
+    # position; the rest are created with batched hashing and bulk inserts.
+    # Larger files go through `manage.py import_doctors`.
+    permission_classes = [IsAuthenticated, AdminOnlyPermission]
+    max_batch_size = 1000
+
+    def post(self, request, *args, **kwargs):
+        rows = request.data
+        if not isinstance(rows, list):
+            raise serializers.ValidationError({'non_field_errors': ['Expected a list of doctors.']})
+        if len(rows) > self.max_batch_size:
+            raise serializers.ValidationError({'non_field_errors': [f'At most {self.max_batch_size} doctors per request.']})
+        importer = DoctorImporter(batch_size=self.max_batch_size).run(
+            (number, row if isinstance(row, dict) else None) for number, row in enumerate(rows)
+        )
+        return Response(importer.summary(), status=status.HTTP_201_CREATED if importer.created else status.HTTP_200_OK)
+
+
+
+class DoctorListView(CachedResponseMixin, generics.ListAPIView):
+    queryset = Doctor.objects.select_related('user', 'rating')
     serializer_class = DoctorSerializer
+    cache_namespaces = ('doctors',)
 
-class DoctorDetailView(generics.RetrieveAPIView):
-    queryset = Doctor.objects.all()
+    def get_queryset(self):
+        # ?specialization= and ?hospital= match exactly; ?search= matches the
+        # start of any word in the doctor's username or name.
+        queryset = super().get_queryset()
+        params = self.request.query_params
+        for field in ('specialization', 'hospital'):
+            if params.get(field):
+                queryset = queryset.filter(**{field: params[field]})
+        for word in DoctorSearchTerm.tokenize(params.get('search', '')):
+            queryset = queryset.filter(pk__in=DoctorSearchTerm.doctors_matching(word))
+        return queryset
+
+class DoctorDetailView(CachedResponseMixin, generics.RetrieveAPIView):
+    queryset = Doctor.objects.select_related('user', 'rating')
     serializer_class = DoctorSerializer
     lookup_field = 'pk'
+    cache_namespaces = ('doctor:{pk}',)
 
 
 class ReviewList(generics.ListCreateAPIView):  # View for listing and creating comments.
-    queryset = Review.objects.all()  # Define the queryset to be all comments.
+    queryset = Review.objects.select_related('owner')  # Define the queryset to be all comments.
     serializer_class = ReviewSerializer  # Define the serializer class to be used.
     permission_classes = [IsAuthenticated]
     def perform_create(self, serializer):  # Override the default create behavior.
-        serializer.save(owner=self.request.user)  # Set the owner of the comment to the current logged-in user.
+        serializer.save(owner_id=self.request.user.id)  # Set the owner of the comment to the current logged-in user.
 
 
 class ReviewDetail(generics.RetrieveUpdateDestroyAPIView):  # View for retrieving, updating, and deleting a specific comment.
     permission_classes = [IsAuthenticated]
-    queryset = Review.objects.all()  # Define the queryset to be all comments.
+    queryset = Review.objects.select_related('owner')  # Define the queryset to be all comments.
     serializer_class = ReviewSerializer  # Define the serializer class to be used.
 
 
-class DoctorReviews(generics.ListAPIView):
+class DoctorReviews(CachedResponseMixin, generics.ListAPIView):
     serializer_class = ReviewSerializer
+    cache_namespaces = ('doctor:{pk}:reviews',)
+
     def get_queryset(self):
         doctor_pk = self.kwargs['pk']
-        queryset = Review.objects.filter(doctor_id=doctor_pk)
+        queryset = Review.objects.filter(doctor_id=doctor_pk).select_related('owner')
         return queryset
 
 
-class AppointmentView(generics.ListCreateAPIView):
+def scope_appointments(queryset, user):
+    # Doctors see their schedule, patients their own bookings and staff
+    # everything; works for appointments and series alike.
+    if getattr(user, 'doctor_id', None) is not None:
+        return queryset.filter(doctor_id=user.doctor_id)
+    if not user.is_staff:
+        return queryset.filter(patient_id=user.id)
+    return queryset
+
+
+class OccurrenceListMixin:
+    # Appointment lists in date order, filtered by ?from=&to=&upcoming=1,
+    # that also show the occurrences of recurring series: each page of stored
+    # rows is merged with occurrences expanded from the page cursor onwards
+    # and only until the page is full (see app/recurrence.py).
+    pagination_ordering = ('date', 'start_time', 'id')
+
+    def get_window(self):
+        # (first date, last date, now if ended appointments today are hidden)
+        if not hasattr(self, '_window'):
+            query = AppointmentQuerySerializer.from_query_params(self.request.query_params)
+            query.is_valid(raise_exception=True)
+            params = query.validated_data
+            date_from, date_to, now = params.get('date_from'), params.get('date_to'), None
+            if params['upcoming']:
+                now = timezone.localtime()
+                date_from = max(date_from, now.date()) if date_from else now.date()
+            self._window = date_from, date_to, now
+        return self._window
+
+    def filter_window(self, queryset):
+        # No queries here: the async view (app/async_views.py) shares it.
+        date_from, date_to, now = self.get_window()
+        if date_from:
+            queryset = queryset.filter(date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(date__lte=date_to)
+        if now:
+            # Written as a range on date so the index seeks straight to today.
+            queryset = queryset.exclude(date=now.date(), end_time__lte=now.time())
+        return queryset
+
+    def get_cursor_key(self):
+        cursor = self.paginator.cursor
+        if cursor is None:
+            return None, False
+        values, reverse = cursor
+        return tuple(values), reverse
+
+    def get_occurrence_range(self):
+        # The window, narrowed to the side of the cursor the page is on.
+        date_from, date_to, _ = self.get_window()
+        key, reverse = self.get_cursor_key()
+        if key is not None and reverse:
+            date_to = min(date_to, key[0]) if date_to else key[0]
+        elif key is not None:
+            date_from = max(date_from, key[0]) if date_from else key[0]
+        return date_from, date_to
+
+    def filter_series_window(self, queryset):
+        # For the view's get_series_queryset(); call after the page queryset,
+        # which reads the cursor.
+        date_from, date_to = self.get_occurrence_range()
+        queryset = queryset.prefetch_related('exceptions')
+        if date_from:
+            queryset = queryset.filter(until__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(start_date__lte=date_to)
+        return queryset
+
+    def merge_occurrences(self, rows, series):
+        date_from, date_to = self.get_occurrence_range()
+        now = self.get_window()[2]
+        key, reverse = self.get_cursor_key()
+        sort_key = attrgetter('date', 'start_time', 'id')
+        occurrences = merge_occurrences(series, date_from, date_to, reverse)
+        if key is not None:
+            occurrences = (item for item in occurrences if (sort_key(item) < key if reverse else sort_key(item) > key))
+        if now is not None:
+            occurrences = (item for item in occurrences if not (item.date == now.date() and item.end_time <= now.time()))
+        return list(islice(heapq.merge(rows, occurrences, key=sort_key, reverse=reverse), self.paginator.page_size + 1))
+
+    def paginate_queryset(self, queryset):
+        rows = list(self.paginator.page_queryset(queryset, self.request, view=self))
+        return self.paginator.paginate_rows(self.merge_occurrences(rows, self.get_series_queryset()))
+
+
+class AppointmentView(OccurrenceListMixin, generics.ListCreateAPIView):
+    # Patients see their own appointments, doctors their schedule and staff
+    # everything, in date order, e.g. /appointment/?from=2030-01-07&to=2030-01-13
+    # or /appointment/?upcoming=1. Each is one range scan of
+    # appointment_patient_date_idx, appointment_doctor_slot_idx or
+    # appointment_date_idx.
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return self.filter_window(scope_appointments(super().get_queryset(), self.request.user))
+
+    def get_series_queryset(self):
+        return self.filter_series_window(scope_appointments(AppointmentSeries.objects.all(), self.request.user))
+
+    def perform_create(self, serializer):
+        serializer.save(patient_id=self.request.user.id)
+
+
+class AppointmentSeriesView(generics.ListCreateAPIView):
+    # Recurring bookings, scoped like the appointment list. Patients book
+    # with {"doctor": 1, "start_date": "2030-01-07", "until": "2030-06-24",
+    # "interval": 1, "start_time": "09:00", "end_time": "09:30"}; interval 2
+    # is every other week.
+    serializer_class = AppointmentSeriesSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_ordering = ('start_date', 'id')
+
+    def get_queryset(self):
+        return scope_appointments(AppointmentSeries.objects.prefetch_related('exceptions'), self.request.user)
+
     def perform_create(self, serializer):
-        serializer.save(patient=self.request.user)
+        serializer.save(patient_id=self.request.user.id)
+
+
+class AppointmentSeriesDetailView(generics.RetrieveDestroyAPIView):
+    serializer_class = AppointmentSeriesSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return scope_appointments(AppointmentSeries.objects.prefetch_related('exceptions'), self.request.user)
+
+
+class SeriesExceptionView(generics.CreateAPIView):
+    # Cancels one occurrence of a series: {"date": "2030-02-04"}. To move
+    # it, cancel it and book a single appointment.
+    serializer_class = SeriesExceptionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_serializer_context(self):
+        self.series = generics.get_object_or_404(
+            scope_appointments(AppointmentSeries.objects.all(), self.request.user), pk=self.kwargs['pk'],
+        )
+        return {**super().get_serializer_context(), 'series': self.series}
+
+    def perform_create(self, serializer):
+        # The exception and the rebuild of its day (free_exception_slots)
+        # commit together, after any booking already holding the day.
+        with transaction.atomic():
+            DoctorDay.lock(self.series.doctor_id, serializer.validated_data['date'])
+            serializer.save(series=self.series)
+
+
+
+class AppointmentSyncView(DeltaSyncView):
+    # The patient's own stored appointments; recurring series are small and
+    # fetched whole from /appointment/series/.
+    serializer_class = AppointmentSyncSerializer
+    permission_classes = [IsAuthenticated]
+    tombstone_kind = Tombstone.APPOINTMENT
+
+    def get_queryset(self):
+        return Appointment.objects.filter(patient_id=self.request.user.id)
+
+
+class AppointmentBulkView(generics.CreateAPIView):
+    # Front desk and integration imports: create and reschedule many
+    # appointments in one request and one transaction.
+    serializer_class = BulkAppointmentSerializer
+    permission_classes = [IsAuthenticated, AdminOnlyPermission]
+    max_batch_size = 1000
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(many=True, max_length=self.max_batch_size)
+        return super().get_serializer(*args, **kwargs)
 
 
 
@@ -139,7 +364,8 @@ class AppointmentDetailView(generics.RetrieveUpdateDestroyAPIView):
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        # Save appointment details before deletion for notification
+        # Details for the response; the patient's email is queued by a
+        # post_delete handler (app/signals.py) and sent by the job worker.
         deleted_date = instance.date
         deleted_start_time = instance.start_time
         deleted_doctor = instance.doctor
@@ -155,25 +381,58 @@ class AppointmentDetailView(generics.RetrieveUpdateDestroyAPIView):
 
 
 
-class DoctorAppointments(generics.ListAPIView):
+class DoctorAppointments(OccurrenceListMixin, generics.ListAPIView):
+    # A doctor's schedule in date order, stored appointments and series
+    # occurrences together; takes the same filters as /appointment/.
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated]
+
     def get_queryset(self):
-        doctor_pk = self.kwargs['pk']
-        queryset = Appointment.objects.filter(doctor_id=doctor_pk)
-        return queryset
+        return self.filter_window(Appointment.objects.filter(doctor_id=self.kwargs['pk']))
+
+    def get_series_queryset(self):
+        return self.filter_series_window(AppointmentSeries.objects.filter(doctor_id=self.kwargs['pk']))
+
+
+
+class AvailabilityView(APIView):
+    # Free intervals and bookable slot start times per doctor and day, e.g.
+    # /availability/?doctor=1&doctor=2&from=2030-01-07&to=2030-01-13&start=09:00&end=17:00&slot=30
+
+    def get(self, request, *args, **kwargs):
+        query = AvailabilityQuerySerializer.from_query_params(request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        doctor_ids = self.get_doctor_ids(params)
+        return Response(availability(
+            doctor_ids, params['date_from'], params['date_to'], params['start'], params['end'], params['slot'],
+        ))
+
+    def get_doctor_ids(self, params):
+        if not params.get('doctor'):
+            raise serializers.ValidationError({'doctor': 'At least one doctor is required.'})
+        return set(Doctor.objects.filter(pk__in=params['doctor']).values_list('pk', flat=True))
+
+
+class DoctorAvailability(AvailabilityView):
+
+    def get_doctor_ids(self, params):
+        if not Doctor.objects.filter(pk=self.kwargs['pk']).exists():
+            raise NotFound()
+        return {self.kwargs['pk']}
 
 
 
 class PrescriptionList(generics.ListCreateAPIView):
-    queryset = Prescription.objects.all()
+    queryset = Prescription.objects.select_related('doctor__user')
     serializer_class = PrescriptionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_ordering = ('-date', '-id')
     def perform_create(self, serializer):
         user = self.request.user
         try:
-            doctor = Doctor.objects.get(user=user)
+            doctor = Doctor.objects.get(user_id=user.id)
             serializer.save(doctor=doctor)
         except Doctor.DoesNotExist:
             raise serializers.ValidationError("The logged-in user is not associated with any doctor.")
@@ -182,6 +441,47 @@ class PrescriptionList(generics.ListCreateAPIView):
 class PatientPrescription(generics.ListAPIView):
     serializer_class = PrescriptionSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    pagination_ordering = ('-date', '-id')
+
+    def get_queryset(self):
+        return Prescription.objects.filter(patient_id=self.request.user.id).select_related('doctor__user')
+
+
+class PrescriptionSyncView(DeltaSyncView):
+    # /my-prescriptions/sync/?since=<token> (see app/sync.py)
+    serializer_class = PrescriptionSerializer
+    permission_classes = [IsAuthenticated]
+    tombstone_kind = Tombstone.PRESCRIPTION
 
     def get_queryset(self):
-        return Prescription.objects.filter(patient=self.request.user)
+        return Prescription.objects.filter(patient_id=self.request.user.id).select_related('doctor__user')
+
+
+class ExportView(APIView):
+    # Full-table dumps for reporting, streamed as they are read:
+    # /export/appointments.csv, /export/prescriptions.ndjson
+    permission_classes = [IsAuthenticated, AdminOnlyPermission]
+    chunk_size = 2000
+
+    def get(self, request, *args, **kwargs):
+        export = self.get_export()
+        return self.streaming_response(export, iter(export))
+
+    def get_export(self):
+        try:
+            return Export(self.kwargs['table'], self.kwargs['fmt'], self.chunk_size)
+        except KeyError:
+            raise NotFound()
+
+    def streaming_response(self, export, content):
+        response = StreamingHttpResponse(content, content_type=export.content_type)
+        response['Content-Disposition'] = f'attachment; filename="{export.filename}"'
+        return response
+
+
+class MetricsView(APIView):
+    # Prometheus scrape endpoint for this process's request metrics.
+    permission_classes = [IsAuthenticated, AdminOnlyPermission]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,97 @@
+"""
+Throughput of the hot read endpoints under uvicorn with the native async
+views, under uvicorn with the sync DRF views, and under gunicorn's
+threaded WSGI worker.
+
+Both servers run one process against the same seeded SQLite file; the
+load generator keeps --concurrency keep-alive connections busy for
+--duration seconds per endpoint. Requires uvicorn and gunicorn.
+
+    python -m benchmarks.asgi_throughput [--concurrency 64] [--duration 10]
+"""
+import argparse
+import datetime
+import os
+import signal
+import subprocess
+import sys
+
+from .common import BASE_DIR, setup_django
+from .loadgen import run_load, wait_for_port
+
+UVICORN = ['uvicorn', 'benchmarks.serve:asgi', '--no-access-log', '--log-level', 'warning', '--port']
+GUNICORN = ['gunicorn', '-k', 'gthread', '--threads', '16', '--log-level', 'warning', 'benchmarks.serve:wsgi', '--bind']
+SERVERS = {
+    'ASGI async': (UVICORN, {}),
+    'ASGI sync': (UVICORN, {'GPCARE_ASYNC_URLCONF': ''}),
+    'WSGI': (GUNICORN, {}),
+}
+
+
+def seed():
+    from django.contrib.auth.models import User
+    from app.authentication import ClaimsTokenObtainPairSerializer
+    from app.models import Appointment, Doctor, Prescription
+
+    patient = User.objects.create_user(username='bench-patient', password='!')
+    users = User.objects.bulk_create(User(username=f'bench-doctor-{i}', password='!') for i in range(50))
+    doctors = [Doctor.objects.create(user=user, specialization='GP', hospital='Bench', phone_number='0') for user in users]
+    day = datetime.date(2030, 1, 1)
+    Appointment.objects.bulk_create(
+        Appointment(doctor=doctor, patient=patient, date=day + datetime.timedelta(days=n // 8),
+                    start_time=datetime.time(9 + n % 8), end_time=datetime.time(9 + n % 8, 30))
+        for doctor in doctors for n in range(40)
+    )
+    Prescription.objects.bulk_create(
+        Prescription(patient=patient, doctor=doctor, medical_facility='Bench', rx='Rest') for doctor in doctors
+    )
+    token = str(ClaimsTokenObtainPairSerializer.get_token(patient).access_token)
+    return token, doctors[0].pk
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    db_path = setup_django()
+    from django.db import connection
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+    token, doctor_pk = seed()
+    connection.close()
+
+    headers = {'Authorization': f'Bearer {token}'}
+    endpoints = ['/doctors/', '/appointment/', f'/doctor/{doctor_pk}/appointment/', '/my-prescriptions/']
+    env = {**os.environ, 'GPCARE_BENCH_DB': db_path}
+
+    print(f'{"server":>12} {"endpoint":>26} {"req/s":>9} {"p50 ms":>8} {"p99 ms":>8} {"errors":>7}')
+    for name, (command, extra_env) in SERVERS.items():
+        address = f'127.0.0.1:{args.port}' if command is GUNICORN else str(args.port)
+        server = subprocess.Popen(
+            [*command, address], cwd=BASE_DIR, env={**env, **extra_env}, start_new_session=True,
+        )
+        try:
+            wait_for_port('127.0.0.1', args.port)
+            for endpoint in endpoints:
+                run_load('127.0.0.1', args.port, [('GET', endpoint, headers, None)], args.concurrency, 1)
+                results, elapsed = run_load(
+                    '127.0.0.1', args.port, [('GET', endpoint, headers, None)], args.concurrency, args.duration,
+                )
+                latencies = sorted(seconds for status, seconds in results if status == 200)
+                errors = sum(1 for status, _ in results if status != 200)
+                if not latencies:
+                    print(f'{name:>12} {endpoint:>26} {"-":>9} {"-":>8} {"-":>8} {errors:>7}')
+                    continue
+                print(f'{name:>12} {endpoint:>26} {len(latencies) / elapsed:>9.1f} '
+                      f'{latencies[len(latencies) // 2] * 1000:>8.1f} '
+                      f'{latencies[int(len(latencies) * 0.99) - 1] * 1000:>8.1f} {errors:>7}')
+        finally:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""
+Per-request cost of JWT authentication.
+
+Compares simplejwt's JWTAuthentication, which loads auth.User on every
+request, with ClaimsJWTAuthentication, which builds the user from token
+claims. Measures authenticate() alone and a full GET /my-prescriptions/.
+
+    python -m benchmarks.auth [--requests 2000]
+"""
+import argparse
+
+from .common import setup_django, summarize, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test import Client, RequestFactory
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.request import Request
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+
+    from app import views
+    from app.authentication import ClaimsJWTAuthentication, ClaimsTokenObtainPairSerializer
+
+    user = User.objects.create_user(username='bench-patient', password='!')
+    token = str(ClaimsTokenObtainPairSerializer.get_token(user).access_token)
+    header = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+    factory = RequestFactory()
+    client = Client()
+
+    print(f'{"auth class":>24} {"authenticate p50 us":>20} {"request p50 ms":>15} {"request p95 ms":>15} {"queries":>8}')
+    for auth_class in (JWTAuthentication, ClaimsJWTAuthentication):
+        authenticator = auth_class()
+        auth_timings = []
+        for _ in range(args.requests):
+            request = Request(factory.get('/my-prescriptions/', **header))
+            elapsed, _ = timed(authenticator.authenticate, request)
+            auth_timings.append(elapsed)
+
+        views.PatientPrescription.authentication_classes = [auth_class]
+        client.get('/my-prescriptions/', **header)
+        request_timings = []
+        with CaptureQueriesContext(connection) as captured:
+            for _ in range(args.requests):
+                elapsed, _ = timed(client.get, '/my-prescriptions/', **header)
+                request_timings.append(elapsed)
+        auth_stats, request_stats = summarize(auth_timings), summarize(request_timings)
+        print(f'{auth_class.__name__:>24} {auth_stats["p50_ms"] * 1000:>20.1f} '
+              f'{request_stats["p50_ms"]:>15.3f} {request_stats["p95_ms"]:>15.3f} '
+              f'{len(captured) / args.requests:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Availability over a 30-day range with dense schedules.
+
+Seeds doctors whose working days are mostly booked (short appointments
+with small gaps) and times the availability computation for one doctor
+and for all of them at once.
+
+    python -m benchmarks.availability [--doctors 50] [--days 30] [--per-day 24] [--repeat 20]
+"""
+import argparse
+import datetime
+import io
+
+from .common import setup_django, summarize, timed
+
+FIRST_DAY = datetime.date(2030, 1, 1)
+
+
+def seed(doctor_count, days, per_day):
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from app.models import Appointment, Doctor
+
+    users = User.objects.bulk_create(User(username=f'bench-{i}', password='!') for i in range(doctor_count + 1))
+    doctors = Doctor.objects.bulk_create(
+        Doctor(user=user, specialization='GP', hospital='Bench', phone_number='0') for user in users[1:]
+    )
+    appointments = []
+    for doctor in doctors:
+        for day in range(days):
+            date = FIRST_DAY + datetime.timedelta(days=day)
+            for slot in range(per_day):
+                # 15-minute appointments every 20 minutes from 08:00.
+                start = datetime.datetime.combine(date, datetime.time(8)) + datetime.timedelta(minutes=20 * slot)
+                appointments.append(Appointment(
+                    doctor=doctor, patient=users[0], date=date,
+                    start_time=start.time(), end_time=(start + datetime.timedelta(minutes=15)).time(),
+                ))
+    Appointment.objects.bulk_create(appointments, batch_size=5000)
+    call_command('rebuild_occupancy', stdout=io.StringIO())
+    return [doctor.pk for doctor in doctors], len(appointments)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--per-day', type=int, default=24)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from app.availability import availability
+
+    doctor_ids, total = seed(args.doctors, args.days, args.per_day)
+    date_to = FIRST_DAY + datetime.timedelta(days=args.days - 1)
+    print(f'{args.doctors} doctors, {args.days} days, {total} appointments')
+    for label, ids in (('1 doctor', doctor_ids[:1]), (f'{len(doctor_ids)} doctors', doctor_ids)):
+        timings = []
+        for _ in range(args.repeat):
+            elapsed, result = timed(
+                availability, set(ids), FIRST_DAY, date_to, datetime.time(8), datetime.time(18), 15,
+            )
+            timings.append(elapsed)
+        stats = summarize(timings)
+        slots = sum(len(day['slots']) for day in result)
+        print(f'{label:>12}: {len(result)} doctor-days, {slots} free slots, '
+              f'p50 {stats["p50_ms"]:.2f} ms, p95 {stats["p95_ms"]:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Concurrent booking stress test against SQLite in WAL mode.
+
+Many threads race to book overlapping slots for a handful of doctors. The
+run fails (exit status 1) if any doctor ends up double-booked, and reports
+accepted bookings per second.
+
+    python -m benchmarks.booking_concurrency [--threads 16] [--attempts 50] [--doctors 4]
+"""
+import argparse
+import datetime
+import random
+import sys
+import threading
+import time
+
+from .common import setup_django
+
+DAY = datetime.date(2030, 1, 7)
+
+
+def seed(doctor_count):
+    from django.contrib.auth.models import User
+    from app.models import Doctor
+
+    patient = User.objects.create(username='bench-patient', password='!')
+    doctors = [
+        Doctor.objects.create(
+            user=User.objects.create(username=f'bench-doctor-{i}', password='!'),
+            specialization='GP', hospital='Bench', phone_number='0',
+        )
+        for i in range(doctor_count)
+    ]
+    return patient.pk, [doctor.pk for doctor in doctors]
+
+
+def worker(patient_id, doctor_ids, attempts, counters, lock):
+    from django.core.exceptions import ValidationError
+    from django.db import OperationalError, connection
+    from app.models import Appointment
+
+    accepted = rejected = errors = 0
+    try:
+        for _ in range(attempts):
+            # 15-minute slots on a 5-minute grid inside a short window, so most
+            # attempts collide with something.
+            start = datetime.datetime.combine(DAY, datetime.time(9)) + datetime.timedelta(minutes=5 * random.randrange(48))
+            appointment = Appointment(
+                doctor_id=random.choice(doctor_ids), patient_id=patient_id, date=DAY,
+                start_time=start.time(), end_time=(start + datetime.timedelta(minutes=15)).time(),
+            )
+            try:
+                appointment.save()
+                accepted += 1
+            except ValidationError:
+                rejected += 1
+            except OperationalError:
+                errors += 1
+    finally:
+        connection.close()
+    with lock:
+        counters['accepted'] += accepted
+        counters['rejected'] += rejected
+        counters['errors'] += errors
+
+
+def double_bookings():
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT COUNT(*) FROM app_appointment a JOIN app_appointment b '
+            'ON a.doctor_id = b.doctor_id AND a.date = b.date AND a.id < b.id '
+            'AND a.start_time < b.end_time AND a.end_time > b.start_time'
+        )
+        return cursor.fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--attempts', type=int, default=50)
+    parser.add_argument('--doctors', type=int, default=4)
+    args = parser.parse_args()
+
+    db_path = setup_django()
+    from django.conf import settings
+    from django.db import connection
+
+    settings.DATABASES['default'].setdefault('OPTIONS', {})['timeout'] = 60
+    connection.close()
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        journal_mode = cursor.fetchone()[0]
+
+    patient_id, doctor_ids = seed(args.doctors)
+    connection.close()
+
+    counters = {'accepted': 0, 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=worker, args=(patient_id, doctor_ids, args.attempts, counters, lock))
+        for _ in range(args.threads)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    overlaps = double_bookings()
+    attempts = args.threads * args.attempts
+    print(f'database: {db_path} (journal_mode={journal_mode})')
+    print(f'{args.threads} threads x {args.attempts} attempts over {args.doctors} doctors in {elapsed:.2f}s')
+    print(f'accepted={counters["accepted"]} rejected={counters["rejected"]} errors={counters["errors"]}')
+    print(f'attempts/sec={attempts / elapsed:.1f} bookings/sec={counters["accepted"] / elapsed:.1f}')
+    print(f'double bookings: {overlaps}')
+    if overlaps or counters['errors']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
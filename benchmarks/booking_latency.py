@@ -0,0 +1,86 @@
+"""
+Booking latency as the clinic grows.
+
+Seeds N doctors with a full day of appointments each and times booking a
+free slot for a random doctor. With the doctor-scoped overlap check the
+latency should stay flat from 10 to 10,000 doctors.
+
+    python -m benchmarks.booking_latency [--sizes 10 100 1000 10000] [--samples 200]
+"""
+import argparse
+import datetime
+import random
+
+from .common import setup_django, summarize, timed
+
+DAY = datetime.date(2030, 1, 7)
+
+
+def seed(doctor_count, per_day):
+    from django.contrib.auth.models import User
+    from app.models import Appointment, Doctor
+
+    Appointment.objects.all().delete()
+    Doctor.objects.all().delete()
+    User.objects.all().delete()
+
+    users = User.objects.bulk_create(
+        User(username=f'bench-{i}', password='!') for i in range(doctor_count + 1)
+    )
+    patient = users[0]
+    doctors = Doctor.objects.bulk_create(
+        Doctor(user=user, specialization='GP', hospital='Bench', phone_number='0')
+        for user in users[1:]
+    )
+    Appointment.objects.bulk_create(
+        Appointment(
+            doctor=doctor, patient=patient, date=DAY,
+            start_time=datetime.time(8 + slot), end_time=datetime.time(8 + slot, 45),
+        )
+        for doctor in doctors
+        for slot in range(per_day)
+    )
+    return patient, doctors
+
+
+def run(sizes, samples, per_day):
+    from django.db import connection
+    from app.models import Appointment
+
+    results = []
+    for size in sizes:
+        patient, doctors = seed(size, per_day)
+        timings = []
+        for _ in range(samples):
+            doctor = random.choice(doctors)
+            appointment = Appointment(
+                doctor=doctor, patient=patient, date=DAY,
+                start_time=datetime.time(20), end_time=datetime.time(20, 30),
+            )
+            elapsed, _ = timed(appointment.save)
+            timings.append(elapsed)
+            appointment.delete()
+        results.append((size, summarize(timings)))
+
+    plan = Appointment.objects.filter(
+        doctor=doctors[0], date=DAY, start_time__lt=datetime.time(21), end_time__gt=datetime.time(20)
+    ).explain()
+    print(f'backend: {connection.vendor}, {per_day} appointments per doctor')
+    print(f'overlap query plan: {plan}')
+    print(f'{"doctors":>8} {"appointments":>13} {"p50 ms":>8} {"p95 ms":>8}')
+    for size, stats in results:
+        print(f'{size:>8} {size * per_day:>13} {stats["p50_ms"]:>8.3f} {stats["p95_ms"]:>8.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--per-day', type=int, default=8)
+    args = parser.parse_args()
+    setup_django()
+    run(args.sizes, args.samples, args.per_day)
+
+
+if __name__ == '__main__':
+    main()
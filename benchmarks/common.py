@@ -0,0 +1,57 @@
+"""
+Shared bootstrap for the benchmark scripts.
+
+Every benchmark runs against a throwaway SQLite file so the committed
+db.sqlite3 is never touched. Under GPCARE_DB_PROFILE=postgres the
+benchmarks that support it create and drop a test database instead.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def configure(db_path):
+    # Point settings at the benchmark database before Django is set up.
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gpcare.settings')
+
+    from django.conf import settings
+
+    if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+        settings.DATABASES['default']['NAME'] = db_path
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver', '127.0.0.1', 'localhost']
+
+
+def setup_django(db_path=None):
+    import django
+    from django.core.management import call_command
+
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='gpcare-bench-'), 'bench.sqlite3')
+    configure(db_path)
+    django.setup()
+    call_command('migrate', verbosity=0)
+    return db_path
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'n': len(samples),
+        'mean_ms': statistics.fmean(samples) * 1000,
+        'p50_ms': samples[len(samples) // 2] * 1000,
+        'p95_ms': samples[int(len(samples) * 0.95) - 1] * 1000,
+        'p99_ms': samples[int(len(samples) * 0.99) - 1] * 1000,
+    }
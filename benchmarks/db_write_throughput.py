@@ -0,0 +1,145 @@
+"""
+Write throughput of the database profiles.
+
+Worker threads book non-overlapping appointments through
+Appointment.save() (per-doctor-day lock plus overlap check) and the run
+reports committed writes per second, latency and "database is locked"
+errors. Under the sqlite profile it compares a stock SQLite file
+(rollback journal, synchronous=FULL, 5s timeout) against the tuned
+GPCARE_SQLITE_PRAGMAS; under GPCARE_DB_PROFILE=postgres it runs against a
+throwaway PostgreSQL database with the configured connection settings.
+
+    python -m benchmarks.db_write_throughput [--threads 8] [--writes 200] [--doctors 8]
+    GPCARE_DB_PROFILE=postgres python -m benchmarks.db_write_throughput
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import threading
+import time
+
+from .common import setup_django, summarize
+
+DAY = datetime.date(2030, 1, 7)
+
+# What SQLite does without the connection hook.
+STOCK_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': 5000}
+
+
+def seed(doctor_count):
+    from django.contrib.auth.models import User
+    from app.models import Doctor
+
+    patient = User.objects.create(username='bench-patient', password='!')
+    doctors = [
+        Doctor.objects.create(
+            user=User.objects.create(username=f'bench-doctor-{i}', password='!'),
+            specialization='GP', hospital='Bench', phone_number='0',
+        )
+        for i in range(doctor_count)
+    ]
+    return patient.pk, [doctor.pk for doctor in doctors]
+
+
+def worker(index, patient_id, doctor_ids, writes, samples, errors, lock):
+    from django.db import OperationalError, connection
+    from app.models import Appointment
+
+    latencies = []
+    failed = 0
+    try:
+        for n in range(writes):
+            # Every thread writes its own 10-minute slots, round-robin over
+            # the doctors, so nothing is rejected and all time is spent on
+            # locking and committing.
+            slot = n * 64 + index
+            start = datetime.datetime.combine(DAY, datetime.time(0)) + datetime.timedelta(minutes=10 * (slot % 100))
+            appointment = Appointment(
+                doctor_id=doctor_ids[slot % len(doctor_ids)], patient_id=patient_id,
+                date=DAY + datetime.timedelta(days=slot // 100),
+                start_time=start.time(), end_time=(start + datetime.timedelta(minutes=10)).time(),
+            )
+            began = time.perf_counter()
+            try:
+                appointment.save()
+            except OperationalError:
+                failed += 1
+                continue
+            latencies.append(time.perf_counter() - began)
+    finally:
+        connection.close()
+    with lock:
+        samples.extend(latencies)
+        errors.append(failed)
+
+
+def run(args):
+    from django.db import connection
+
+    patient_id, doctor_ids = seed(args.doctors)
+    connection.close()
+
+    samples, errors, lock = [], [], threading.Lock()
+    threads = [
+        threading.Thread(target=worker, args=(i, patient_id, doctor_ids, args.writes, samples, errors, lock))
+        for i in range(args.threads)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {'writes_per_sec': len(samples) / elapsed, 'errors': sum(errors), **summarize(samples)}
+
+
+def use_sqlite_file(pragmas):
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import connection
+
+    connection.close()
+    settings.DATABASES['default']['NAME'] = os.path.join(tempfile.mkdtemp(prefix='gpcare-bench-'), 'bench.sqlite3')
+    settings.GPCARE_SQLITE_PRAGMAS = pragmas
+    call_command('migrate', verbosity=0)
+
+
+def report(label, result):
+    print(
+        f'{label:>16}  {result["writes_per_sec"]:9.1f} writes/s  p50 {result["p50_ms"]:7.2f} ms  '
+        f'p95 {result["p95_ms"]:7.2f} ms  errors {result["errors"]}'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=200, help='writes per thread')
+    parser.add_argument('--doctors', type=int, default=8)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.db import connection
+
+    print(f'{args.threads} threads x {args.writes} writes over {args.doctors} doctors')
+    if connection.vendor == 'sqlite':
+        # Throwaway files, so WAL even where GPCARE_SQLITE_WAL=0.
+        tuned = {**settings.GPCARE_SQLITE_PRAGMAS, 'journal_mode': 'WAL'}
+        for label, pragmas in (('sqlite stock', STOCK_PRAGMAS), ('sqlite tuned', tuned)):
+            use_sqlite_file(pragmas)
+            report(label, run(args))
+        return
+
+    test_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        options = settings.DATABASES['default']
+        print(f'database: {test_name} (CONN_MAX_AGE={options["CONN_MAX_AGE"]})')
+        report('postgres', run(args))
+    finally:
+        connection.creation.destroy_test_db(test_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
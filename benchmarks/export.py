@@ -0,0 +1,117 @@
+"""
+Streaming export of a large appointment table.
+
+Seeds --rows appointments, then downloads /export/appointments.csv and
+.ndjson through the view and reports throughput and peak Python memory
+(tracemalloc, measured in a second pass so tracing does not skew the
+timing). For contrast it also serialises the first --baseline-rows rows
+the way a list view would, all at once.
+
+    python -m benchmarks.export [--rows 1000000] [--baseline-rows 100000]
+"""
+import argparse
+import datetime
+import time
+import tracemalloc
+
+from .common import setup_django
+
+FIRST_DAY = datetime.date(2030, 1, 1)
+
+
+def seed(rows, batch=20000):
+    from django.contrib.auth.models import User
+    from django.db import connection, transaction
+    from django.utils import timezone
+    from app.models import Doctor
+
+    patient = User.objects.create(username='bench-patient', password='!')
+    doctor = Doctor.objects.create(
+        user=User.objects.create(username='bench-doctor', password='!'),
+        specialization='GP', hospital='Bench', phone_number='0',
+    )
+    ops = connection.ops
+    created = ops.adapt_datetimefield_value(timezone.now())
+    dates = {}
+    # Two 15-minute appointments per hour, around the clock.
+    slots = [
+        (ops.adapt_timefield_value(datetime.time(hour, minute)), ops.adapt_timefield_value(datetime.time(hour, minute + 15)))
+        for hour in range(24) for minute in (0, 30)
+    ]
+    sql = (
+        'INSERT INTO app_appointment (created, date, start_time, end_time, patient_id, doctor_id) '
+        'VALUES (%s, %s, %s, %s, %s, %s)'
+    )
+    # Raw inserts: Appointment.save() and bulk_create would dominate the run.
+    with transaction.atomic(), connection.cursor() as cursor:
+        for first in range(0, rows, batch):
+            params = []
+            for n in range(first, min(first + batch, rows)):
+                day = n // len(slots)
+                if day not in dates:
+                    dates[day] = ops.adapt_datefield_value(FIRST_DAY + datetime.timedelta(days=day))
+                params.append((created, dates[day], *slots[n % len(slots)], patient.pk, doctor.pk))
+            cursor.executemany(sql, params)
+    return User.objects.create_superuser(username='bench-admin', password='!')
+
+
+def download(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, response.status_code
+    size = lines = 0
+    for chunk in response.streaming_content:
+        size += len(chunk)
+        lines += chunk.count(b'\n')
+    return size, lines
+
+
+def traced(fn, *args):
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def materialise(rows):
+    from app.models import Appointment
+    from app.serializers import AppointmentSerializer
+
+    return AppointmentSerializer(Appointment.objects.order_by('pk')[:rows], many=True).data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--baseline-rows', type=int, default=100_000)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.test import APIClient
+
+    start = time.perf_counter()
+    admin = seed(args.rows)
+    print(f'seeded {args.rows} appointments in {time.perf_counter() - start:.1f}s')
+    client = APIClient()
+    client.force_authenticate(admin)
+
+    for fmt in ('csv', 'ndjson'):
+        url = f'/export/appointments.{fmt}'
+        start = time.perf_counter()
+        size, lines = download(client, url)
+        elapsed = time.perf_counter() - start
+        peak = traced(download, client, url)
+        print(f'{fmt:>8}: {lines} lines, {size / 2 ** 20:.1f} MiB in {elapsed:.2f}s '
+              f'({args.rows / elapsed:,.0f} rows/s), peak {peak / 2 ** 20:.1f} MiB')
+
+    rows = min(args.baseline_rows, args.rows)
+    start = time.perf_counter()
+    materialise(rows)
+    elapsed = time.perf_counter() - start
+    peak = traced(materialise, rows)
+    print(f'    list: {rows} rows serialised at once in {elapsed:.2f}s, peak {peak / 2 ** 20:.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Minimal asyncio HTTP/1.1 load generator with keep-alive connections, so
+the client side costs little next to the server being measured.
+"""
+import asyncio
+import itertools
+import time
+
+
+async def _request(reader, writer, host, method, path, headers, body):
+    lines = [f'{method} {path} HTTP/1.1', f'Host: {host}', 'Connection: keep-alive']
+    lines += [f'{name}: {value}' for name, value in headers.items()]
+    if body is not None:
+        lines.append(f'Content-Length: {len(body)}')
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + (body or b''))
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('server closed the connection')
+    status = int(status_line.split()[1])
+    length = 0
+    chunked = False
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+        elif name.lower() == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+    if chunked:
+        while (size := int((await reader.readline()).strip(), 16)):
+            await reader.readexactly(size + 2)
+        await reader.readline()
+    else:
+        await reader.readexactly(length)
+    return status
+
+
+async def _client(host, port, requests, deadline, results):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for method, path, headers, body in requests:
+            if time.perf_counter() >= deadline:
+                break
+            start = time.perf_counter()
+            try:
+                status = await _request(reader, writer, f'{host}:{port}', method, path, headers, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+                status = 0
+            results.append((status, time.perf_counter() - start))
+    finally:
+        writer.close()
+
+
+def run_load(host, port, requests, concurrency=32, duration=10.0):
+    # `requests` is a list of (method, path, headers, body) cycled by every
+    # client, or an iterator of them shared by all clients, which ends the
+    # run early once it is exhausted. Returns [(status, seconds), ...] and
+    # the wall time.
+    results = []
+
+    def source():
+        return itertools.cycle(requests) if isinstance(requests, list) else requests
+
+    async def main():
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(
+            _client(host, port, source(), deadline, results) for _ in range(concurrency)
+        ))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return results, time.perf_counter() - start
+
+
+def wait_for_port(host, port, timeout=30.0):
+    async def probe():
+        deadline = time.perf_counter() + timeout
+        while True:
+            try:
+                _, writer = await asyncio.open_connection(host, port)
+                writer.close()
+                return
+            except OSError:
+                if time.perf_counter() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+    asyncio.run(probe())
@@ -0,0 +1,74 @@
+"""
+Registrations per second through POST /auth/register/.
+
+Client threads register users concurrently while password hashing runs on
+the bounded pool from app/hashing.py. Pool type, size and PBKDF2 cost come
+from the usual settings, e.g.
+
+    GPCARE_HASHING_WORKERS=4 GPCARE_PASSWORD_ITERATIONS=600000 \\
+        python -m benchmarks.registration [--clients 16] [--registrations 200]
+"""
+import argparse
+import itertools
+import threading
+import time
+
+from .common import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--registrations', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.db import connection
+    from django.test import Client
+
+    settings.DATABASES['default'].setdefault('OPTIONS', {})['timeout'] = 60
+    connection.close()
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+    connection.close()
+
+    counter = itertools.count()
+    statuses = {}
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        client = Client()
+        try:
+            while (n := next(counter)) < args.registrations:
+                start = time.perf_counter()
+                response = client.post('/auth/register/', {'username': f'bench-{n}', 'password': 'bench-password-1'})
+                elapsed = time.perf_counter() - start
+                with lock:
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                    latencies.append(elapsed)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    from django.contrib.auth.hashers import get_hasher
+    latencies.sort()
+    hasher = get_hasher()
+    print(f'hasher={hasher.algorithm} iterations={getattr(hasher, "iterations", "-")} '
+          f'pool={settings.GPCARE_HASHING_POOL} workers={settings.GPCARE_HASHING_WORKERS}')
+    print(f'{args.registrations} registrations from {args.clients} clients in {elapsed:.2f}s: '
+          f'{args.registrations / elapsed:.1f}/sec')
+    print(f'latency p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, '
+          f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms; statuses {statuses}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+"""
+ASGI and WSGI entry points bound to a benchmark database, for running the
+app under a real server:
+
+    GPCARE_BENCH_DB=/tmp/bench.sqlite3 uvicorn benchmarks.serve:asgi
+    GPCARE_BENCH_DB=/tmp/bench.sqlite3 gunicorn -k gthread --threads 16 benchmarks.serve:wsgi
+"""
+import os
+
+from .common import configure
+
+configure(os.environ['GPCARE_BENCH_DB'])
+
+from django.core.asgi import get_asgi_application  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+
+asgi = get_asgi_application()
+wsgi = get_wsgi_application()
@@ -0,0 +1,477 @@
+"""
+Load test of every route in app/urls.py, for comparing runs.
+
+Seeds a reproducible data set (--seed and the row counts), then sends
+--requests requests to each route: in process through Django's test client,
+or with --live asgi|wsgi over HTTP to uvicorn or gunicorn serving the same
+seeded database. Prints a JSON report with p50/p95/p99 latency, throughput,
+errors and database queries per request (read from /metrics/) for each
+route. --compare exits with status 1 if a route got more than --tolerance
+slower at p95, or sends more queries, than in an earlier report.
+
+Registration, login and password changes hash passwords at the configured
+cost and dominate the run time; GPCARE_PASSWORD_ITERATIONS=1000 makes them
+cheap when only the other routes are of interest.
+
+    python -m benchmarks.suite [--requests 200] [--live asgi] [-o run.json] [--compare baseline.json]
+"""
+import argparse
+import datetime
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from urllib.parse import urlencode
+
+from .common import BASE_DIR, setup_django, summarize
+from .loadgen import run_load, wait_for_port
+
+PASSWORD = 'bench-pass-123'
+FIRST_DAY = datetime.date(2030, 1, 7)
+# Appointments booked during the run go well after the seeded ones.
+NEW_DAY = datetime.date(2040, 1, 7)
+SLOTS_PER_DAY = 16
+# Recurring series, seeded and booked during the run, on days of their own.
+SERIES_DAY = datetime.date(2035, 1, 1)
+NEW_SERIES_DAY = datetime.date(2045, 1, 2)
+SERIES_WEEKS = 26
+NEW_SERIES_WEEKS = 8
+
+FIRST_NAMES = ['Ana', 'Ben', 'Chloe', 'Dan', 'Eva', 'Femi', 'Grace', 'Hugo', 'Ines', 'Jon']
+LAST_NAMES = ['Smith', 'Popescu', 'Nguyen', 'Garcia', 'Okafor', 'Muller', 'Rossi', 'Kowalski']
+SPECIALIZATIONS = ['GP', 'Cardiology', 'Dermatology', 'Paediatrics', 'Neurology']
+HOSPITALS = ['General', 'St Mary', 'City', 'Riverside']
+
+SERVERS = {
+    'asgi': ['uvicorn', 'benchmarks.serve:asgi', '--no-access-log', '--log-level', 'warning', '--port', '{port}'],
+    'wsgi': ['gunicorn', '-k', 'gthread', '--threads', '16', '--log-level', 'warning',
+             'benchmarks.serve:wsgi', '--bind', '127.0.0.1:{port}'],
+}
+
+METRIC = re.compile(r'^gpcare_db_queries_(sum|count)\{route="([^"]+)",method="(\w+)"\} (\S+)$', re.MULTILINE)
+
+
+def slot(doctor_ids, n, first_day):
+    # The n-th of a sequence of non-overlapping 20-minute appointments,
+    # spread over the doctors.
+    doctor_id = doctor_ids[n % len(doctor_ids)]
+    day, index = divmod(n // len(doctor_ids), SLOTS_PER_DAY)
+    start = datetime.datetime.combine(first_day + datetime.timedelta(days=day), datetime.time(8))
+    start += datetime.timedelta(minutes=30 * index)
+    return doctor_id, start.date(), start.time(), (start + datetime.timedelta(minutes=20)).time()
+
+
+def series_slot(doctor_ids, n, first_day, weeks):
+    # The n-th of a sequence of weekly series that never overlap: each
+    # doctor's slots in a day, then the other weekdays, then the next block
+    # of `weeks` weeks.
+    doctor_id = doctor_ids[n % len(doctor_ids)]
+    block, index = divmod(n // len(doctor_ids), SLOTS_PER_DAY)
+    start = datetime.datetime.combine(first_day, datetime.time(8))
+    start += datetime.timedelta(days=block % 7 + block // 7 * 7 * weeks, minutes=30 * index)
+    until = start.date() + datetime.timedelta(weeks=weeks - 1)
+    return doctor_id, start.date(), until, start.time(), (start + datetime.timedelta(minutes=20)).time()
+
+
+class Dataset:
+
+    def __init__(self, doctors=50, patients=200, appointments=2000, reviews=500, prescriptions=500, series=100, seed=0):
+        self.config = {
+            'doctors': doctors, 'patients': patients, 'appointments': appointments,
+            'reviews': reviews, 'prescriptions': prescriptions, 'series': series, 'seed': seed,
+        }
+
+    def user_row(self, rng, number, prefix):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        return {
+            'username': f'{prefix}-{number}', 'password': PASSWORD, 'email': f'{prefix}-{number}@example.com',
+            'first_name': first, 'last_name': last,
+        }
+
+    def seed(self):
+        from django.contrib.auth.hashers import make_password
+        from django.contrib.auth.models import User
+        from django.core.management import call_command
+        from app.imports import DoctorImporter, PatientImporter
+        from app.models import Appointment, AppointmentSeries, Doctor, DoctorRating, Prescription, Review
+
+        config = self.config
+        rng = random.Random(config['seed'])
+        # One real hash for every seeded user, so seeding stays fast but
+        # logins and password changes still verify.
+        password = make_password(PASSWORD)
+
+        def hash_passwords(passwords):
+            return [password] * len(passwords)
+
+        PatientImporter(hash_passwords).run(
+            (n, self.user_row(rng, n, 'patient')) for n in range(config['patients'])
+        )
+        DoctorImporter(hash_passwords).run(
+            (n, {
+                **self.user_row(rng, n, 'doctor'), 'specialization': rng.choice(SPECIALIZATIONS),
+                'hospital': rng.choice(HOSPITALS), 'phone_number': f'0700{n:06d}',
+            })
+            for n in range(config['doctors'])
+        )
+        patients = list(User.objects.filter(username__startswith='patient-').order_by('pk').values_list('pk', flat=True))
+        doctors = list(Doctor.objects.order_by('pk').values_list('pk', flat=True))
+
+        appointments = []
+        for n in range(config['appointments']):
+            doctor_id, date, start, end = slot(doctors, n, FIRST_DAY)
+            appointments.append(Appointment(
+                doctor_id=doctor_id, patient_id=rng.choice(patients), date=date, start_time=start, end_time=end,
+            ))
+        Appointment.objects.bulk_create(appointments, batch_size=5000)
+        Review.objects.bulk_create((
+            Review(owner_id=rng.choice(patients), doctor_id=rng.choice(doctors), body='Bench review', rating=rng.randint(1, 5))
+            for _ in range(config['reviews'])
+        ), batch_size=5000)
+        for doctor_id in doctors:
+            DoctorRating.rebuild(doctor_id)
+        Prescription.objects.bulk_create((
+            Prescription(patient_id=rng.choice(patients), doctor_id=rng.choice(doctors), medical_facility='General', rx='Rest')
+            for _ in range(config['prescriptions'])
+        ), batch_size=5000)
+        series = []
+        for n in range(config['series']):
+            doctor_id, start_date, until, start, end = series_slot(doctors, n, SERIES_DAY, SERIES_WEEKS)
+            series.append(AppointmentSeries(
+                doctor_id=doctor_id, patient_id=rng.choice(patients), start_date=start_date, until=until,
+                start_time=start, end_time=end,
+            ))
+        AppointmentSeries.objects.bulk_create(series, batch_size=5000)
+        # bulk_create bypasses the occupancy bitmaps that bookings and availability read.
+        call_command('rebuild_occupancy', stdout=io.StringIO())
+
+        self.doctor_ids = doctors
+        self.patient = User.objects.get(pk=patients[0])
+        self.doctor = Doctor.objects.select_related('user').get(pk=doctors[0])
+        self.admin = User.objects.create_superuser(username='bench-admin', password=PASSWORD)
+        self.password_user = User.objects.create_user(username='bench-password', password=PASSWORD)
+        self.appointment_ids = list(Appointment.objects.order_by('pk').values_list('pk', flat=True))
+        self.review_id = Review.objects.create(owner=self.patient, doctor_id=doctors[0], body='Bench review', rating=5).pk
+        self.series = list(AppointmentSeries.objects.order_by('pk').values_list('pk', 'start_date'))
+        return self
+
+
+class Routes:
+    # What each route is sent: (key, URL name, who sends it, make(i) -> (method, path, body)).
+
+    def __init__(self, dataset):
+        self.data = dataset
+        self.slots = itertools.count()
+        self.series_slots = itertools.count()
+
+    def new_slot(self):
+        doctor_id, date, start, end = slot(self.data.doctor_ids, next(self.slots), NEW_DAY)
+        return {'doctor': doctor_id, 'date': date.isoformat(), 'start_time': start.isoformat(), 'end_time': end.isoformat()}
+
+    def new_series(self):
+        doctor_id, start_date, until, start, end = series_slot(
+            self.data.doctor_ids, next(self.series_slots), NEW_SERIES_DAY, NEW_SERIES_WEEKS,
+        )
+        return {
+            'doctor': doctor_id, 'start_date': start_date.isoformat(), 'until': until.isoformat(),
+            'start_time': start.isoformat(), 'end_time': end.isoformat(), 'interval': 1,
+        }
+
+    def exception(self, i):
+        # Each seeded series' occurrences in turn, so no date is cancelled twice.
+        pk, start_date = self.data.series[i % len(self.data.series)]
+        week = i // len(self.data.series) % SERIES_WEEKS
+        return f'/appointment/series/{pk}/exceptions/', {'date': (start_date + datetime.timedelta(weeks=week)).isoformat()}
+
+    def sync_token(self):
+        # What a client that synced a moment ago holds.
+        from django.utils import timezone
+        from app.sync import encode_token
+
+        now = timezone.now()
+        return encode_token((now, 0), (now, 0))
+
+    def token(self, user):
+        from app.authentication import ClaimsTokenObtainPairSerializer
+
+        return str(ClaimsTokenObtainPairSerializer.get_token(user).access_token)
+
+    def users(self):
+        data = self.data
+        return {'patient': data.patient, 'doctor': data.doctor.user, 'admin': data.admin, 'password': data.password_user}
+
+    def all(self):
+        data = self.data
+        doctor = data.doctor.pk
+        appointment = data.appointment_ids[0]
+        deletable = data.appointment_ids[::-1]
+        week = urlencode({'from': FIRST_DAY, 'to': FIRST_DAY + datetime.timedelta(days=6)})
+        doctors = urlencode({'doctor': data.doctor_ids[:10]}, doseq=True)
+        doctor_queries = ['', '?specialization=GP', '?hospital=City', '?search=smi']
+        appointment_queries = ['', f'?{week}', '?upcoming=1']
+
+        def person(prefix, i):
+            return {'username': f'{prefix}-{i}', 'password': PASSWORD}
+
+        def doctor_row(prefix, i):
+            return {
+                **person(prefix, i), 'email': f'{prefix}-{i}@example.com', 'first_name': 'Bench', 'last_name': 'Doctor',
+                'specialization': 'GP', 'hospital': 'General', 'phone_number': '0',
+            }
+
+        return [
+            ('POST register', 'register', None, lambda i: ('POST', '/auth/register/', person('new-patient', i))),
+            ('POST doctor-register', 'doctor-register', 'admin',
+             lambda i: ('POST', '/auth/register/doctor/', doctor_row('new-doctor', i))),
+            ('POST doctor-bulk-register', 'doctor-bulk-register', 'admin',
+             lambda i: ('POST', '/auth/register/doctor/bulk/', [doctor_row(f'bulk-doctor-{i}', n) for n in range(10)])),
+            ('POST token_obtain_pair', 'token_obtain_pair', None,
+             lambda i: ('POST', '/auth/login/token/', {'username': data.patient.username, 'password': PASSWORD})),
+            ('GET profile', 'profile', 'patient', lambda i: ('GET', '/profile/', None)),
+            ('PATCH profile', 'profile', 'patient', lambda i: ('PATCH', '/profile/', {'first_name': f'Name{i}'})),
+            ('PUT password-change', 'password-change', 'password',
+             lambda i: ('PUT', '/profile/password/', {'old_password': PASSWORD, 'new_password': PASSWORD})),
+            ('GET doctor-list', 'doctor-list', 'patient',
+             lambda i: ('GET', '/doctors/' + doctor_queries[i % len(doctor_queries)], None)),
+            ('GET doctor-detail', 'doctor-detail', 'patient', lambda i: ('GET', f'/doctor/{doctor}/', None)),
+            ('GET review-list-create', 'review-list-create', 'patient', lambda i: ('GET', '/post/review/', None)),
+            ('POST review-list-create', 'review-list-create', 'patient',
+             lambda i: ('POST', '/post/review/', {'doctor': doctor, 'body': 'Bench review', 'rating': i % 5 + 1})),
+            ('GET review-detail', 'review-detail', 'patient', lambda i: ('GET', f'/review/{data.review_id}/', None)),
+            ('PATCH review-detail', 'review-detail', 'patient',
+             lambda i: ('PATCH', f'/review/{data.review_id}/', {'rating': i % 5 + 1})),
+            ('GET doctor-reviews', 'doctor-reviews', 'patient', lambda i: ('GET', f'/doctor/{doctor}/reviews/', None)),
+            ('GET appointment-list', 'appointment-list', 'patient',
+             lambda i: ('GET', '/appointment/' + appointment_queries[i % len(appointment_queries)], None)),
+            ('POST appointment-list', 'appointment-list', 'patient', lambda i: ('POST', '/appointment/', self.new_slot())),
+            ('POST appointment-bulk', 'appointment-bulk', 'admin',
+             lambda i: ('POST', '/appointment/bulk/', [{**self.new_slot(), 'patient': data.patient.pk} for _ in range(10)])),
+            ('GET appointment-detail', 'appointment-detail', 'patient', lambda i: ('GET', f'/appointment/{appointment}', None)),
+            ('GET appointment-series-list', 'appointment-series-list', 'admin', lambda i: ('GET', '/appointment/series/', None)),
+            ('POST appointment-series-list', 'appointment-series-list', 'patient',
+             lambda i: ('POST', '/appointment/series/', self.new_series())),
+            ('GET appointment-series-detail', 'appointment-series-detail', 'admin',
+             lambda i: ('GET', f'/appointment/series/{data.series[0][0]}/', None)),
+            ('POST appointment-series-exceptions', 'appointment-series-exceptions', 'admin',
+             lambda i: ('POST', *self.exception(i))),
+            ('PATCH appointment-detail', 'appointment-detail', 'admin',
+             lambda i: ('PATCH', f'/appointment/{appointment}', self.new_slot())),
+            ('GET doctor-appointments', 'doctor-appointments', 'patient',
+             lambda i: ('GET', f'/doctor/{doctor}/appointment/', None)),
+            ('GET doctor-availability', 'doctor-availability', 'patient',
+             lambda i: ('GET', f'/doctor/{doctor}/availability/?{week}', None)),
+            ('GET availability', 'availability', 'patient', lambda i: ('GET', f'/availability/?{week}&{doctors}', None)),
+            ('GET prescription-list', 'prescription-list', 'patient', lambda i: ('GET', '/prescription/', None)),
+            ('POST prescription-list', 'prescription-list', 'doctor',
+             lambda i: ('POST', '/prescription/', {'patient': data.patient.pk, 'medical_facility': 'General', 'rx': 'Rest'})),
+            ('GET my-prescriptions', 'my-prescriptions', 'patient', lambda i: ('GET', '/my-prescriptions/', None)),
+            # Polls by a client that is already up to date.
+            ('GET my-prescriptions-sync', 'my-prescriptions-sync', 'patient',
+             lambda i: ('GET', f'/my-prescriptions/sync/?since={self.sync_token()}', None)),
+            ('GET appointment-sync', 'appointment-sync', 'patient',
+             lambda i: ('GET', f'/appointment/sync/?since={self.sync_token()}', None)),
+            ('GET export', 'export', 'admin', lambda i: ('GET', '/export/appointments.csv', None)),
+            ('GET metrics', 'metrics', 'admin', lambda i: ('GET', '/metrics/', None)),
+            # Last, from the newest seeded appointment backwards, so the
+            # routes above still find theirs. Needs --appointments >= --requests.
+            ('DELETE appointment-detail', 'appointment-detail', 'admin',
+             lambda i: ('DELETE', f'/appointment/{deletable[i % len(deletable)]}', None)),
+        ]
+
+    def requests(self, persona, make, count):
+        # Tokens are minted per route, so long runs never send expired ones,
+        # and up front, since the load generator iterates from async code.
+        headers = {'Authorization': f'Bearer {self.token(self.users()[persona])}'} if persona else {}
+        return self.build(headers, make, count)
+
+    def build(self, headers, make, count):
+        for i in range(count):
+            method, path, body = make(i)
+            if body is None:
+                yield method, path, headers, None
+            else:
+                yield method, path, {**headers, 'Content-Type': 'application/json'}, json.dumps(body).encode()
+
+
+def missing_routes(routes):
+    from app.urls import urlpatterns
+
+    return {pattern.name for pattern in urlpatterns} - {name for _, name, _, _ in routes}
+
+
+def parse_query_metrics(text):
+    totals = {}
+    for kind, route, method, value in METRIC.findall(text):
+        totals.setdefault((route, method), {})[kind] = float(value)
+    return totals
+
+
+def queries_per_request(before, after, name, method):
+    new, old = after.get((name, method), {}), before.get((name, method), {})
+    count = new.get('count', 0) - old.get('count', 0)
+    return (new.get('sum', 0) - old.get('sum', 0)) / count if count else None
+
+
+def route_report(statuses, samples, elapsed, queries):
+    errors = [status for status in statuses if not 200 <= status < 300]
+    return {
+        'requests': len(statuses),
+        'errors': len(errors),
+        'error_statuses': sorted(set(errors)),
+        'throughput_rps': len(statuses) / elapsed if elapsed else None,
+        **({key: value for key, value in summarize(samples).items() if key != 'n'} if samples else {}),
+        'queries_per_request': queries,
+    }
+
+
+def run_in_process(routes, count):
+    from django.test import Client
+    from app import metrics
+
+    client = Client(raise_request_exception=False)
+    report = {}
+    for key, name, persona, make in routes.all():
+        before = parse_query_metrics(metrics.registry.render())
+        statuses, samples = [], []
+        start = time.perf_counter()
+        for method, path, headers, body in routes.requests(persona, make, count):
+            request_start = time.perf_counter()
+            response = client.generic(method, path, body or b'', content_type='application/json', headers=headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            samples.append(time.perf_counter() - request_start)
+            statuses.append(response.status_code)
+        elapsed = time.perf_counter() - start
+        after = parse_query_metrics(metrics.registry.render())
+        report[key] = route_report(statuses, samples, elapsed, queries_per_request(before, after, name, key.split()[0]))
+    return report
+
+
+def scrape(port, token):
+    request = urllib.request.Request(
+        f'http://127.0.0.1:{port}/metrics/', headers={'Authorization': f'Bearer {token}'},
+    )
+    with urllib.request.urlopen(request) as response:
+        return parse_query_metrics(response.read().decode())
+
+
+def run_live(routes, count, server, port, concurrency, db_path):
+    from django.db import connection
+
+    connection.close()
+    command = [part.format(port=port) for part in SERVERS[server]]
+    process = subprocess.Popen(
+        command, cwd=BASE_DIR, env={**os.environ, 'GPCARE_BENCH_DB': db_path}, start_new_session=True,
+    )
+    report = {}
+    try:
+        wait_for_port('127.0.0.1', port)
+        for key, name, persona, make in routes.all():
+            admin_token = routes.token(routes.data.admin)
+            before = scrape(port, admin_token)
+            results, elapsed = run_load(
+                '127.0.0.1', port, routes.requests(persona, make, count), concurrency, float('inf'),
+            )
+            after = scrape(port, admin_token)
+            report[key] = route_report(
+                [status for status, _ in results], [seconds for _, seconds in results], elapsed,
+                queries_per_request(before, after, name, key.split()[0]),
+            )
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait()
+    return report
+
+
+def compare(report, baseline, tolerance):
+    regressions = []
+    for key, current in report['routes'].items():
+        previous = baseline['routes'].get(key)
+        if previous is None:
+            continue
+        if (current['queries_per_request'] or 0) > (previous['queries_per_request'] or 0):
+            regressions.append(f'{key}: {previous["queries_per_request"]} -> {current["queries_per_request"]} queries per request')
+        if 'p95_ms' in current and 'p95_ms' in previous and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f'{key}: p95 {previous["p95_ms"]:.2f} -> {current["p95_ms"]:.2f} ms')
+        if current['errors'] > previous['errors']:
+            regressions.append(f'{key}: {previous["errors"]} -> {current["errors"]} errors')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=200, help='Requests per route.')
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--appointments', type=int, default=2000)
+    parser.add_argument('--reviews', type=int, default=500)
+    parser.add_argument('--prescriptions', type=int, default=500)
+    parser.add_argument('--series', type=int, default=100, help='Recurring appointment series.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--live', choices=SERVERS, help='Run against uvicorn (asgi) or gunicorn (wsgi).')
+    parser.add_argument('--concurrency', type=int, default=16, help='Connections for --live.')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('-o', '--output', help='Write the report here instead of stdout.')
+    parser.add_argument('--compare', help='Earlier report to check this run against.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 slowdown for --compare.')
+    args = parser.parse_args()
+
+    db_path = setup_django()
+    import django
+    from django.db import connection
+
+    dataset = Dataset(
+        args.doctors, args.patients, args.appointments, args.reviews, args.prescriptions, args.series, args.seed,
+    )
+    start = time.perf_counter()
+    routes = Routes(dataset.seed())
+    print(f'seeded in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+    missing = missing_routes(routes.all())
+    if missing:
+        parser.error(f'no requests defined for {", ".join(sorted(missing))}')
+
+    report = {
+        'mode': f'live-{args.live}' if args.live else 'in-process',
+        'requests_per_route': args.requests,
+        'concurrency': args.concurrency if args.live else 1,
+        'dataset': dataset.config,
+        'environment': {
+            'python': platform.python_version(), 'django': django.get_version(),
+            'database': connection.vendor, 'platform': platform.platform(),
+        },
+    }
+    if args.live:
+        report['routes'] = run_live(routes, args.requests, args.live, args.port, args.concurrency, db_path)
+    else:
+        report['routes'] = run_in_process(routes, args.requests)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if (baseline['mode'], baseline['dataset']) != (report['mode'], report['dataset']):
+            print(f'warning: comparing a {report["mode"]} run with a {baseline["mode"]} run '
+                  f'or a different dataset', file=sys.stderr)
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f'regression: {line}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture
+def no_n_plus_one():
+    # For pytest-django runs: `with no_n_plus_one(): client.get(url)` fails
+    # on repeated query shapes or slow queries (see app/querywatch.py).
+    from app.querywatch import assert_no_n_plus_one
+
+    return assert_no_n_plus_one
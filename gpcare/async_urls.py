@@ -0,0 +1,15 @@
+"""
+URL configuration for requests served over ASGI.
+
+AsyncRoutingMiddleware points ASGI requests here: the native async views
+in app/async_urls.py take precedence, and every other route is the same
+as in gpcare/urls.py.
+"""
+from django.urls import path, include
+
+from . import urls
+
+urlpatterns = [
+    path('', include('app.async_urls')),
+    *urls.urlpatterns,
+]
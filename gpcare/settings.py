@@ -11,8 +11,12 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 
+import os
+from importlib.util import find_spec
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -33,10 +37,17 @@ REST_FRAMEWORK = {
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
 
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'app.authentication.ClaimsJWTAuthentication',
+
+    ),
 
-    )
+    'DEFAULT_PAGINATION_CLASS': 'app.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
+
+}
 
+SIMPLE_JWT = {
+    'TOKEN_OBTAIN_SERIALIZER': 'app.authentication.ClaimsTokenObtainPairSerializer',
 }
 
 # Application definition
@@ -54,6 +65,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.middleware.MetricsMiddleware',
+    'app.middleware.QueryWatchMiddleware',
+    'app.middleware.AsyncRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,6 +78,29 @@ MIDDLEWARE = [
 ]
 
 ROOT_URLCONF = 'gpcare.urls'
+# URLconf for ASGI requests (see app/middleware.py); set the variable to an
+# empty string to serve the sync views under ASGI as well.
+GPCARE_ASYNC_URLCONF = os.environ.get('GPCARE_ASYNC_URLCONF', 'gpcare.async_urls')
+# Per-request timings in a Server-Timing header (see app/middleware.py).
+GPCARE_SERVER_TIMING = os.environ.get('GPCARE_SERVER_TIMING', '1') == '1'
+# N+1 and slow-query detection (see app/querywatch.py): GPCARE_QUERYWATCH is
+# '' (off), 'log' or 'raise'. A query shape repeated GPCARE_QUERYWATCH_REPEAT
+# times in one request, or a query taking GPCARE_SLOW_QUERY_MS, is reported.
+GPCARE_QUERYWATCH = os.environ.get('GPCARE_QUERYWATCH', '')
+GPCARE_QUERYWATCH_REPEAT = int(os.environ.get('GPCARE_QUERYWATCH_REPEAT', 3))
+GPCARE_SLOW_QUERY_MS = float(os.environ.get('GPCARE_SLOW_QUERY_MS', 100))
+# Delta sync (see app/sync.py): a caught-up token is held GPCARE_SYNC_WINDOW
+# seconds behind, and deletions are remembered GPCARE_SYNC_RETENTION_DAYS.
+GPCARE_SYNC_WINDOW = float(os.environ.get('GPCARE_SYNC_WINDOW', 5))
+GPCARE_SYNC_RETENTION_DAYS = int(os.environ.get('GPCARE_SYNC_RETENTION_DAYS', 30))
+# Background jobs (see app/jobs.py): a claimed job is leased to its worker
+# for GPCARE_JOB_LEASE seconds; failures are retried after GPCARE_JOB_BACKOFF
+# seconds, doubling each time. Reminders go out GPCARE_REMINDER_HOURS ahead.
+GPCARE_JOB_LEASE = int(os.environ.get('GPCARE_JOB_LEASE', 300))
+GPCARE_JOB_BACKOFF = int(os.environ.get('GPCARE_JOB_BACKOFF', 30))
+GPCARE_REMINDER_HOURS = int(os.environ.get('GPCARE_REMINDER_HOURS', 24))
+EMAIL_BACKEND = os.environ.get('GPCARE_EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('GPCARE_FROM_EMAIL', 'GPCare <noreply@gpcare.local>')
 
 TEMPLATES = [
     {
@@ -87,12 +124,124 @@ WSGI_APPLICATION = 'gpcare.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# GPCARE_DB_PROFILE selects the backend: 'sqlite' (default) or 'postgres'.
+
+GPCARE_DB_PROFILE = os.environ.get('GPCARE_DB_PROFILE', 'sqlite')
+
+if GPCARE_DB_PROFILE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('GPCARE_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            # Persistent connections, so the pragmas below are paid once per
+            # worker thread rather than once per request.
+            'CONN_MAX_AGE': int(os.environ.get('GPCARE_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+elif GPCARE_DB_PROFILE == 'postgres':
+    # Needs psycopg, which is not in requirments.txt.
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'gpcare'),
+            'USER': os.environ.get('POSTGRES_USER', 'gpcare'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # Keep each worker's connection open between requests; health
+            # checks replace connections the server has dropped.
+            'CONN_MAX_AGE': int(os.environ.get('GPCARE_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            # Required behind PgBouncer in transaction pooling mode.
+            'DISABLE_SERVER_SIDE_CURSORS': bool(os.environ.get('GPCARE_PGBOUNCER')),
+        }
+    }
+else:
+    raise ImproperlyConfigured(f'Unknown GPCARE_DB_PROFILE {GPCARE_DB_PROFILE!r}.')
+
+# Applied to every new SQLite connection (see app/signals.py). busy_timeout
+# makes writers queue for the lock instead of failing with "database is
+# locked".
+GPCARE_SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.environ.get('GPCARE_SQLITE_BUSY_TIMEOUT', 30000)),
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+}
+# WAL lets readers run alongside the single writer. The mode is stored in
+# the database file, so the hook sets it once per process. In development,
+# GPCARE_SQLITE_WAL=0 leaves the committed db.sqlite3 in its rollback
+# journal mode instead of converting it.
+GPCARE_SQLITE_WAL = os.environ.get('GPCARE_SQLITE_WAL', '1') == '1'
+if GPCARE_SQLITE_WAL:
+    GPCARE_SQLITE_PRAGMAS['journal_mode'] = 'WAL'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# The local-memory cache is per process, so invalidations only reach the
+# process that made the change, and other workers keep serving their
+# cached responses for up to cache_timeout. Set GPCARE_CACHE_DIR to share a
+# file-based cache between workers on one host.
+#
+# ETag/Last-Modified are built from the cached namespace versions. With a
+# per-process cache a worker that never sees a write never changes them,
+# and would answer a client's stale copy with 304 indefinitely, so the
+# validators are only sent when the cache is shared.
+
+GPCARE_CACHE_VALIDATORS = bool(os.environ.get('GPCARE_CACHE_DIR'))
+
+if os.environ.get('GPCARE_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['GPCARE_CACHE_DIR'],
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
     }
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/5.0/topics/auth/passwords/
+# GPCARE_PASSWORD_HASHER picks the hasher for new passwords; the others stay
+# listed so existing hashes still verify and are upgraded on login.
+# GPCARE_PASSWORD_ITERATIONS sets the PBKDF2 cost (0 = Django's default).
+
+PASSWORD_HASHER_CHOICES = {
+    'pbkdf2_sha256': 'app.hashers.ConfigurablePBKDF2PasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'bcrypt_sha256': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
 }
+# The packages argon2 and bcrypt need; they are not in requirments.txt.
+PASSWORD_HASHER_PACKAGES = {'argon2': ('argon2', 'argon2-cffi'), 'bcrypt_sha256': ('bcrypt', 'bcrypt')}
+GPCARE_PASSWORD_HASHER = os.environ.get('GPCARE_PASSWORD_HASHER', 'pbkdf2_sha256')
+if GPCARE_PASSWORD_HASHER not in PASSWORD_HASHER_CHOICES:
+    raise ImproperlyConfigured(f'Unknown GPCARE_PASSWORD_HASHER {GPCARE_PASSWORD_HASHER!r}.')
+if GPCARE_PASSWORD_HASHER in PASSWORD_HASHER_PACKAGES:
+    module, package = PASSWORD_HASHER_PACKAGES[GPCARE_PASSWORD_HASHER]
+    if find_spec(module) is None:
+        raise ImproperlyConfigured(f'GPCARE_PASSWORD_HASHER={GPCARE_PASSWORD_HASHER} needs the {package} package.')
+PASSWORD_HASHERS = [PASSWORD_HASHER_CHOICES[GPCARE_PASSWORD_HASHER]] + [
+    hasher for name, hasher in PASSWORD_HASHER_CHOICES.items() if name != GPCARE_PASSWORD_HASHER
+]
+GPCARE_PASSWORD_ITERATIONS = int(os.environ.get('GPCARE_PASSWORD_ITERATIONS', 0))
+
+# Hashing runs on a bounded pool (see app/hashing.py).
+GPCARE_HASHING_POOL = os.environ.get('GPCARE_HASHING_POOL', 'thread')
+GPCARE_HASHING_WORKERS = int(os.environ.get('GPCARE_HASHING_WORKERS', os.cpu_count() or 1))
+GPCARE_HASHING_QUEUE = int(os.environ.get('GPCARE_HASHING_QUEUE', 64))
+GPCARE_HASHING_WAIT = float(os.environ.get('GPCARE_HASHING_WAIT', 10))
+
+AUTHENTICATION_BACKENDS = ['app.backends.PooledModelBackend']
 
 
 # Password validation